@@ -12,5 +12,9 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mysite.settings')
+# Under ASGI, requests run their ORM calls on threads that come and go, so
+# persistent connections pile up instead of being reused: close them after
+# every request unless DB_CONN_MAX_AGE or a pool (DB_POOL_MAX_SIZE) says otherwise
+os.environ.setdefault('DB_CONN_MAX_AGE', '0')
 
 application = get_asgi_application()
@@ -5,12 +5,29 @@ from celery.beat import crontab
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mysite.settings')
 app = Celery('mysite')
 
-# app.conf.beat_schedule = {
-#     'check_slot_time_crontab' : {
-#         'task' : 'CheckSlotTime',
-#         'schedule' : 60.0,
-#     },
-# }
+app.conf.beat_schedule = {
+    'extend_barber_schedules_nightly' : {
+        'task' : 'user.tasks.ExtendBarberSchedules',
+        'schedule' : crontab(hour=1, minute=0),
+    },
+    'reconcile_booking_rollups_nightly' : {
+        'task' : 'user.tasks.ReconcileBookingRollups',
+        'schedule' : crontab(hour=2, minute=0),
+    },
+    'reconcile_all_booking_rollups_weekly' : {
+        'task' : 'user.tasks.ReconcileBookingRollups',
+        'schedule' : crontab(hour=4, minute=0, day_of_week='sunday'),
+        'kwargs' : {'days_back': None},
+    },
+    'archive_history_nightly' : {
+        'task' : 'user.tasks.ArchiveHistory',
+        'schedule' : crontab(hour=3, minute=0),
+    },
+    'expire_slots_every_15_minutes' : {
+        'task' : 'user.tasks.ExpireSlots',
+        'schedule' : crontab(minute='*/15'),
+    },
+}
 
 app.config_from_object('django.conf:settings', namespace='CELERY')
 app.autodiscover_tasks()
@@ -17,19 +17,16 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 from drf_yasg.views import get_schema_view
-from drf_yasg import openapi
 from rest_framework import permissions
 
+from user.schema import api_info
+from user.views import OpenAPISchema
 
+
+# Serves the Swagger UI and ReDoc pages, which load the prebuilt schema from
+# OpenAPISchema (SWAGGER_SETTINGS['SPEC_URL']) rather than generating it
 schema_view = get_schema_view(
-   openapi.Info(
-      title="Barber Booking System API",
-      default_version='v1',
-      description="Test description",
-      terms_of_service="https://www.google.com/policies/terms/",
-      contact=openapi.Contact(email="contact@snippets.local"),
-      license=openapi.License(name="BSD License"),
-   ),
+   api_info,
    public=True,
    permission_classes=(permissions.AllowAny,),
 )
@@ -38,7 +35,7 @@ schema_view = get_schema_view(
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('user.urls')),
-    path('swagger<format>/', schema_view.without_ui(cache_timeout=0), name='schema-json'),
+    path('swagger<format>/', OpenAPISchema, name='schema-json'),
     path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
     path('redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
 
@@ -1,16 +1,54 @@
 from typing import Any
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import QuerySet
+from django.utils.functional import cached_property
 
 from .forms import CustomUserCreationForm, CustomUserChangeForm
 from .models import CustomUser, BarberProfile, Slots, Review, Booking
 
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Takes the row count of an unfiltered changelist from PostgreSQL's table
+    statistics (pg_class.reltuples, kept up to date by autovacuum) instead
+    of a COUNT(*) reading the whole table. Filtered changelists, small
+    tables and other databases are counted exactly.
+    """
+    exact_below = 100_000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if isinstance(queryset, QuerySet) and not queryset.query.where:
+            connection = connections[queryset.db]
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        'SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+                        [connection.ops.quote_name(queryset.model._meta.db_table)])
+                    row = cursor.fetchone()
+                # reltuples is -1 until the table is first analyzed
+                if row and row[0] >= self.exact_below:
+                    return int(row[0])
+        return super().count
+
+
+# Searches match a prefix, case-sensitively: the LIKE 'term%' that runs is
+# served by the pattern indexes PostgreSQL has on the unique email and
+# phone_number columns, where the default icontains would scan the table.
+
 class CustomUserAdmin(UserAdmin):
     model = CustomUser
     form = CustomUserChangeForm
     add_form = CustomUserCreationForm
     list_display = ('email', 'role', 'is_active')
-    list_filter = ('email', 'is_staff', 'is_active')
+    list_filter = ('role', 'is_staff', 'is_active')
+    search_fields = ('email__startswith', 'phone_number__startswith')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     fieldsets = (
         (None, {'fields' : ('email', 'password', 'phone_number',)}),
         ('Permissions', {'fields': ('is_staff', 'is_active', 'groups', 'user_permissions')}),
@@ -31,22 +69,50 @@ class CustomUserAdmin(UserAdmin):
 class BarberProfileAdmin(admin.ModelAdmin):
     model = BarberProfile
     list_display = ('user', 'is_available')
-    search_fields = ('email', 'phone_number')
-    
-    
+    list_select_related = ('user',)
+    list_filter = ('is_available',)
+    search_fields = ('user__email__startswith', 'user__phone_number__startswith')
+    autocomplete_fields = ('user',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
 class SlotsAdmin(admin.ModelAdmin):
     model = Slots
-    list_display = ('start_time', 'end_time')
-    
+    list_display = ('start_time', 'end_time', 'barber', 'state')
+    list_select_related = ('barber__user',)
+    list_filter = ('state',)
+    search_fields = ('barber__user__email__startswith',)
+    autocomplete_fields = ('barber',)
+    date_hierarchy = 'start_time'
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
 class BookingAdmin(admin.ModelAdmin):
     model = Booking
     list_display = ('slot', 'customer', 'state')
-    search_fields = ('state',)
+    list_select_related = ('slot', 'customer')
+    search_fields = ('customer__email__startswith', 'slot__barber__user__email__startswith')
     list_filter = ('state', )
+    autocomplete_fields = ('slot', 'customer')
+    date_hierarchy = 'slot__start_time'
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+class ReviewAdmin(admin.ModelAdmin):
+    model = Review
+    list_display = ('barber', 'customer', 'created_at')
+    list_select_related = ('barber__user', 'customer')
+    search_fields = ('barber__user__email__startswith', 'customer__email__startswith')
+    autocomplete_fields = ('barber', 'slot', 'customer')
+    raw_id_fields = ('archived_slot',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
 
-    
 admin.site.register(CustomUser, CustomUserAdmin)
 admin.site.register(BarberProfile, BarberProfileAdmin)
 admin.site.register(Slots, SlotsAdmin)
-admin.site.register(Review)
-admin.site.register(Booking, BookingAdmin)
\ No newline at end of file
+admin.site.register(Review, ReviewAdmin)
+admin.site.register(Booking, BookingAdmin)
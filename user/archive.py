@@ -0,0 +1,102 @@
+import datetime
+
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .cache import bump_slot_versions
+from .conf import get_setting
+from .models import ArchivedBooking, ArchivedSlot, Booking, Review, Slots
+from .utils import BookingStates, SlotStates
+
+
+FINISHED_BOOKING_STATES = [BookingStates.COMPLETED.value, BookingStates.CANCELLED.value]
+
+SLOT_FIELDS = ['id', 'barber_id', 'start_time', 'end_time', 'state', 'created_at', 'modified_at']
+BOOKING_FIELDS = ['id', 'customer_id', 'slot_id', 'state', 'reason', 'amount', 'created_at', 'modified_at']
+
+
+def archive_cutoff(retention_days=None, now=None):
+    retention_days = get_setting('ARCHIVE', 'RETENTION_DAYS') if retention_days is None else retention_days
+    return (now or timezone.now()) - datetime.timedelta(days=retention_days)
+
+
+def archivable_slots(cutoff):
+    """
+    Slots that ended before `cutoff` and are finished: expired, or holding a
+    completed or cancelled booking.
+    """
+    return Slots.objects.filter(end_time__lt=cutoff).filter(
+        Q(state=SlotStates.EXPIRED.value) | Q(bookings__state__in=FINISHED_BOOKING_STATES))
+
+
+def count_archivable(cutoff):
+    slots = archivable_slots(cutoff)
+    return {
+        'slots': slots.count(),
+        'bookings': Booking.objects.filter(slot__in=slots).count(),
+    }
+
+
+def delete_rows(model, column, values):
+    # Plain DELETE: the ORM's would load every row to send signals and
+    # collect cascades, and the dependent rows are already dealt with
+    table = connection.ops.quote_name(model._meta.db_table)
+    placeholders = ', '.join(['%s'] * len(values))
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {table} WHERE {connection.ops.quote_name(column)} IN ({placeholders})', values)
+
+
+def archive_batch(cutoff, batch_size):
+    """
+    Move one batch of archivable slots, their bookings and the slot links of
+    their reviews into the archive tables, in a single transaction.
+
+    The oldest slots are picked first with FOR UPDATE SKIP LOCKED, so
+    concurrent runs take different batches. Returns (slots, bookings) moved.
+    """
+    with transaction.atomic():
+        slots = list(
+            archivable_slots(cutoff).select_for_update(skip_locked=True, of=('self',))
+            .order_by('end_time', 'id').values(*SLOT_FIELDS)[:batch_size]
+        )
+        if not slots:
+            return 0, 0
+        slot_ids = [slot['id'] for slot in slots]
+        bookings = list(Booking.objects.select_for_update().filter(slot_id__in=slot_ids).values(*BOOKING_FIELDS))
+
+        # ignore_conflicts keeps a rerun over rows archived by hand from failing
+        ArchivedSlot.objects.bulk_create([ArchivedSlot(**slot) for slot in slots], ignore_conflicts=True)
+        ArchivedBooking.objects.bulk_create([ArchivedBooking(**booking) for booking in bookings], ignore_conflicts=True)
+        Review.objects.filter(slot_id__in=slot_ids).update(archived_slot=F('slot'), slot=None)
+
+        if bookings:
+            delete_rows(Booking, 'id', [booking['id'] for booking in bookings])
+        delete_rows(Slots, 'id', slot_ids)
+        bump_slot_versions({slot['barber_id'] for slot in slots})
+
+    return len(slots), len(bookings)
+
+
+def archive_history(retention_days=None, batch_size=None, max_batches=None, now=None):
+    """
+    Archive every finished slot older than the retention window, batch by
+    batch. Each batch commits on its own, so an interrupted run loses at
+    most one batch of work and the next run carries on from there.
+
+    Returns {'slots': ..., 'bookings': ..., 'batches': ...} moved.
+    """
+    cutoff = archive_cutoff(retention_days, now)
+    batch_size = batch_size or get_setting('ARCHIVE', 'BATCH_SIZE')
+
+    moved = {'slots': 0, 'bookings': 0, 'batches': 0}
+    while max_batches is None or moved['batches'] < max_batches:
+        slots, bookings = archive_batch(cutoff, batch_size)
+        if not slots:
+            break
+        moved['slots'] += slots
+        moved['bookings'] += bookings
+        moved['batches'] += 1
+        if slots < batch_size:
+            break
+    return moved
@@ -0,0 +1,218 @@
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth import authenticate
+from django.db import connection
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST, require_http_methods
+from rest_framework.exceptions import AuthenticationFailed, NotFound
+from rest_framework.request import Request
+
+from . import serializers
+from .authentication import CachedTokenAuthentication, issue_token
+from .cache import aget_or_build, aget_slot_version, slot_listing_key, slot_listing_timeout
+from .conditional import add_validators, list_validators, make_etag, not_modified
+from .conf import get_setting
+from .fastserializers import slot_serializer, use_fast_serializer
+from .models import BarberProfile, CustomUser, Slots
+from .pagination import KeysetPagination, SlotCursorPagination
+from .utils import filter_slots
+
+
+# Password hashing is CPU bound, so it gets a small pool of its own rather
+# than the open-ended default executor
+login_executor = ThreadPoolExecutor(
+    max_workers=get_setting('LOGIN_HASHER_THREADS'), thread_name_prefix='login-hasher')
+
+
+def authenticate_off_thread(email, password):
+    try:
+        return authenticate(email=email, password=password)
+    finally:
+        # Pool threads live outside the request cycle, so a persistent
+        # connection (CONN_MAX_AGE) would stay open and unchecked here; the
+        # reconnect is small next to the password hash
+        connection.close()
+
+
+async def authenticate_request(request):
+    """
+    Authenticate a request with the same token backend as the sync API.
+    Returns the user, or None for a missing or invalid token.
+    """
+    try:
+        credentials = await sync_to_async(CachedTokenAuthentication().authenticate)(request)
+    except AuthenticationFailed:
+        return None
+    if not credentials:
+        return None
+    # As DRF does, so middleware sees who made the request
+    request.user = credentials[0]
+    return credentials[0]
+
+
+def parse_body(request):
+    if request.content_type == 'application/json':
+        try:
+            return json.loads(request.body or b'{}')
+        except ValueError:
+            return None
+    return request.POST
+
+
+@csrf_exempt
+@require_POST
+async def LoginAsyncView(request):
+    """
+    POST /api/login/async/
+    - Purpose
+        Same as /api/login/, for ASGI deployments: the password check runs on
+        a bounded thread pool so the event loop keeps serving other requests
+        while the hash is computed.
+
+    - requires:
+        - email (string)
+        - password (string)
+
+    - Returns
+        - 200 OK: With a session token
+        - 400 Bad Request: Missing or invalid fields
+        - 401 Unauthorized: Invalid email or password
+    """
+    data = parse_body(request)
+    if data is None:
+        return JsonResponse({'Error': 'Invalid JSON body'}, status=400)
+
+    serializer = serializers.LoginUserSerializer(data=data)
+    if not serializer.is_valid():
+        return JsonResponse(serializer.errors, status=400)
+
+    loop = asyncio.get_running_loop()
+    user = await loop.run_in_executor(
+        login_executor, authenticate_off_thread,
+        serializer.validated_data['email'], serializer.validated_data['password'])
+    if not user:
+        return JsonResponse({'Message' : 'Invalid email or password'}, status=401)
+
+    key = await sync_to_async(issue_token)(user)
+    return JsonResponse({'Token' : key}, status=200)
+
+
+@csrf_exempt
+@require_http_methods(['GET', 'POST'])
+async def ProfileAsync(request):
+    """
+    GET, POST /api/profile/async/
+    - Purpose:
+        Same as /api/profile/, without holding a worker thread while the
+        profile is read.
+
+    - Returns:
+        200 OK : User profile, with ETag and Last-Modified
+        304 Not Modified : GET with If-None-Match or If-Modified-Since, the profile is unchanged
+        401 Unauthorized : Missing or invalid token
+    """
+    user = await authenticate_request(request)
+    if user is None:
+        return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+
+    profile = await CustomUser.objects.aget(pk=user.pk)
+    etag = make_etag('profile', profile.pk, profile.modified_at)
+    if response := not_modified(request, etag, profile.modified_at):
+        return response
+    serializer = serializers.UserSerializer(profile)
+    return add_validators(JsonResponse({'User Profile': serializer.data}, status=200), etag, profile.modified_at)
+
+
+@require_GET
+async def ListBarberSlotsAsync(request):
+    """
+    GET /api/barber/slots/async/
+
+    - Purpose:
+        Same as /api/barber/slots/ (same query parameters, response and
+        cache entries), with the page read through the async ORM.
+
+    - Returns:
+        200 OK : {'next': url of the next page or null, 'results': slots}, with an ETag
+        304 Not Modified : If-None-Match holds the ETag and the page is unchanged
+        400 Bad Request : Invalid filter values
+        404 Not Found : Invalid cursor
+    """
+    request = Request(request)
+    slots = Slots.objects.select_related('barber__user').filter(start_time__isnull=False)
+    try:
+        slots, barber_id = filter_slots(slots, request.query_params)
+    except ValueError as e:
+        return JsonResponse({'Error': str(e)}, status=400)
+
+    async def build_page():
+        paginator = SlotCursorPagination()
+        if use_fast_serializer(request, 'slot_listing'):
+            page = await paginator.apaginate_queryset(slot_serializer.values(slots, paginator.ordering), request)
+            return paginator.get_paginated_response(slot_serializer.serialize(page)).data
+        page = await paginator.apaginate_queryset(slots, request)
+        serializer = serializers.SlotSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data).data
+
+    version = await aget_slot_version(barber_id)
+    key = slot_listing_key(version, request)
+    etag = make_etag(key)
+    if response := not_modified(request, etag, private=False):
+        return response
+    try:
+        data = await aget_or_build(key, build_page, slot_listing_timeout())
+    except NotFound as e:
+        return JsonResponse({'detail': str(e.detail)}, status=404)
+    return add_validators(JsonResponse(data, status=200), etag, private=False)
+
+
+@require_GET
+async def ListBarbersAsync(request):
+    """
+    GET /api/barbers/async/
+
+    - Purpose:
+        List barbers ordered by id, one page at a time, for logged in users.
+
+    - Query Parameters:
+        - available - optional (bool) : 'true' or 'false' to filter on availability
+        - page_size - optional (int) : barbers per page
+        - cursor - optional (string) : the cursor from the previous page's 'next' link
+
+    - Returns:
+        200 OK : {'next': url of the next page or null, 'results': barbers}, with ETag and Last-Modified
+        304 Not Modified : If-None-Match or If-Modified-Since, no barber changed
+        400 Bad Request : Invalid filter values
+        401 Unauthorized : Missing or invalid token
+        404 Not Found : Invalid cursor
+    """
+    if await authenticate_request(request) is None:
+        return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+
+    request = Request(request)
+    barbers = BarberProfile.objects.select_related('user')
+    available = request.query_params.get('available')
+    if available in ('true', 'false'):
+        barbers = barbers.filter(is_available=available == 'true')
+    elif available:
+        return JsonResponse({'Error': "available must be 'true' or 'false'"}, status=400)
+
+    # The count and latest change of the filtered barbers and their users,
+    # with the query string for the page and its size
+    etag, last_modified = await sync_to_async(list_validators)(
+        barbers, ['modified_at', 'user__modified_at'], 'barbers', request.query_params.urlencode())
+    if response := not_modified(request, etag, last_modified):
+        return response
+
+    paginator = KeysetPagination()
+    try:
+        page = await paginator.apaginate_queryset(barbers, request)
+    except NotFound as e:
+        return JsonResponse({'detail': str(e.detail)}, status=404)
+    serializer = serializers.BarberSerializer(page, many=True)
+    return add_validators(
+        JsonResponse(paginator.get_paginated_response(serializer.data).data, status=200), etag, last_modified)
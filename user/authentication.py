@@ -0,0 +1,206 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, transaction
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+from .conf import get_setting
+
+
+TOKEN_CACHE_KEY = 'auth:token:{}'
+TOKEN_VERSION_KEY = 'auth:token:{}:version'
+
+# The user fields a cached token carries, which is what views and
+# permissions read from request.user. Anything else, the password hash
+# above all, stays out of the cache and is loaded on first access.
+CACHED_USER_FIELDS = (
+    'id', 'email', 'first_name', 'last_name', 'phone_number', 'role',
+    'is_active', 'is_staff', 'is_superuser', 'modified_at',
+)
+
+
+class LocalTokenCache:
+    """
+    Per-process LRU of token key -> cached credentials, bounded in size and
+    age. The credentials carry the version of their token they were built
+    at; the caller checks it against the shared version before use.
+    """
+
+    def __init__(self, max_size, timeout):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + self.timeout)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+local_token_cache = LocalTokenCache(
+    get_setting('AUTH_TOKEN_CACHE', 'LOCAL_MAX_SIZE'), get_setting('AUTH_TOKEN_CACHE', 'LOCAL_TIMEOUT'))
+
+
+def get_token_version(key):
+    """
+    Current version of a token's cached credentials. A version that has
+    fallen out of the cache restarts from the clock, so it never repeats a
+    value credentials were cached at.
+    """
+    version_key = TOKEN_VERSION_KEY.format(key)
+    version = cache.get(version_key)
+    if version is None:
+        cache.add(version_key, time.time_ns(), timeout=None)
+        version = cache.get(version_key)
+    return version
+
+
+def _invalidate_tokens(keys):
+    cache.delete_many([TOKEN_CACHE_KEY.format(key) for key in keys])
+    # Bumping the versions makes every process drop its own copy on next use
+    for key in keys:
+        try:
+            cache.incr(TOKEN_VERSION_KEY.format(key))
+        except ValueError:
+            cache.add(TOKEN_VERSION_KEY.format(key), time.time_ns(), timeout=None)
+
+
+def invalidate_tokens(keys):
+    """
+    Drop the cached credentials of the given tokens, in the shared cache and
+    in every process's LRU, once the current transaction commits (right
+    away outside of a transaction). Other tokens stay cached.
+    """
+    keys = list(keys)
+    if keys:
+        transaction.on_commit(lambda: _invalidate_tokens(keys))
+
+
+def invalidate_user_tokens(user_id):
+    # Imported here as DRF loads authentication classes before the app registry is ready
+    from rest_framework.authtoken.models import Token
+    invalidate_tokens(Token.objects.filter(user_id=user_id).values_list('key', flat=True))
+
+
+def dump_credentials(version, token):
+    """
+    What the cache keeps of a token and its user: the version it was read
+    at, the token's creation time and the CACHED_USER_FIELDS of the user.
+    """
+    user = {name: getattr(token.user, name) for name in CACHED_USER_FIELDS}
+    return (version, token.created, user)
+
+
+def load_credentials(model, key, credentials):
+    """
+    The (user, token) pair of cached credentials, as fresh model instances
+    whose other user fields are deferred.
+    """
+    _, created, fields = credentials
+    user_model = model._meta.get_field('user').related_model
+    names = [field.attname for field in user_model._meta.concrete_fields if field.attname in fields]
+    user = user_model.from_db(DEFAULT_DB_ALIAS, names, [fields[name] for name in names])
+    token = model.from_db(DEFAULT_DB_ALIAS, ['key', 'user_id', 'created'], [key, user.pk, created])
+    token.user = user
+    return user, token
+
+
+def issue_token(user, rotate=None):
+    """
+    Return the key of the user's login token, writing at most one row.
+
+    An existing token is returned as is, or with `rotate` (default
+    the AUTH_ROTATE_TOKEN_ON_LOGIN setting) replaced in place by a single
+    UPDATE of its key. A user without a token gets one INSERT.
+    """
+    from rest_framework.authtoken.models import Token
+
+    if rotate is None:
+        rotate = get_setting('AUTH_ROTATE_TOKEN_ON_LOGIN')
+
+    key = Token.objects.filter(user=user).values_list('key', flat=True).first()
+    if key is None:
+        try:
+            with transaction.atomic():
+                return Token.objects.create(user=user).key
+        except IntegrityError:
+            # A concurrent login of the same user created it first
+            key = Token.objects.filter(user=user).values_list('key', flat=True).get()
+
+    if not rotate:
+        return key
+
+    new_key = Token.generate_key()
+    Token.objects.filter(pk=key).update(key=new_key, created=timezone.now())
+    invalidate_tokens([key])
+    return new_key
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Drop-in replacement for DRF's TokenAuthentication that caches the token
+    lookup, so an authenticated request does not run the Token + user query.
+
+    Lookups go through a per-process LRU, then the shared Django cache with
+    a TTL, then the database. Either copy is used only while its version
+    matches the token's version in the shared cache. Logging out, rotating
+    a token and updating, deactivating or deleting a user bump the versions
+    of the affected tokens (see user.signals), and no others.
+    """
+
+    def authenticate_credentials(self, key):
+        model = self.get_model()
+        cache_key, version_key = TOKEN_CACHE_KEY.format(key), TOKEN_VERSION_KEY.format(key)
+
+        credentials = local_token_cache.get(key)
+        local = credentials is not None
+        if local:
+            version = cache.get(version_key)
+        else:
+            cached = cache.get_many([cache_key, version_key])
+            credentials, version = cached.get(cache_key), cached.get(version_key)
+        if version is None:
+            version = get_token_version(key)
+
+        if credentials is None or credentials[0] != version:
+            # The version is read before the database, so a change committed
+            # in between bumps it past the one cached here
+            try:
+                token = model.objects.select_related('user').get(key=key)
+            except model.DoesNotExist:
+                raise exceptions.AuthenticationFailed(_('Invalid token.'))
+            credentials = dump_credentials(version, token)
+            cache.set(cache_key, credentials, timeout=get_setting('AUTH_TOKEN_CACHE', 'TIMEOUT'))
+            local = False
+        if not local:
+            local_token_cache.set(key, credentials)
+
+        user, token = load_credentials(model, key, credentials)
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+
+        return (user, token)
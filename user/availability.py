@@ -0,0 +1,133 @@
+import heapq
+import threading
+from bisect import bisect_left
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from .cache import BARBER_SLOTS_VERSION_KEY, changed_barbers, get_slot_version
+from .models import BarberProfile, Slots
+from .routers import read_from_primary
+from .utils import SlotStates
+
+
+class BarberAvailability:
+    """
+    The free slots of one barber as (start_time, slot id, end_time) tuples
+    sorted by start time, with the start times alone for bisecting, and the
+    slot version they were read at.
+    """
+    __slots__ = ('version', 'starts', 'slots')
+
+    def __init__(self, version, slots):
+        self.version = version
+        self.starts = [start for start, _, _ in slots]
+        self.slots = slots
+
+
+class AvailabilityIndex:
+    """
+    Per-process index of free slots answering "the first N free slots from
+    time T on" with a bisect per barber and a merge, without a query.
+
+    Every booking, cancellation, slot generation, expiry or archival bumps
+    the slot versions in the cache (user.cache.bump_slot_versions); those
+    are the update events. While the all-slots version is unchanged nothing
+    can have changed anywhere, so a lookup costs one cache read. Otherwise
+    the barbers logged as changed by the new versions are reloaded in one
+    indexed query; when the log cannot tell (user.cache.changed_barbers),
+    every barber's version is checked instead.
+
+    Only slots starting after the load are kept, so lookups before that
+    time are answered from it.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.barbers = {}
+        self.all_version = None
+
+    def refresh(self, now, barber_ids=None):
+        """
+        Reload the given barbers if their slot version changed. Without
+        barber_ids every barber is checked and deleted ones are dropped.
+        """
+        if barber_ids is None:
+            barber_ids = BarberProfile.objects.values_list('pk', flat=True)
+            barbers = {}
+        else:
+            barbers = dict(self.barbers)
+        keys = {BARBER_SLOTS_VERSION_KEY.format(pk): pk for pk in barber_ids}
+        cached = cache.get_many(keys)
+        versions = {}
+        for key, barber_id in keys.items():
+            version = cached.get(key)
+            versions[barber_id] = get_slot_version(barber_id) if version is None else version
+
+        stale = {
+            barber_id: [] for barber_id, version in versions.items()
+            if barber_id not in self.barbers or self.barbers[barber_id].version != version
+        }
+        # The versions are read before the rows, so a change committed
+        # meanwhile bumps them again and the next lookup reloads
+        if stale:
+            rows = (
+                Slots.objects.filter(barber_id__in=list(stale), state=SlotStates.FREE.value, start_time__gte=now)
+                .order_by('barber_id', 'start_time', 'id').values_list('barber_id', 'start_time', 'id', 'end_time')
+            )
+            for barber_id, start, slot_id, end in rows:
+                stale[barber_id].append((start, slot_id, end))
+
+        for barber_id, version in versions.items():
+            if barber_id in stale:
+                barbers[barber_id] = BarberAvailability(version, stale[barber_id])
+            else:
+                barbers[barber_id] = self.barbers[barber_id]
+        # Replaced, not updated: lookups outside the lock may hold the old one
+        self.barbers = barbers
+
+    def earliest(self, after=None, limit=10, barber_ids=None):
+        """
+        The first `limit` free slots starting at or after `after` (default
+        now) of the given barbers, or of all of them, as (start_time, slot
+        id, end_time, barber id) tuples in start time order.
+        """
+        now = timezone.now()
+        after = after or now
+
+        with self.lock:
+            # Barber versions are bumped before the all-slots version, so once
+            # it is seen every barber's new version is visible too
+            all_version = get_slot_version()
+            if all_version != self.all_version:
+                changed = changed_barbers(self.all_version, all_version)
+                # From the primary, as the index is kept until the next version
+                with read_from_primary():
+                    self.refresh(now, changed)
+                self.all_version = all_version
+            barbers = self.barbers
+
+        if barber_ids is not None:
+            barbers = {pk: barbers[pk] for pk in barber_ids if pk in barbers}
+
+        # A heap of each barber's next slot, refilled from the same barber
+        heap = []
+        for barber_id, availability in barbers.items():
+            position = bisect_left(availability.starts, after)
+            if position < len(availability.starts):
+                heap.append((availability.starts[position], barber_id, position, availability.slots))
+        heapq.heapify(heap)
+
+        found = []
+        while heap and len(found) < limit:
+            start, barber_id, position, slots = heap[0]
+            _, slot_id, end = slots[position]
+            found.append((start, slot_id, end, barber_id))
+            if position + 1 < len(slots):
+                heapq.heapreplace(heap, (slots[position + 1][0], barber_id, position + 1, slots))
+            else:
+                heapq.heappop(heap)
+        return found
+
+
+availability_index = AvailabilityIndex()
@@ -0,0 +1,196 @@
+import datetime
+
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .cache import bump_slot_versions
+from .models import Slots, Booking, ArchivedBooking
+from .rollups import RollupDeltas
+from .utils import SlotStates, BookingStates
+
+
+# Per-slot results of book_slots
+BOOKED = 'booked'
+ALREADY_BOOKED = 'already_booked'
+NOT_FOUND = 'not_found'
+NOT_BOOKED = 'not_booked'
+
+
+class SlotAlreadyBooked(Exception):
+    """
+    Raised when a slot is taken by another booking.
+    """
+
+
+def claim_slot(slot_id):
+    """
+    Mark a free slot booked and return its (barber_id, start_time), or None
+    if it is not free. UPDATE ... RETURNING claims and reads the slot in one
+    statement, which both PostgreSQL and SQLite support.
+    """
+    table = connection.ops.quote_name(Slots._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'UPDATE {table} SET state = %s, modified_at = %s WHERE id = %s AND state = %s '
+            f'RETURNING barber_id, start_time',
+            [SlotStates.BOOKED.value, timezone.now(), slot_id, SlotStates.FREE.value])
+        row = cursor.fetchone()
+
+    if row is None:
+        return None
+    barber_id, start_time = row
+    # SQLite hands back the stored UTC text rather than a datetime
+    if isinstance(start_time, str):
+        start_time = parse_datetime(start_time)
+    if start_time is not None and timezone.is_naive(start_time):
+        start_time = timezone.make_aware(start_time, datetime.timezone.utc)
+    return barber_id, start_time
+
+
+def book_slot(slot_id, customer):
+    """
+    Book a slot for a customer as one atomic operation.
+
+    The slot is claimed with a conditional UPDATE on its state, which takes
+    the row lock, so of any number of concurrent attempts exactly one sees
+    the slot as free; the others wait for it to commit and then match no
+    row. The booking is inserted in the same transaction, so the hot path is
+    an UPDATE and an INSERT with no read in front of them, plus the rollup
+    counter upsert.
+
+    Raises SlotAlreadyBooked if the slot is taken and Slots.DoesNotExist if
+    there is no such slot.
+    """
+    try:
+        with transaction.atomic():
+            claimed = claim_slot(slot_id)
+            if claimed:
+                barber_id, start_time = claimed
+                # Handing over the slot's known barber saves the cache signal a lookup
+                slot = Slots(pk=slot_id, barber_id=barber_id, start_time=start_time)
+                booking = Booking.objects.create(slot=slot, customer=customer)
+
+                rollups = RollupDeltas()
+                rollups.add(barber_id, start_time, booking.state)
+                rollups.apply()
+                return booking
+    except IntegrityError:
+        # The slot was marked free while a booking row still holds it
+        raise SlotAlreadyBooked()
+
+    # Only a failed claim pays for telling a taken slot from a missing one
+    if Slots.objects.filter(pk=slot_id).exists():
+        raise SlotAlreadyBooked()
+    raise Slots.DoesNotExist()
+
+
+def book_slots(slot_ids, customer, all_or_nothing=True):
+    """
+    Book several slots for a customer in one transaction.
+
+    All requested slots are locked and validated with a single
+    SELECT ... FOR UPDATE, taken in id order so overlapping batches cannot
+    deadlock, and the bookings are written with one UPDATE and one
+    bulk_create. With `all_or_nothing` a single unavailable slot leaves
+    every slot untouched; otherwise the free ones are booked and the rest
+    are reported.
+
+    Returns a dict mapping each slot id to BOOKED, ALREADY_BOOKED,
+    NOT_FOUND or, when an all-or-nothing batch fails, NOT_BOOKED.
+    """
+    slot_ids = sorted(set(slot_ids))
+
+    try:
+        with transaction.atomic():
+            slots = {
+                slot['pk']: slot
+                for slot in Slots.objects.select_for_update().filter(pk__in=slot_ids).order_by('pk')
+                .values('pk', 'state', 'barber_id', 'start_time')
+            }
+
+            results = {}
+            for slot_id in slot_ids:
+                if slot_id not in slots:
+                    results[slot_id] = NOT_FOUND
+                elif slots[slot_id]['state'] != SlotStates.FREE.value:
+                    results[slot_id] = ALREADY_BOOKED
+                else:
+                    results[slot_id] = BOOKED
+
+            free_ids = [slot_id for slot_id, result in results.items() if result == BOOKED]
+            if all_or_nothing and len(free_ids) != len(slot_ids):
+                return {slot_id: NOT_BOOKED if result == BOOKED else result for slot_id, result in results.items()}
+
+            if free_ids:
+                Slots.objects.filter(pk__in=free_ids).update(state=SlotStates.BOOKED.value, modified_at=timezone.now())
+                Booking.objects.bulk_create([Booking(slot_id=slot_id, customer=customer) for slot_id in free_ids])
+
+                rollups = RollupDeltas()
+                for slot_id in free_ids:
+                    rollups.add(slots[slot_id]['barber_id'], slots[slot_id]['start_time'], BookingStates.ONGOING.value)
+                rollups.apply()
+                bump_slot_versions(slots[slot_id]['barber_id'] for slot_id in free_ids)
+            return results
+    except IntegrityError:
+        # One of the slots was marked free while a booking row still holds it
+        raise SlotAlreadyBooked()
+
+
+def save_booking_state(serializer, slot):
+    """
+    Save a booking serializer that changes the booking's state or amount and
+    move its rollup counts from the old values to the new ones, atomically.
+
+    The old values are read again under a row lock rather than taken from
+    the instance the request loaded: a concurrent change of the same
+    booking, such as a cancel racing a completion, then commits first and
+    this one moves the counts on from where it left them, instead of both
+    moving them from the same state.
+    """
+    with transaction.atomic():
+        old_state, old_amount = (
+            Booking.objects.select_for_update().values_list('state', 'amount').get(pk=serializer.instance.pk))
+        serializer.instance.slot = slot
+        booking = serializer.save()
+        rollups = RollupDeltas()
+        rollups.move(slot.barber_id, slot.start_time, old_state, old_amount, booking.state, booking.amount)
+        rollups.apply()
+    return booking
+
+
+def delete_booking(booking, slot):
+    """
+    Delete a booking, free its slot and take it off the rollups, with the
+    state and amount it has under a row lock, as in save_booking_state.
+    """
+    with transaction.atomic():
+        state, amount = Booking.objects.select_for_update().values_list('state', 'amount').get(pk=booking.pk)
+        booking.slot = slot
+        booking.delete()
+        Slots.objects.filter(pk=slot.pk).update(state=SlotStates.FREE.value, modified_at=timezone.now())
+
+        rollups = RollupDeltas()
+        rollups.remove(slot.barber_id, slot.start_time, state, amount)
+        rollups.apply()
+
+
+def delete_customer(user):
+    """
+    Delete a user together with their bookings. The bookings would cascade
+    anyway; releasing them first keeps slot availability and rollups right.
+    """
+    with transaction.atomic():
+        bookings = list(Booking.objects.filter(customer=user).values_list(
+            'slot__barber_id', 'slot__start_time', 'state', 'amount'))
+        bookings += ArchivedBooking.objects.filter(customer=user).values_list(
+            'slot__barber_id', 'slot__start_time', 'state', 'amount')
+
+        rollups = RollupDeltas()
+        for barber_id, start_time, state, amount in bookings:
+            rollups.remove(barber_id, start_time, state, amount)
+        rollups.apply()
+        bump_slot_versions(barber_id for barber_id, _, _, _ in bookings)
+
+        Slots.objects.filter(bookings__customer=user).update(state=SlotStates.FREE.value, modified_at=timezone.now())
+        user.delete()
@@ -0,0 +1,176 @@
+import asyncio
+import hashlib
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .conf import get_setting
+from .routers import read_from_primary
+
+
+ALL_SLOTS_VERSION_KEY = 'slots:version'
+BARBER_SLOTS_VERSION_KEY = 'slots:version:barber:{}'
+# The barbers changed by each all-slots version, so readers can reload
+# just those. Further apart than SLOT_CHANGES_MAX versions, reloading all
+# barbers is as cheap as reading the log.
+SLOT_CHANGES_KEY = 'slots:changes:{}'
+SLOT_CHANGES_TIMEOUT = 24 * 60 * 60
+SLOT_CHANGES_MAX = 100
+
+# How long a rebuilding worker may hold a key's lock, and how long others wait for it
+REBUILD_LOCK_TIMEOUT = 10
+REBUILD_WAIT = 2.0
+REBUILD_POLL_INTERVAL = 0.05
+
+_missing = object()
+
+
+def slot_listing_timeout():
+    return get_setting('SLOT_LISTING_CACHE_TIMEOUT')
+
+
+def get_slot_version(barber_id=None):
+    """
+    Current version of one barber's slots, or of all slots when barber_id is
+    None. A version that has fallen out of the cache restarts from the clock,
+    so it never repeats a value an old entry was stored under.
+    """
+    key = ALL_SLOTS_VERSION_KEY if barber_id is None else BARBER_SLOTS_VERSION_KEY.format(barber_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+async def aget_slot_version(barber_id=None):
+    key = ALL_SLOTS_VERSION_KEY if barber_id is None else BARBER_SLOTS_VERSION_KEY.format(barber_id)
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, time.time_ns(), timeout=None)
+        version = await cache.aget(key)
+    return version
+
+
+def _bump_version(key):
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.add(key, time.time_ns(), timeout=None)
+        return None
+
+
+def _bump_versions(barber_ids):
+    # The all-slots version goes last: a reader that sees it changed can
+    # rely on the barbers' versions having changed already
+    for pk in barber_ids:
+        _bump_version(BARBER_SLOTS_VERSION_KEY.format(pk))
+    version = _bump_version(ALL_SLOTS_VERSION_KEY)
+    # A restarted version is too far from any reader's to be looked up
+    if version is not None:
+        cache.set(SLOT_CHANGES_KEY.format(version), sorted(barber_ids), timeout=SLOT_CHANGES_TIMEOUT)
+
+
+def bump_slot_versions(barber_ids):
+    """
+    Invalidate cached slot reads of the given barbers, and the listings of
+    all slots, once the current transaction commits. Bumping earlier would
+    let a reader cache pre-commit data under the new version.
+
+    The versions live in the default cache, so it has to be shared by every
+    web and Celery process (see check user.W001): a bump in a process-local
+    cache never reaches the processes serving the listings.
+    """
+    barber_ids = {pk for pk in barber_ids if pk is not None}
+    transaction.on_commit(lambda: _bump_versions(barber_ids))
+
+
+def changed_barbers(since, until):
+    """
+    The barbers whose slots changed after all-slots version `since` up to
+    `until`, or None when that is not known: the versions are too far
+    apart, the version restarted, or part of the log has not been written
+    yet or has expired.
+    """
+    if since is None or not 0 < until - since <= SLOT_CHANGES_MAX:
+        return None
+    keys = [SLOT_CHANGES_KEY.format(version) for version in range(since + 1, until + 1)]
+    logged = cache.get_many(keys)
+    if len(logged) < len(keys):
+        return None
+    return set().union(*logged.values())
+
+
+def slot_listing_key(version, request):
+    """
+    Cache key of a slot listing response for a version and the request's URL.
+    Host and path are part of it because the response holds absolute 'next'
+    links, which differ between the sync and async endpoints.
+    """
+    query = '&'.join(sorted(f'{name}={value}' for name, value in request.query_params.items()))
+    digest = hashlib.md5(f'{request.get_host()}{request.path}?{query}'.encode()).hexdigest()
+    return f'slots:listing:{version}:{digest}'
+
+
+def get_or_build(key, build, timeout):
+    """
+    Return the cached value of `key`, building and caching it on a miss.
+
+    Only one worker rebuilds a missing key at a time: it takes a lock with
+    cache.add, which is atomic in every Django backend including
+    local-memory. Other workers poll for the rebuilt value for a short while
+    and only build it themselves if it does not show up in time.
+
+    The cached value is built from the primary database: built from a
+    lagging replica, it could hold data older than its key's version.
+    """
+    value = cache.get(key, _missing)
+    if value is not _missing:
+        return value
+
+    lock_key = f'{key}:lock'
+    if cache.add(lock_key, 1, timeout=REBUILD_LOCK_TIMEOUT):
+        try:
+            with read_from_primary():
+                value = build()
+            cache.set(key, value, timeout=timeout)
+            return value
+        finally:
+            cache.delete(lock_key)
+
+    deadline = time.monotonic() + REBUILD_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(REBUILD_POLL_INTERVAL)
+        value = cache.get(key, _missing)
+        if value is not _missing:
+            return value
+    return build()
+
+
+async def aget_or_build(key, build, timeout):
+    """
+    get_or_build for async views, where `build` is a coroutine function.
+    Waiting for another worker's rebuild sleeps on the event loop.
+    """
+    value = await cache.aget(key, _missing)
+    if value is not _missing:
+        return value
+
+    lock_key = f'{key}:lock'
+    if await cache.aadd(lock_key, 1, timeout=REBUILD_LOCK_TIMEOUT):
+        try:
+            with read_from_primary():
+                value = await build()
+            await cache.aset(key, value, timeout=timeout)
+            return value
+        finally:
+            await cache.adelete(lock_key)
+
+    deadline = time.monotonic() + REBUILD_WAIT
+    while time.monotonic() < deadline:
+        await asyncio.sleep(REBUILD_POLL_INTERVAL)
+        value = await cache.aget(key, _missing)
+        if value is not _missing:
+            return value
+    return await build()
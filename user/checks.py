@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+
+# Cache backends whose entries only the process that wrote them can see
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """
+    Token revocations, slot version bumps and the read-your-writes markers
+    of the replica router go through the default cache. With a process-local
+    backend, a logout or a booking handled by one worker goes unseen by the
+    others and by the Celery worker's bumps, so the default cache has to be
+    shared once the site runs more than one process.
+    """
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    if backend not in PROCESS_LOCAL_CACHES:
+        return []
+    return [Warning(
+        f'The default cache ({backend}) is local to each process.',
+        hint=(
+            'Revoked tokens stay valid and cached slot listings stay stale in other workers until '
+            'they expire. Set CACHE_BACKEND and CACHE_LOCATION to a shared cache such as Redis.'
+        ),
+        id='user.W001',
+    )]
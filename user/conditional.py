@@ -0,0 +1,54 @@
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+
+def make_etag(*parts):
+    return '"{}"'.format(hashlib.md5('|'.join(map(str, parts)).encode()).hexdigest())
+
+
+def latest(*datetimes):
+    return max((value for value in datetimes if value is not None), default=None)
+
+
+def list_validators(queryset, modified_fields, *parts):
+    """
+    ETag and Last-Modified of a list from one aggregate query: its row
+    count and the latest of its `modified_fields`, such as 'modified_at' and
+    'user__modified_at' for related rows. A row added, changed or
+    deleted changes one of them. `parts` go into the ETag as well, for
+    whatever else shapes the response, such as the query string.
+    """
+    aggregates = queryset.order_by().aggregate(
+        rows=Count('pk'), **{f'latest_{index}': Max(field) for index, field in enumerate(modified_fields)})
+    modified = [aggregates[f'latest_{index}'] for index in range(len(modified_fields))]
+    return make_etag(aggregates['rows'], *modified, *parts), latest(*modified)
+
+
+def not_modified(request, etag=None, last_modified=None, private=True):
+    """
+    The 304 response to a GET or HEAD whose If-None-Match (or, without it,
+    If-Modified-Since) still matches the validators, or None.
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return None
+    response = get_conditional_response(
+        request, etag=etag, last_modified=int(last_modified.timestamp()) if last_modified else None)
+    if response is not None:
+        add_validators(response, etag, last_modified, private)
+    return response
+
+
+def add_validators(response, etag=None, last_modified=None, private=True):
+    """
+    Send the validators with a response, asking clients to revalidate it
+    before every reuse. Private responses are kept out of shared caches.
+    """
+    if etag:
+        response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    patch_cache_control(response, no_cache=True, **({'private': True} if private else {'public': True}))
+    return response
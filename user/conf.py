@@ -0,0 +1,110 @@
+from django.conf import settings
+
+
+# Defaults of the app's settings. For a dict setting a deployment sets a dict
+# of the same name in its settings with only the keys it changes; get_setting()
+# falls back to these for the rest, and for the plain settings it does not set,
+# so the values here are the only copy.
+DEFAULTS = {
+    # Token lookup cache of user.authentication.CachedTokenAuthentication: seconds in
+    # the shared cache, and size and seconds of the per-process LRU in front of it
+    'AUTH_TOKEN_CACHE': {
+        'TIMEOUT': 300,
+        'LOCAL_MAX_SIZE': 10000,
+        'LOCAL_TIMEOUT': 30,
+    },
+    # Working hours and horizon used when generating barber slots, see
+    # user/schedule.py. Hours are in TIME_ZONE.
+    'BARBER_SCHEDULE': {
+        'OPENING_HOUR': 9,
+        'CLOSING_HOUR': 21,
+        'SLOT_MINUTES': 60,
+        'HORIZON_DAYS': 14,
+        'BATCH_SIZE': 1000,
+    },
+    # user.tasks.ExpireSlots: rows per UPDATE, and how long after its slot ends an
+    # ongoing booking is moved to STALE_BOOKING_STATE (a BookingStates value)
+    'SLOT_EXPIRY': {
+        'CHUNK_SIZE': 1000,
+        'BOOKING_GRACE_HOURS': 24,
+        'STALE_BOOKING_STATE': 'Completed',
+    },
+    # user.tasks.ArchiveHistory: days of finished slots and bookings kept in the hot
+    # tables before they move to the archive tables, and slots moved per transaction
+    'ARCHIVE': {
+        'RETENTION_DAYS': 180,
+        'BATCH_SIZE': 1000,
+    },
+    # user.reviews: reviews kept on BarberProfile.latest_reviews, and the PostgreSQL
+    # text search configuration of the review search index. Changing the
+    # configuration needs the review_search_idx index dropped to be rebuilt.
+    'REVIEWS': {
+        'LATEST_COUNT': 5,
+        'SEARCH_CONFIG': 'english',
+    },
+    # user.imports: rows validated and written per transaction, and failed rows
+    # listed in an import report
+    'IMPORT': {
+        'BATCH_SIZE': 5000,
+        'MAX_REPORTED_ERRORS': 1000,
+    },
+    # user.views.OpenAPISchema: the schema file written by manage.py build_schema
+    # (None for openapi.json in BASE_DIR), and seconds clients may reuse it
+    # before revalidating with its ETag
+    'OPENAPI_SCHEMA': {
+        'PATH': None,
+        'MAX_AGE': 300,
+    },
+    # user.routers.ReplicaRouter: aliases the reads of safe requests go to, and
+    # seconds a client keeps reading from the primary after it wrote
+    'DATABASE_ROUTING': {
+        'REPLICAS': [],
+        'STICKY_SECONDS': 10,
+    },
+    # user.middleware.SQLInstrumentationMiddleware: share of requests instrumented
+    # (requests with the FORCE_HEADER header always are), budgets over which a
+    # request is logged to the 'user.sql' logger, and how many of the slowest
+    # statements to keep
+    'SQL_INSTRUMENTATION': {
+        'SAMPLE_RATE': 0.05,
+        'QUERY_BUDGET': 50,
+        'TIME_BUDGET_MS': 500,
+        'SLOWEST': 3,
+        'FORCE_HEADER': 'X-SQL-Instrument',
+    },
+    # user.middleware.RequestProfilingMiddleware: staff profile one request by
+    # sending the header or query parameter with 'tree', 'collapsed' or 'save'
+    # (to DIRECTORY, None for profiles/ in BASE_DIR)
+    'REQUEST_PROFILING': {
+        'HEADER': 'X-Profile',
+        'QUERY_PARAM': '_profile',
+        'DIRECTORY': None,
+        'MIN_FRACTION': 0.01,
+    },
+    # Seconds a slot listing page stays cached; changes invalidate it sooner through
+    # versioning (user.cache)
+    'SLOT_LISTING_CACHE_TIMEOUT': 300,
+    # Endpoints that render rows with user.fastserializers instead of the DRF
+    # serializers: 'slot_listing', 'booking_reports', 'booking_search'. A request can
+    # still pick either with ?serializer=fast or ?serializer=drf.
+    'FAST_SERIALIZER_ENDPOINTS': [],
+    # PBKDF2 work factor of user.hashers.ConfigurablePBKDF2PasswordHasher, None for
+    # Django's default. A changed value is applied to each user's stored hash at
+    # their next login.
+    'PASSWORD_HASHER_ITERATIONS': None,
+    # Threads the async login endpoint hashes passwords on, and whether logging in
+    # replaces the user's existing token with a new one
+    'LOGIN_HASHER_THREADS': 4,
+    'AUTH_ROTATE_TOKEN_ON_LOGIN': False,
+}
+
+
+def get_setting(group, name=None):
+    """
+    Read option `name` of the dict setting `group`, such as
+    get_setting('BARBER_SCHEDULE', 'HORIZON_DAYS'), or the plain setting
+    `group` when no name is given, falling back to its default.
+    """
+    if name is None:
+        return getattr(settings, group, DEFAULTS[group])
+    return getattr(settings, group, {}).get(name, DEFAULTS[group][name])
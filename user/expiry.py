@@ -0,0 +1,86 @@
+import datetime
+
+from django.db import transaction
+from django.utils import timezone
+
+from .cache import bump_slot_versions
+from .conf import get_setting
+from .models import Booking, Slots
+from .rollups import RollupDeltas
+from .utils import BookingStates, SlotStates
+
+
+def expire_slots(now=None, chunk_size=None):
+    """
+    Mark free slots that ended before `now` as expired, `chunk_size` rows per
+    transaction so no lock is held for long.
+
+    Each chunk is picked in end_time order through the (state, end_time)
+    index with FOR UPDATE SKIP LOCKED, so several workers can run this at
+    once without waiting on or double-counting each other's rows. A slot
+    booked meanwhile no longer matches the state condition of the UPDATE.
+
+    Returns the number of slots expired.
+    """
+    now = now or timezone.now()
+    chunk_size = chunk_size or get_setting('SLOT_EXPIRY', 'CHUNK_SIZE')
+
+    expired = 0
+    while True:
+        with transaction.atomic():
+            rows = list(
+                Slots.objects.select_for_update(skip_locked=True)
+                .filter(state=SlotStates.FREE.value, end_time__lt=now)
+                .order_by('end_time')
+                .values_list('pk', 'barber_id')[:chunk_size]
+            )
+            if not rows:
+                return expired
+            expired += Slots.objects.filter(
+                pk__in=[pk for pk, _ in rows], state=SlotStates.FREE.value,
+            ).update(state=SlotStates.EXPIRED.value, modified_at=timezone.now())
+            bump_slot_versions({barber_id for _, barber_id in rows})
+
+        if len(rows) < chunk_size:
+            return expired
+
+
+def resolve_stale_bookings(now=None, grace=None, chunk_size=None):
+    """
+    Move ongoing bookings whose slot ended more than `grace` (default
+    SLOT_EXPIRY['BOOKING_GRACE_HOURS']) before `now` to the
+    STALE_BOOKING_STATE state, updating the daily rollups in the same
+    transaction. Chunked and safe to run concurrently like expire_slots.
+
+    Returns the number of bookings resolved.
+    """
+    now = now or timezone.now()
+    if grace is None:
+        grace = datetime.timedelta(hours=get_setting('SLOT_EXPIRY', 'BOOKING_GRACE_HOURS'))
+    chunk_size = chunk_size or get_setting('SLOT_EXPIRY', 'CHUNK_SIZE')
+    new_state = get_setting('SLOT_EXPIRY', 'STALE_BOOKING_STATE')
+    cutoff = now - grace
+
+    resolved = 0
+    while True:
+        with transaction.atomic():
+            rows = list(
+                Booking.objects.select_for_update(skip_locked=True, of=('self',))
+                .filter(state=BookingStates.ONGOING.value, slot__end_time__lt=cutoff)
+                .order_by('slot__end_time')
+                .values_list('pk', 'slot__barber_id', 'slot__start_time', 'amount')[:chunk_size]
+            )
+            if not rows:
+                return resolved
+            resolved += Booking.objects.filter(
+                pk__in=[row[0] for row in rows], state=BookingStates.ONGOING.value,
+            ).update(state=new_state, modified_at=timezone.now())
+
+            rollups = RollupDeltas()
+            for _, barber_id, start_time, amount in rows:
+                rollups.move(barber_id, start_time, BookingStates.ONGOING.value, amount, new_state, amount)
+            rollups.apply()
+            bump_slot_versions({row[1] for row in rows})
+
+        if len(rows) < chunk_size:
+            return resolved
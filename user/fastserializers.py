@@ -0,0 +1,153 @@
+"""
+Read-only serialization straight from values_list() rows.
+
+The DRF serializers build a model instance and walk a tree of field objects
+for every row, which dominates the time of large list responses. The
+serializers here describe the same JSON shape as a flat list of lookups;
+each one is compiled once into a plain function that builds the nested
+dicts from a row tuple by index.
+
+Output must stay identical to the DRF serializer it mirrors; the parity
+tests in user.tests check that byte for byte.
+"""
+from django.utils import timezone
+
+from .conf import get_setting
+from .models import Booking, Slots
+
+
+FAST_SERIALIZER_PARAM = 'serializer'
+
+
+class DateTime:
+    """
+    A datetime lookup rendered like DRF's DateTimeField with the default
+    ISO 8601 format: in the current time zone, with 'Z' for UTC.
+    """
+
+    def __init__(self, lookup):
+        self.lookup = lookup
+
+
+class Nested:
+    """
+    A related object rendered as a nested dict of `fields`, looked up
+    through `relation`, which must not be nullable.
+    """
+
+    def __init__(self, relation, fields):
+        self.relation = relation
+        self.fields = fields
+
+
+def make_datetime_converter(tz):
+    def convert(value):
+        if not value:
+            return None
+        if timezone.is_aware(value):
+            value = value.astimezone(tz)
+        value = value.isoformat()
+        if value.endswith('+00:00'):
+            value = value[:-6] + 'Z'
+        return value
+    return convert
+
+
+class FastSerializer:
+    """
+    Compiles `fields`, a sequence of (output name, lookup | DateTime | Nested)
+    pairs, into a function building one dict per values_list() row.
+    Plain lookups are emitted as read from the database, which is what the
+    DRF Char/Integer/Email fields return for str and int columns.
+    """
+
+    def __init__(self, model, fields):
+        self.model = model
+        self.lookups = []
+        source = self.compile_fields(fields, '')
+        code = f'def make_builder(convert_datetime):\n    return lambda row: {source}\n'
+        namespace = {}
+        exec(compile(code, f'<fast serializer of {model.__name__}>', 'exec'), namespace)
+        self.make_builder = namespace['make_builder']
+
+    def compile_fields(self, fields, prefix):
+        items = []
+        for name, spec in fields:
+            if isinstance(spec, Nested):
+                value = self.compile_fields(spec.fields, f'{prefix}{spec.relation}__')
+            elif isinstance(spec, DateTime):
+                value = f'convert_datetime(row[{self.add_lookup(prefix + spec.lookup)}])'
+            else:
+                value = f'row[{self.add_lookup(prefix + spec)}]'
+            items.append(f'{name!r}: {value}')
+        return '{' + ', '.join(items) + '}'
+
+    def add_lookup(self, lookup):
+        if lookup not in self.lookups:
+            self.lookups.append(lookup)
+        return self.lookups.index(lookup)
+
+    def values(self, queryset, extra=()):
+        """
+        The rows to serialize from `queryset`. Lookups in `extra` (such as a
+        pagination ordering) are fetched too; rows are named tuples so
+        keyset pagination can read them.
+        """
+        lookups = self.lookups + [lookup for lookup in extra if lookup not in self.lookups]
+        return queryset.values_list(*lookups, named=True)
+
+    def serialize(self, rows):
+        build = self.make_builder(make_datetime_converter(timezone.get_current_timezone()))
+        return [build(row) for row in rows]
+
+
+def use_fast_serializer(request, endpoint):
+    """
+    Whether an endpoint renders its rows with the fast serializers: the
+    `serializer` parameter ('fast' or 'drf') decides when given, otherwise
+    the FAST_SERIALIZER_ENDPOINTS setting.
+    """
+    choice = request.query_params.get(FAST_SERIALIZER_PARAM)
+    if choice is None and hasattr(request, 'data'):
+        choice = request.data.get(FAST_SERIALIZER_PARAM)
+    if choice in ('fast', 'drf'):
+        return choice == 'fast'
+    return endpoint in get_setting('FAST_SERIALIZER_ENDPOINTS')
+
+
+# Mirrors serializers.SlotSerializer
+SLOT_FIELDS = (
+    ('id', 'id'),
+    ('barber', Nested('barber', (
+        ('id', 'id'),
+        ('email', 'user__email'),
+        ('phone_number', 'user__phone_number'),
+    ))),
+    ('start_time', DateTime('start_time')),
+    ('end_time', DateTime('end_time')),
+)
+
+slot_serializer = FastSerializer(Slots, SLOT_FIELDS)
+
+# Mirrors serializers.BookingSerializer. Its `barber` field has no matching
+# Booking attribute, so DRF leaves it out and so does this.
+BOOKING_FIELDS = (
+    ('reason', 'reason'),
+    ('slot', Nested('slot', SLOT_FIELDS)),
+    ('amount', 'amount'),
+)
+
+booking_serializer = FastSerializer(Booking, BOOKING_FIELDS)
+
+# Mirrors serializers.BookingSearchSerializer
+booking_search_serializer = FastSerializer(Booking, (
+    ('id', 'id'),
+    ('state', 'state'),
+    ('customer', Nested('customer', (
+        ('id', 'id'),
+        ('first_name', 'first_name'),
+        ('last_name', 'last_name'),
+        ('email', 'email'),
+        ('phone_number', 'phone_number'),
+    ))),
+) + BOOKING_FIELDS)
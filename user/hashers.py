@@ -0,0 +1,18 @@
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+
+from .conf import get_setting
+
+
+class ConfigurablePBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """
+    PBKDF2-SHA256 with the work factor taken from the PASSWORD_HASHER_ITERATIONS setting.
+
+    It keeps the 'pbkdf2_sha256' algorithm name, so existing hashes stay
+    valid. When the setting changes, Django's must_update() sees the stored
+    iteration count differ and check_password() rehashes the password at the
+    next successful login.
+    """
+
+    @property
+    def iterations(self):
+        return get_setting('PASSWORD_HASHER_ITERATIONS') or PBKDF2PasswordHasher.iterations
@@ -0,0 +1,427 @@
+import csv
+import datetime
+import io
+import json
+
+from django.contrib.auth.base_user import BaseUserManager
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+
+from .cache import bump_slot_versions
+from .conf import get_setting
+from .models import BarberProfile, CustomUser, Slots
+from .utils import RolesChoices, SlotStates, parse_datetime_param
+
+
+IMPORT_FORMATS = ('csv', 'ndjson')
+
+TRUE_VALUES = {'1', 'true', 'yes', 'y'}
+FALSE_VALUES = {'', '0', 'false', 'no', 'n'}
+
+
+class RowError(Exception):
+    pass
+
+
+class ImportReport:
+    """
+    Counts of created, skipped (already existing) and failed rows, with the
+    errors of the first MAX_REPORTED_ERRORS failed rows, and the error that
+    stopped the import early, if any.
+    """
+
+    def __init__(self):
+        self.created = 0
+        self.skipped = 0
+        self.failed = 0
+        self.errors = []
+        self.error = None
+        self.max_errors = get_setting('IMPORT', 'MAX_REPORTED_ERRORS')
+
+    def fail(self, number, message):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'row': number, 'error': str(message)})
+
+    def as_dict(self):
+        errors = sorted(self.errors, key=lambda error: error['row'])
+        return {
+            'created': self.created, 'skipped': self.skipped, 'failed': self.failed, 'errors': errors,
+            'error': self.error,
+        }
+
+
+def import_format_of(name):
+    """
+    The import format matching a file name's extension, or None.
+    """
+    extension = name.rsplit('.', 1)[-1].lower()
+    return {'csv': 'csv', 'ndjson': 'ndjson', 'jsonl': 'ndjson'}.get(extension)
+
+
+def read_rows(stream, import_format):
+    """
+    Yield (row number, dict or RowError) for every record of a text stream,
+    one at a time. CSV needs a header line; rows are numbered from 1 after it.
+    """
+    if import_format == 'csv':
+        for number, row in enumerate(csv.DictReader(stream), start=1):
+            if None in row:
+                yield number, RowError('More values than columns')
+            else:
+                yield number, {key: value.strip() if isinstance(value, str) else value for key, value in row.items()}
+        return
+
+    for number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield number, RowError(f'Invalid JSON: {e}')
+            continue
+        if not isinstance(row, dict):
+            yield number, RowError('Expected a JSON object')
+        else:
+            yield number, {key: value.strip() if isinstance(value, str) else value for key, value in row.items()}
+
+
+def decoded_rows(rows, report):
+    """
+    The rows of read_rows until the stream turns out not to be valid text,
+    which is recorded on the report and ends them, so the rows read so far
+    are still imported.
+    """
+    number = 0
+    try:
+        for number, row in rows:
+            yield number, row
+    except UnicodeDecodeError:
+        report.error = f'The file must be UTF-8 encoded, it could not be read after row {number}'
+
+
+def batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def text_value(row, name, max_length, required=False):
+    value = row.get(name)
+    value = '' if value is None else str(value)
+    if required and not value:
+        raise RowError(f'{name} is required')
+    if len(value) > max_length:
+        raise RowError(f'{name} is longer than {max_length} characters')
+    return value
+
+
+def bool_value(row, name):
+    value = row.get(name)
+    if isinstance(value, bool):
+        return value
+    value = '' if value is None else str(value).lower()
+    if value in TRUE_VALUES:
+        return True
+    if value in FALSE_VALUES:
+        return False
+    raise RowError(f'{name} must be true or false')
+
+
+def datetime_value(row, name):
+    value = row.get(name)
+    if not value:
+        return None
+    try:
+        return parse_datetime_param(str(value))
+    except ValueError as e:
+        raise RowError(str(e))
+
+
+class BarberImporter:
+    """
+    Creates a CustomUser with the barber role and an unusable password, and
+    its BarberProfile, per row: email, first_name, last_name, phone_number,
+    is_available. Emails that already exist are skipped. On PostgreSQL rows
+    are loaded with COPY.
+    """
+
+    def __init__(self, report):
+        self.report = report
+        self.seen_emails = set()
+        self.seen_phones = set()
+
+    def validate(self, row):
+        email = BaseUserManager.normalize_email(text_value(row, 'email', 100, required=True))
+        try:
+            validate_email(email)
+        except ValidationError:
+            raise RowError(f'Invalid email: {email}')
+        return {
+            'email': email,
+            'first_name': text_value(row, 'first_name', 150),
+            'last_name': text_value(row, 'last_name', 150),
+            'phone_number': text_value(row, 'phone_number', 20) or None,
+            'is_available': bool_value(row, 'is_available'),
+        }
+
+    def import_batch(self, batch):
+        valid = []
+        for number, row in batch:
+            try:
+                if isinstance(row, RowError):
+                    raise row
+                valid.append((number, self.validate(row)))
+            except RowError as e:
+                self.report.fail(number, e)
+
+        existing_emails = set(CustomUser.objects.filter(
+            email__in=[values['email'] for _, values in valid]).values_list('email', flat=True))
+        existing_phones = set(CustomUser.objects.filter(
+            phone_number__in=[values['phone_number'] for _, values in valid if values['phone_number']],
+        ).values_list('phone_number', flat=True))
+
+        new = []
+        for number, values in valid:
+            email, phone = values['email'], values['phone_number']
+            if email in existing_emails:
+                self.report.skipped += 1
+            elif email in self.seen_emails:
+                self.report.fail(number, f'Duplicate email in file: {email}')
+            elif phone and (phone in existing_phones or phone in self.seen_phones):
+                self.report.fail(number, f'Phone number already in use: {phone}')
+            else:
+                self.seen_emails.add(email)
+                if phone:
+                    self.seen_phones.add(phone)
+                new.append((number, values))
+        if not new:
+            return
+
+        conflicts = self.insert(new)
+        for number, error in conflicts:
+            self.report.fail(number, f'Not imported, the row conflicted with existing data: {error}')
+        self.report.created += len(new) - len(conflicts)
+
+    def insert(self, rows):
+        """
+        Insert the (row number, values) rows and return (row number, error)
+        for those that were not inserted: none, unless an email or phone
+        number was taken since the duplicate checks. The batch is then
+        inserted one row at a time, so only the conflicting rows fail.
+        """
+        try:
+            with transaction.atomic():
+                self.insert_rows([values for _, values in rows])
+            return []
+        except IntegrityError:
+            pass
+
+        conflicts = []
+        for number, values in rows:
+            try:
+                with transaction.atomic():
+                    self.insert_rows([values])
+            except IntegrityError as e:
+                conflicts.append((number, e))
+        return conflicts
+
+    def insert_rows(self, rows):
+        # Imported barbers cannot log in until a password is set for them
+        password = make_password(None)
+        if connection.vendor != 'postgresql':
+            users = CustomUser.objects.bulk_create([
+                CustomUser(
+                    email=values['email'], first_name=values['first_name'], last_name=values['last_name'],
+                    phone_number=values['phone_number'], role=RolesChoices.BARBER.value, password=password)
+                for values in rows
+            ])
+            BarberProfile.objects.bulk_create([
+                BarberProfile(user=user, is_available=values['is_available']) for user, values in zip(users, rows)
+            ])
+            return
+
+        now = timezone.now()
+        copy_rows(CustomUser, [
+            'email', 'first_name', 'last_name', 'phone_number', 'role', 'password', 'is_superuser', 'is_staff',
+            'is_active', 'date_joined', 'created_at', 'modified_at',
+        ], (
+            (values['email'], values['first_name'], values['last_name'], values['phone_number'],
+             RolesChoices.BARBER.value, password, False, False, True, now, now, now)
+            for values in rows
+        ))
+        user_ids = dict(CustomUser.objects.filter(
+            email__in=[values['email'] for values in rows]).values_list('email', 'pk'))
+        copy_rows(BarberProfile, [
+            'user_id', 'is_available', 'review_count', 'latest_reviews', 'created_at', 'modified_at',
+        ], (
+            (user_ids[values['email']], values['is_available'], 0, '[]', now, now)
+            for values in rows
+        ))
+
+
+class SlotImporter:
+    """
+    Creates a free slot per row: barber_email, start_time and optionally
+    end_time (default BARBER_SCHEDULE['SLOT_MINUTES'] later). Naive times are
+    in TIME_ZONE. Slots a barber already has at the same start time are
+    skipped. On PostgreSQL rows are loaded with COPY.
+    """
+
+    def __init__(self, report):
+        self.report = report
+        self.barbers = {}
+        self.seen = set()
+        self.slot_length = datetime.timedelta(minutes=get_setting('BARBER_SCHEDULE', 'SLOT_MINUTES'))
+
+    def validate(self, row):
+        email = BaseUserManager.normalize_email(text_value(row, 'barber_email', 100, required=True))
+        start_time = datetime_value(row, 'start_time')
+        if start_time is None:
+            raise RowError('start_time is required')
+        end_time = datetime_value(row, 'end_time') or start_time + self.slot_length
+        if end_time <= start_time:
+            raise RowError('end_time must be after start_time')
+        return email, start_time, end_time
+
+    def import_batch(self, batch):
+        valid = []
+        for number, row in batch:
+            try:
+                if isinstance(row, RowError):
+                    raise row
+                valid.append((number, *self.validate(row)))
+            except RowError as e:
+                self.report.fail(number, e)
+
+        missing = {email for _, email, _, _ in valid} - self.barbers.keys()
+        self.barbers.update(
+            BarberProfile.objects.filter(user__email__in=missing).values_list('user__email', 'pk'))
+
+        slots = []
+        for number, email, start_time, end_time in valid:
+            barber_id = self.barbers.get(email)
+            if barber_id is None:
+                self.report.fail(number, f'No barber with email {email}')
+            elif (barber_id, start_time) in self.seen:
+                self.report.fail(number, f'Duplicate slot in file: {email} at {start_time.isoformat()}')
+            else:
+                self.seen.add((barber_id, start_time))
+                slots.append((number, barber_id, start_time, end_time))
+        if not slots:
+            return
+
+        existing = set(Slots.objects.filter(
+            barber_id__in={barber_id for _, barber_id, _, _ in slots},
+            start_time__gte=min(start_time for _, _, start_time, _ in slots),
+            start_time__lte=max(start_time for _, _, start_time, _ in slots),
+        ).values_list('barber_id', 'start_time'))
+        new = [slot for slot in slots if (slot[1], slot[2]) not in existing]
+        self.report.skipped += len(slots) - len(new)
+        if not new:
+            return
+
+        with transaction.atomic():
+            created = self.insert([slot[1:] for slot in new])
+            bump_slot_versions({barber_id for _, barber_id, _, _ in new})
+        self.report.created += created
+        self.report.skipped += len(new) - created
+
+    def insert(self, slots):
+        """
+        Insert the slots and return how many were created: all of them,
+        unless one was created since the duplicate check. The batch is then
+        inserted one slot at a time, skipping those that conflict.
+        """
+        try:
+            with transaction.atomic():
+                if connection.vendor == 'postgresql':
+                    now = timezone.now()
+                    copy_rows(Slots, ['barber_id', 'start_time', 'end_time', 'state', 'created_at', 'modified_at'], (
+                        (barber_id, start_time, end_time, SlotStates.FREE.value, now, now)
+                        for barber_id, start_time, end_time in slots
+                    ))
+                else:
+                    Slots.objects.bulk_create([
+                        Slots(barber_id=barber_id, start_time=start_time, end_time=end_time)
+                        for barber_id, start_time, end_time in slots
+                    ])
+            return len(slots)
+        except IntegrityError:
+            pass
+
+        created = 0
+        for barber_id, start_time, end_time in slots:
+            try:
+                with transaction.atomic():
+                    Slots.objects.create(barber_id=barber_id, start_time=start_time, end_time=end_time)
+            except IntegrityError:
+                continue
+            created += 1
+        return created
+
+
+def copy_value(value):
+    if value is None:
+        return '\\N'
+    if isinstance(value, str):
+        # Backslash escapes of COPY's text format
+        return value.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    return str(value)
+
+
+def copy_rows(model, columns, rows):
+    """
+    Load `rows`, tuples of values for `columns`, into the table of `model`
+    with PostgreSQL's COPY, in its text format.
+    """
+    data = io.StringIO()
+    data.writelines('\t'.join(map(copy_value, row)) + '\n' for row in rows)
+    data.seek(0)
+
+    quote = connection.ops.quote_name
+    sql = f"COPY {quote(model._meta.db_table)} ({', '.join(map(quote, columns))}) FROM STDIN"
+    with connection.cursor() as cursor, connection.wrap_database_errors:
+        raw = cursor.cursor
+        # psycopg2, or psycopg 3
+        if hasattr(raw, 'copy_expert'):
+            raw.copy_expert(sql, data)
+        else:
+            with raw.copy(sql) as copy:
+                copy.write(data.getvalue())
+
+
+IMPORTERS = {
+    'barbers': BarberImporter,
+    'slots': SlotImporter,
+}
+
+
+def import_rows(stream, kind, import_format, batch_size=None):
+    """
+    Import a CSV or NDJSON text stream of `kind` ('barbers' or 'slots'),
+    validating and writing batch_size rows at a time: only one batch is
+    held in memory, besides the keys seen for the duplicate checks. A bad
+    row is reported and skipped without stopping the import; every batch
+    commits on its own. A stream that is not UTF-8 stops the import where
+    it can no longer be read, keeping what was imported before.
+
+    Returns {'created': ..., 'skipped': ..., 'failed': ..., 'errors': [{'row': ..., 'error': ...}],
+    'error': None or why the import stopped early}.
+    """
+    report = ImportReport()
+    importer = IMPORTERS[kind](report)
+    rows = decoded_rows(read_rows(stream, import_format), report)
+    for batch in batches(rows, batch_size or get_setting('IMPORT', 'BATCH_SIZE')):
+        importer.import_batch(batch)
+    return report.as_dict()
@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from user.archive import archive_cutoff, archive_history, count_archivable
+from user.conf import get_setting
+
+
+class Command(BaseCommand):
+    help = (
+        'Move expired slots, and slots with completed or cancelled bookings, that ended before the '
+        'retention window into the archive tables, in batches. Safe to interrupt and run again.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retention-days', type=int, help='Keep this many days of history in the hot tables.')
+        parser.add_argument('--batch-size', type=int, help='Slots moved per transaction.')
+        parser.add_argument('--max-batches', type=int, help='Stop after this many batches.')
+        parser.add_argument('--dry-run', action='store_true', help='Only report how many rows would be moved.')
+
+    def handle(self, *args, **options):
+        retention_days = options['retention_days']
+        if retention_days is None:
+            retention_days = get_setting('ARCHIVE', 'RETENTION_DAYS')
+        cutoff = archive_cutoff(retention_days)
+
+        if options['dry_run']:
+            counts = count_archivable(cutoff)
+            self.stdout.write(
+                f"Would archive {counts['slots']} slot(s) and {counts['bookings']} booking(s) "
+                f'that ended before {cutoff:%Y-%m-%d %H:%M}.')
+            return
+
+        started = time.perf_counter()
+        moved = archive_history(retention_days, options['batch_size'], options['max_batches'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {moved['slots']} slot(s) and {moved['bookings']} booking(s) in {moved['batches']} "
+            f'batch(es), {time.perf_counter() - started:.1f}s.'))
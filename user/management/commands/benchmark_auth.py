@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from user.authentication import CachedTokenAuthentication, local_token_cache, invalidate_tokens
+from user.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare queries and time per authenticated request between DRF TokenAuthentication '
+        'and CachedTokenAuthentication. Uses a throwaway user that is rolled back afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000, help='Requests to authenticate per backend.')
+
+    def handle(self, *args, **options):
+        count = options['requests']
+        factory = APIRequestFactory()
+
+        with transaction.atomic():
+            user = CustomUser.objects.create_user(email='auth-benchmark@example.invalid', password=None)
+            token = Token.objects.create(user=user)
+            http_request = factory.get('/api/profile/', HTTP_AUTHORIZATION=f'Token {token.key}')
+
+            for backend in (TokenAuthentication(), CachedTokenAuthentication()):
+                local_token_cache.clear()
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    for _ in range(count):
+                        backend.authenticate(Request(http_request))
+                    elapsed = time.perf_counter() - started
+
+                self.stdout.write(
+                    f'{type(backend).__name__:<28} {len(queries) / count:.3f} queries/request, '
+                    f'{elapsed / count * 1e6:.1f} us/request')
+
+            transaction.set_rollback(True)
+
+        # The rolled back token never fires its delete signal
+        invalidate_tokens([token.key])
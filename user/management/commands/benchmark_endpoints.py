@@ -0,0 +1,283 @@
+import contextlib
+import datetime
+import io
+import json
+import logging
+import platform
+import subprocess
+import time
+import tracemalloc
+from collections import Counter
+
+import django
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from user.models import BarberProfile, Booking, CustomUser, Review, Slots
+from user.seed import SEED_PASSWORD, seed_users
+from user.urls import urlpatterns
+from user.utils import BookingStates, SlotStates
+
+
+URL_PREFIX = '/api/'
+
+
+class Fixtures:
+    """
+    Users, tokens and rows of the seeded data that the endpoint requests use.
+    Anything created here is rolled back with the benchmark's transaction.
+    """
+
+    def __init__(self, prefix):
+        users = seed_users(prefix)
+        booking = (Booking.objects.filter(customer__in=users, state=BookingStates.ONGOING.value)
+                   .select_related('slot__barber__user', 'customer').order_by('slot__start_time').first())
+        if booking is None:
+            raise CommandError(f"No seeded data with prefix '{prefix}', run seed_data first.")
+
+        self.customer = booking.customer
+        self.admin = CustomUser.objects.create_user(
+            email=f'{prefix}-benchmark-admin@example.invalid', password=None, is_staff=True)
+
+        self.booked_slot = booking.slot
+        self.barber = booking.slot.barber
+        self.free_slots = list(
+            Slots.objects.filter(barber=self.barber, state=SlotStates.FREE.value, start_time__gt=timezone.now())
+            .order_by('start_time').values_list('pk', flat=True)[:3])
+        if len(self.free_slots) < 3:
+            raise CommandError('The seeded barber has no free slots left, seed with a lower --booked-ratio.')
+
+        self.tokens = {
+            user.pk: Token.objects.get_or_create(user=user)[0].key for user in (self.customer, self.admin)
+        }
+        self.counts = {
+            'users': users.count(),
+            'barbers': BarberProfile.objects.filter(user__in=users).count(),
+            'slots': Slots.objects.filter(barber__user__in=users).count(),
+            'bookings': Booking.objects.filter(customer__in=users).count(),
+            'reviews': Review.objects.filter(customer__in=users).count(),
+        }
+
+
+def import_file(barber, rows=100):
+    """
+    A CSV upload of `rows` slots of `barber`, a year from now.
+    """
+    start = timezone.now().replace(minute=0, second=0, microsecond=0) + datetime.timedelta(days=365)
+    lines = ['barber_email,start_time'] + [
+        f'{barber.user.email},{(start + datetime.timedelta(hours=index)).isoformat()}' for index in range(rows)
+    ]
+    return SimpleUploadedFile('slots.csv', '\n'.join(lines).encode(), content_type='text/csv')
+
+
+def endpoint_requests(fixtures):
+    """
+    One request per route of user.urls: (method, path, data, user or None).
+    Data given as a function is called for every request and sent as a
+    multipart form, for uploads. Requests that change data run in a
+    savepoint that is rolled back, so every iteration sees the same state.
+    """
+    customer, admin, barber = fixtures.customer, fixtures.admin, fixtures.barber
+    booked, free = fixtures.booked_slot.pk, fixtures.free_slots
+    window = fixtures.booked_slot.start_time.date().isoformat()
+    report = {'email': barber.user.email, 'include_bookings': True}
+
+    return {
+        'users/': ('get', 'users/', None, admin),
+        'user/<int:pk>/': ('get', f'user/{customer.pk}/', None, admin),
+        'register/': ('post', 'register/', {
+            'first_name': 'Bench', 'last_name': 'Mark', 'email': 'benchmark-register@example.invalid',
+            'phone_number': '+000000000', 'password': SEED_PASSWORD, 'password2': SEED_PASSWORD}, None),
+        'login/': ('post', 'login/', {'email': customer.email, 'password': SEED_PASSWORD}, None),
+        'login/async/': ('post', 'login/async/', {'email': customer.email, 'password': SEED_PASSWORD}, None),
+        'logout/': ('post', 'logout/', None, customer),
+        'barbers/': ('get', 'barbers/', None, customer),
+        'barbers/<int:pk>/': ('get', f'barbers/{barber.pk}/', None, customer),
+        'barbers/<int:pk>/reviews/': ('get', f'barbers/{barber.pk}/reviews/?q=friendly', None, None),
+        'barbers/async/': ('get', 'barbers/async/', None, customer),
+        'barber/signup/': ('post', 'barber/signup/', None, customer),
+        'profile/': ('get', 'profile/', None, customer),
+        'profile/async/': ('get', 'profile/async/', None, customer),
+        'barber/slots/': ('get', f'barber/slots/?barber={barber.pk}&status=free', None, None),
+        'barber/slots/async/': ('get', f'barber/slots/async/?barber={barber.pk}&status=free', None, None),
+        'barber/slots/earliest/': ('get', 'barber/slots/earliest/?limit=10', None, None),
+        'barber/slots/book/<int:pk>/': ('post', f'barber/slots/book/{free[0]}/', None, customer),
+        'barber/slots/book/batch/': ('post', 'barber/slots/book/batch/', {'slots': free}, customer),
+        'barber/slots/cancel/<int:pk>/': ('put', f'barber/slots/cancel/{booked}/', {'reason': 'Benchmark'}, customer),
+        'barber/slots/delete/<int:pk>/': ('delete', f'barber/slots/delete/{booked}/', None, customer),
+        'barber/slots/complete/<int:pk>/': ('put', f'barber/slots/complete/{booked}/', {'amount': 1500}, customer),
+        'barber/write-review/<int:pk>/': ('post', f'barber/write-review/{booked}/', {
+            'review': 'Benchmark review', 'email': barber.user.email}, customer),
+        'barber/slots/all-cancelled/': ('post', 'barber/slots/all-cancelled/', report, admin),
+        'barber/slots/cancelled/': ('post', 'barber/slots/cancelled/', {
+            **report, 'start_time': f'{window} 09:00AM', 'end_time': f'{window} 09:00PM'}, admin),
+        'barber/slots/completed/': ('post', 'barber/slots/completed/', report, admin),
+        'bookings/search/': ('get', f'bookings/search/?barber={barber.pk}&start={window}&state=Completed', None, admin),
+        'bookings/export/': ('get', 'bookings/export/?state=Completed&export_format=csv', None, admin),
+        'import/': ('post', 'import/', lambda: {'kind': 'slots', 'file': import_file(barber)}, admin),
+    }
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, cwd=settings.BASE_DIR,
+            timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        'Run every URL of user/urls.py against data from seed_data and report p50/p95 latency, '
+        'queries per request and peak traced memory. Everything the requests change is rolled back.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20, help='Timed requests per endpoint.')
+        parser.add_argument('--warmup', type=int, default=2, help='Untimed requests per endpoint before timing.')
+        parser.add_argument('--prefix', default='seed', help='Email prefix the data was seeded with.')
+        parser.add_argument('--only', nargs='+', default=[], help='Only run routes containing one of these strings.')
+        parser.add_argument('--cold-cache', action='store_true', help='Clear the cache before every request.')
+        parser.add_argument('--output', help='Write the results to this JSON file.')
+        parser.add_argument('--compare', help='A previous JSON result to compare p50/p95 against.')
+
+    def handle(self, *args, **options):
+        # The test client talks to 'testserver', and expected 4xx responses need not be logged
+        request_logger = logging.getLogger('django.request')
+        level = request_logger.level
+        request_logger.setLevel(logging.ERROR)
+        try:
+            with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+                self.run(options)
+        finally:
+            request_logger.setLevel(level)
+
+    def run(self, options):
+        results = {}
+        with transaction.atomic():
+            fixtures = Fixtures(options['prefix'])
+            requests = endpoint_requests(fixtures)
+
+            routes = [str(pattern.pattern) for pattern in urlpatterns]
+            for route in routes:
+                if route not in requests:
+                    self.stderr.write(f'No benchmark request for {route}, add one to endpoint_requests.')
+
+            for route in routes:
+                if route not in requests or (options['only'] and not any(part in route for part in options['only'])):
+                    continue
+                results[route] = self.benchmark(requests[route], fixtures, options)
+                self.write_result(route, results[route])
+
+            counts = fixtures.counts
+            transaction.set_rollback(True)
+
+        report = {
+            'meta': {
+                'created_at': timezone.now().isoformat(),
+                'git_revision': git_revision(),
+                'database': connection.vendor,
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'iterations': options['iterations'],
+                'cold_cache': options['cold_cache'],
+                'data': counts,
+            },
+            'endpoints': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+        if options['compare']:
+            self.compare(results, options['compare'])
+
+    def send(self, request, fixtures, cold_cache):
+        method, path, data, user = request
+        client = APIClient()
+        if user is not None:
+            client.credentials(HTTP_AUTHORIZATION=f'Token {fixtures.tokens[user.pk]}')
+        if cold_cache:
+            cache.clear()
+
+        # Some views print debugging output, which would garble the report
+        with transaction.atomic(), contextlib.redirect_stdout(io.StringIO()):
+            if callable(data):
+                response = getattr(client, method)(URL_PREFIX + path, data(), format='multipart')
+            else:
+                response = getattr(client, method)(URL_PREFIX + path, data, format='json')
+            # Streamed bodies are only produced as they are read
+            if response.streaming:
+                for _ in response.streaming_content:
+                    pass
+            transaction.set_rollback(True)
+        return response
+
+    def benchmark(self, request, fixtures, options):
+        for _ in range(options['warmup']):
+            self.send(request, fixtures, options['cold_cache'])
+
+        timings, queries, statuses = [], [], Counter()
+        for _ in range(options['iterations']):
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = self.send(request, fixtures, options['cold_cache'])
+                timings.append(time.perf_counter() - started)
+            # The savepoint and its rollback are the benchmark's, not the endpoint's
+            queries.append(len([query for query in captured if 'SAVEPOINT' not in query['sql']]))
+            statuses[response.status_code] += 1
+
+        # Traced separately, as tracing slows every allocation down
+        tracemalloc.start()
+        try:
+            self.send(request, fixtures, options['cold_cache'])
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+        return {
+            'method': request[0].upper(),
+            'path': URL_PREFIX + request[1],
+            'status': {str(code): count for code, count in sorted(statuses.items())},
+            'p50_ms': round(percentile(timings, 50) * 1000, 3),
+            'p95_ms': round(percentile(timings, 95) * 1000, 3),
+            'mean_ms': round(sum(timings) / len(timings) * 1000, 3),
+            'queries': round(sum(queries) / len(queries), 2),
+            'peak_memory_kib': round(peak / 1024, 1),
+        }
+
+    def write_result(self, route, result):
+        statuses = ','.join(result['status'])
+        self.stdout.write(
+            f"{result['method']:<6} {route:<34} {statuses:<8} p50 {result['p50_ms']:8.2f} ms  "
+            f"p95 {result['p95_ms']:8.2f} ms  {result['queries']:6.1f} queries  "
+            f"{result['peak_memory_kib']:9.1f} KiB")
+
+    def compare(self, results, path):
+        with open(path) as previous_file:
+            previous = json.load(previous_file)['endpoints']
+
+        self.stdout.write(f'\nCompared to {path}:')
+        for route, result in results.items():
+            before = previous.get(route)
+            if before is None:
+                continue
+            changes = '  '.join(
+                f"{key[:-3]} {(result[key] - before[key]) / before[key] * 100:+6.1f}%" if before[key] else f'{key[:-3]} n/a'
+                for key in ('p50_ms', 'p95_ms'))
+            queries = result['queries'] - before['queries']
+            self.stdout.write(f'{route:<41} {changes}  queries {queries:+.1f}')
@@ -0,0 +1,79 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from user import serializers
+from user.fastserializers import booking_serializer, slot_serializer
+from user.models import BarberProfile, Booking, CustomUser, Slots
+from user.utils import SlotStates
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare the DRF serializers with the fast values_list() serializers on slot and '
+        'booking lists of several sizes, from query to rendered JSON. Uses throwaway rows '
+        'that are rolled back afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rows', type=int, nargs='+', default=[1000, 10000, 100000], help='List sizes to measure.')
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per measurement; the best is reported.')
+
+    def handle(self, *args, **options):
+        sizes = sorted(options['rows'])
+        renderer = JSONRenderer()
+
+        with transaction.atomic():
+            slots, bookings = self.create_rows(sizes[-1])
+
+            for size in sizes:
+                slot_page = slots.order_by('id')[:size]
+                booking_page = bookings.order_by('id')[:size]
+                cases = [
+                    ('slots', 'drf', lambda: serializers.SlotSerializer(
+                        slot_page.select_related('barber__user'), many=True).data),
+                    ('slots', 'fast', lambda: slot_serializer.serialize(slot_serializer.values(slot_page))),
+                    ('bookings', 'drf', lambda: serializers.BookingSerializer(
+                        booking_page.select_related('slot__barber__user'), many=True).data),
+                    ('bookings', 'fast', lambda: booking_serializer.serialize(booking_serializer.values(booking_page))),
+                ]
+
+                for name, serializer, build in cases:
+                    elapsed = min(self.measure(lambda: renderer.render(build())) for _ in range(options['repeat']))
+                    self.stdout.write(
+                        f'{name:<9} {size:>7} rows  {serializer:<5} {elapsed * 1000:9.1f} ms  '
+                        f'{elapsed / size * 1e6:6.2f} us/row')
+
+            transaction.set_rollback(True)
+
+    def measure(self, run):
+        started = time.perf_counter()
+        run()
+        return time.perf_counter() - started
+
+    def create_rows(self, count):
+        customer = CustomUser.objects.create_user(email='serializer-benchmark@example.invalid', password=None)
+        barbers = [
+            BarberProfile.objects.create(user=CustomUser.objects.create_user(
+                email=f'serializer-benchmark-{index}@example.invalid', password=None))
+            for index in range(10)
+        ]
+
+        start = timezone.now().replace(minute=0, second=0, microsecond=0) + datetime.timedelta(days=3650)
+        length = datetime.timedelta(hours=1)
+        new_slots = Slots.objects.bulk_create([
+            Slots(barber=barbers[index % len(barbers)], start_time=start + index * length,
+                  end_time=start + (index + 1) * length, state=SlotStates.BOOKED.value)
+            for index in range(count)
+        ], batch_size=5000)
+        Booking.objects.bulk_create([
+            Booking(slot=slot, customer=customer, reason='Benchmark', amount=1000) for slot in new_slots
+        ], batch_size=5000)
+
+        return (Slots.objects.filter(barber__in=barbers),
+                Booking.objects.filter(customer=customer))
@@ -0,0 +1,38 @@
+import difflib
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from user.schema import render_schema, schema_path
+
+
+class Command(BaseCommand):
+    help = (
+        'Render the OpenAPI schema of the API once and write it to OPENAPI_SCHEMA["PATH"], where '
+        '/swagger.json/ serves it from. Run it when deploying. With --check, only compare the '
+        'file with the live views and fail when they differ.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', help='Write here instead of OPENAPI_SCHEMA["PATH"].')
+        parser.add_argument('--check', action='store_true', help='Fail if the file differs from the live views.')
+
+    def handle(self, *args, **options):
+        path = Path(options['output'] or schema_path())
+        content = render_schema()
+
+        if options['check']:
+            try:
+                built = path.read_bytes()
+            except FileNotFoundError:
+                raise CommandError(f'No prebuilt schema at {path}; run manage.py build_schema.')
+            if built != content:
+                diff = difflib.unified_diff(
+                    built.decode().splitlines(), content.decode().splitlines(), 'prebuilt', 'live', lineterm='', n=1)
+                self.stderr.write('\n'.join(list(diff)[:40]))
+                raise CommandError(f'The schema at {path} is out of date; run manage.py build_schema.')
+            self.stdout.write(self.style.SUCCESS(f'The schema at {path} matches the views.'))
+            return
+
+        path.write_bytes(content)
+        self.stdout.write(self.style.SUCCESS(f'Wrote the schema to {path} ({len(content)} bytes).'))
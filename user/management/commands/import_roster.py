@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from user.imports import IMPORTERS, IMPORT_FORMATS, import_format_of, import_rows
+
+
+class Command(BaseCommand):
+    help = (
+        'Import barbers (email, first_name, last_name, phone_number, is_available) or slots '
+        '(barber_email, start_time, end_time) from a CSV or NDJSON file, in batches. Existing '
+        'barbers and slots are skipped and invalid rows reported without stopping the import.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='The CSV (with a header line) or NDJSON file.')
+        parser.add_argument('--kind', required=True, choices=list(IMPORTERS), help='What the rows describe.')
+        parser.add_argument('--format', choices=IMPORT_FORMATS, help='Default: from the file extension.')
+        parser.add_argument('--batch-size', type=int, help='Rows validated and written per transaction.')
+        parser.add_argument('--show-errors', type=int, default=20, help='Failed rows to list.')
+
+    def handle(self, *args, **options):
+        import_format = options['format'] or import_format_of(options['path'])
+        if import_format is None:
+            raise CommandError('Cannot tell the format from the file extension, pass --format.')
+
+        started = time.perf_counter()
+        try:
+            with open(options['path'], encoding='utf-8-sig', newline='') as stream:
+                report = import_rows(stream, options['kind'], import_format, options['batch_size'])
+        except OSError as e:
+            raise CommandError(str(e))
+        elapsed = time.perf_counter() - started
+
+        for error in report['errors'][:options['show_errors']]:
+            self.stderr.write(f"Row {error['row']}: {error['error']}")
+        if report['failed'] > options['show_errors']:
+            self.stderr.write(f"... and {report['failed'] - options['show_errors']} more failed row(s).")
+
+        style = self.style.SUCCESS if not report['failed'] else self.style.WARNING
+        self.stdout.write(style(
+            f"Created {report['created']}, skipped {report['skipped']} existing, {report['failed']} failed "
+            f"{options['kind']} row(s) in {elapsed:.1f}s."))
+        if report['error']:
+            raise CommandError(report['error'])
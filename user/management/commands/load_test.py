@@ -0,0 +1,135 @@
+import asyncio
+import statistics
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Target:
+
+    def __init__(self, label, url, headers):
+        parts = urlsplit(url)
+        if parts.scheme != 'http' or not parts.hostname:
+            raise CommandError(f'Only http:// URLs are supported: {url}')
+        self.label = label
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        path = parts.path or '/'
+        if parts.query:
+            path = f'{path}?{parts.query}'
+        lines = [f'GET {path} HTTP/1.1', f'Host: {parts.netloc}', 'Connection: keep-alive']
+        lines += [f'{name}: {value}' for name, value in headers]
+        self.request = ('\r\n'.join(lines) + '\r\n\r\n').encode()
+
+
+async def read_response(reader):
+    """
+    Read one HTTP/1.1 response. Returns (status, keep_alive).
+    """
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError('Connection closed by server')
+    status = int(status_line.split()[1])
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    else:
+        await reader.readexactly(int(headers.get('content-length', 0)))
+
+    return status, headers.get('connection', '').lower() != 'close'
+
+
+async def client(target, deadline, latencies, errors):
+    reader = writer = None
+    while time.monotonic() < deadline:
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(target.host, target.port)
+            started = time.perf_counter()
+            writer.write(target.request)
+            await writer.drain()
+            status, keep_alive = await read_response(reader)
+            latencies.append(time.perf_counter() - started)
+            if status >= 400:
+                errors[status] = errors.get(status, 0) + 1
+            if not keep_alive:
+                writer.close()
+                writer = None
+        except (OSError, ConnectionError, ValueError, asyncio.IncompleteReadError) as e:
+            errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+            if writer is not None:
+                writer.close()
+            writer = None
+            await asyncio.sleep(0.01)
+    if writer is not None:
+        writer.close()
+
+
+async def run_target(target, concurrency, duration):
+    latencies, errors = [], {}
+    deadline = time.monotonic() + duration
+    started = time.perf_counter()
+    await asyncio.gather(*(client(target, deadline, latencies, errors) for _ in range(concurrency)))
+    return latencies, errors, time.perf_counter() - started
+
+
+class Command(BaseCommand):
+    help = (
+        'Hold many concurrent keep-alive connections against one or more URLs and report '
+        'throughput and latency, e.g. to compare the WSGI and ASGI servers of the compose setup:\n'
+        '  manage.py load_test wsgi=http://backend:8000/api/barber/slots/ '
+        'asgi=http://asgi:8001/api/barber/slots/async/'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('targets', nargs='+', help='URLs to load, optionally labelled as label=url.')
+        parser.add_argument('--concurrency', type=int, default=100, help='Concurrent connections per target.')
+        parser.add_argument('--duration', type=float, default=10, help='Seconds to load each target.')
+        parser.add_argument(
+            '--header', action='append', default=[],
+            help="Extra request header, e.g. 'Authorization: Token <key>'. Can be repeated.")
+
+    def handle(self, *args, **options):
+        headers = []
+        for header in options['header']:
+            name, sep, value = header.partition(':')
+            if not sep:
+                raise CommandError(f'Invalid header: {header}')
+            headers.append((name.strip(), value.strip()))
+
+        targets = []
+        for value in options['targets']:
+            label, sep, url = value.partition('=')
+            if not sep or '://' in label:
+                label, url = value, value
+            targets.append(Target(label, url, headers))
+
+        # Targets run one after the other so they do not compete for this machine's CPU
+        for target in targets:
+            latencies, errors, elapsed = asyncio.run(
+                run_target(target, options['concurrency'], options['duration']))
+            if not latencies:
+                self.stdout.write(f'{target.label}: no responses, errors {errors}')
+                continue
+
+            latencies.sort()
+            p50 = statistics.median(latencies) * 1000
+            p95 = latencies[int(len(latencies) * 0.95) - 1] * 1000
+            p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000
+            self.stdout.write(
+                f'{target.label}: {len(latencies)} responses, {len(latencies) / elapsed:.1f} req/s, '
+                f'p50 {p50:.1f} ms, p95 {p95:.1f} ms, p99 {p99:.1f} ms'
+                + (f', errors {errors}' if errors else ''))
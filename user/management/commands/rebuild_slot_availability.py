@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from user.cache import bump_slot_versions
+from user.models import Slots
+from user.utils import SlotStates
+
+
+class Command(BaseCommand):
+    help = (
+        'Check Slots.state against the Booking table and rebuild it where they disagree. '
+        'A slot is booked when a Booking row exists for it; expired slots without one are left alone.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Only report drifted slots and exit with an error if any are found.')
+
+    def handle(self, *args, **options):
+        should_be_booked = Slots.objects.filter(bookings__isnull=False).exclude(state=SlotStates.BOOKED.value)
+        should_be_free = Slots.objects.filter(bookings__isnull=True, state=SlotStates.BOOKED.value)
+
+        if options['check']:
+            booked_drift = should_be_booked.count()
+            free_drift = should_be_free.count()
+            self.stdout.write(f'{booked_drift} booked slot(s) marked free, {free_drift} free slot(s) marked booked.')
+            if booked_drift or free_drift:
+                raise CommandError('Slot availability index is out of date, run without --check to rebuild it.')
+            self.stdout.write(self.style.SUCCESS('Slot availability index is consistent.'))
+            return
+
+        with transaction.atomic():
+            barber_ids = set(should_be_booked.values_list('barber_id', flat=True))
+            barber_ids.update(should_be_free.values_list('barber_id', flat=True))
+            booked = should_be_booked.update(state=SlotStates.BOOKED.value)
+            freed = should_be_free.update(state=SlotStates.FREE.value)
+            bump_slot_versions(barber_ids)
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt slot availability: {booked} marked booked, {freed} marked free.'))
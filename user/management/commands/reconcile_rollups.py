@@ -0,0 +1,28 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from user.rollups import reconcile_rollups
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute the daily booking rollups from the Booking and ArchivedBooking tables. Without '
+        'dates it covers the whole booking history, which backfills the rollups of bookings made '
+        'before they existed; run it once when deploying them. Safe to interrupt and run again.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start-date', type=datetime.date.fromisoformat, help='First day, YYYY-MM-DD.')
+        parser.add_argument('--end-date', type=datetime.date.fromisoformat, help='Last day, YYYY-MM-DD.')
+
+    def handle(self, *args, **options):
+        start_date, end_date = options['start_date'], options['end_date']
+        if start_date and end_date and start_date > end_date:
+            raise CommandError('--start-date must not come after --end-date.')
+
+        started = time.perf_counter()
+        corrected = reconcile_rollups(start_date, end_date)
+        self.stdout.write(self.style.SUCCESS(
+            f'Reconciled booking rollups, {corrected} row(s) corrected in {time.perf_counter() - started:.1f}s.'))
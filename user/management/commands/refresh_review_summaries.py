@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from user.reviews import refresh_all_review_summaries
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute the review count and latest reviews stored on every barber profile from the '
+        'Review table. Run it once when deploying them, which backfills barbers reviewed before, '
+        'and after changing settings.REVIEWS["LATEST_COUNT"]. Safe to interrupt and run again.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Barbers refreshed per transaction.')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        refreshed = refresh_all_review_summaries(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Refreshed the review summaries of {refreshed} barber(s) in {time.perf_counter() - started:.1f}s.'))
@@ -0,0 +1,49 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from user.seed import seed_data, seed_users
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate synthetic barbers, customers, slots, bookings in every state and reviews, '
+        'inserted in bulk, for local benchmarking. Seeded users share an email prefix, so --flush can '
+        'remove them again, and the password user.seed.SEED_PASSWORD.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--barbers', type=int, default=20, help='Barbers to create.')
+        parser.add_argument('--customers', type=int, default=200, help='Customers to create.')
+        parser.add_argument('--days', type=int, default=14, help='Days of slots per barber, half of them in the past.')
+        parser.add_argument('--booked-ratio', type=float, default=0.6, help='Share of slots that get a booking.')
+        parser.add_argument('--review-ratio', type=float, default=0.3, help='Share of completed bookings that get a review.')
+        parser.add_argument('--prefix', default='seed', help='Email prefix of the seeded users.')
+        parser.add_argument('--random-seed', type=int, help='Seed of the random generator, for repeatable data.')
+        parser.add_argument('--flush', action='store_true', help='Delete previously seeded data with this prefix first.')
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        existing = seed_users(prefix)
+        if existing.exists():
+            if not options['flush']:
+                raise CommandError(f"Data seeded with prefix '{prefix}' already exists, use --flush to replace it.")
+            # Slots, bookings, reviews and rollups go with their users through CASCADE
+            deleted, _ = existing.delete()
+            self.stdout.write(f'Deleted {deleted} previously seeded rows.')
+
+        started = time.perf_counter()
+        counts = seed_data(
+            barbers=options['barbers'],
+            customers=options['customers'],
+            days=options['days'],
+            booked_ratio=options['booked_ratio'],
+            review_ratio=options['review_ratio'],
+            prefix=prefix,
+            rng=random.Random(options['random_seed']),
+        )
+        elapsed = time.perf_counter() - started
+
+        summary = ', '.join(f'{count} {name}' for name, count in counts.items())
+        self.stdout.write(self.style.SUCCESS(f'Created {summary} in {elapsed:.1f}s.'))
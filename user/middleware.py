@@ -0,0 +1,285 @@
+import heapq
+import logging
+import os
+import random
+import re
+import time
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
+from rest_framework.exceptions import AuthenticationFailed
+
+from .authentication import CachedTokenAuthentication
+from .conf import get_setting
+from .profiling import StackProfiler
+from .routers import SAFE_METHODS, RoutingState, routing_state, sticky_key
+
+
+logger = logging.getLogger('user.sql')
+
+# Statements are cut to this length in response headers and log lines
+STATEMENT_PREVIEW = 300
+
+
+class QueryRecorder:
+    """
+    Execution wrapper counting and timing every statement a request runs,
+    keeping only the slowest few so its memory stays constant.
+    """
+
+    def __init__(self, slowest):
+        self.slowest_count = slowest
+        self.count = 0
+        self.duration = 0.0
+        self.slowest = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.count += 1
+            self.duration += elapsed
+            if self.slowest_count:
+                entry = (elapsed, self.count, sql)
+                if len(self.slowest) < self.slowest_count:
+                    heapq.heappush(self.slowest, entry)
+                else:
+                    heapq.heappushpop(self.slowest, entry)
+
+    def slowest_statements(self):
+        return [(elapsed, sql) for elapsed, _, sql in sorted(self.slowest, reverse=True)]
+
+
+def statement_preview(sql):
+    return ' '.join(sql.split())[:STATEMENT_PREVIEW]
+
+
+class SQLInstrumentationMiddleware:
+    """
+    Records the number of queries, total SQL time and slowest statements of
+    a sample of requests (settings.SQL_INSTRUMENTATION['SAMPLE_RATE']), plus
+    every request sending the FORCE_HEADER header.
+
+    Staff users get the figures back in X-SQL-Queries, X-SQL-Time-Ms and
+    X-SQL-Slowest response headers. Requests over the QUERY_BUDGET or
+    TIME_BUDGET_MS budgets are logged to the 'user.sql' logger with their
+    view and slowest statements. Requests left out of the sample only cost
+    a random number.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = get_setting('SQL_INSTRUMENTATION', 'SAMPLE_RATE')
+        self.query_budget = get_setting('SQL_INSTRUMENTATION', 'QUERY_BUDGET')
+        self.time_budget = get_setting('SQL_INSTRUMENTATION', 'TIME_BUDGET_MS') / 1000
+        self.slowest = get_setting('SQL_INSTRUMENTATION', 'SLOWEST')
+        self.force_header = 'HTTP_' + get_setting('SQL_INSTRUMENTATION', 'FORCE_HEADER').upper().replace('-', '_')
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.is_sampled(request):
+            return self.get_response(request)
+
+        recorder = QueryRecorder(self.slowest)
+        with self.wrap_connections(recorder):
+            response = self.get_response(request)
+        self.report(request, response, recorder, getattr(request, 'user', None))
+        return response
+
+    async def __acall__(self, request):
+        if not self.is_sampled(request):
+            return await self.get_response(request)
+
+        # Connections belong to threads, so the wrappers go on the connections of
+        # the thread that runs this request's ORM calls
+        recorder = QueryRecorder(self.slowest)
+        wrappers = await sync_to_async(self.wrap_connections)(recorder)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(wrappers.close)()
+
+        # A session user not loaded yet has to be loaded without blocking the loop
+        user = getattr(request, 'user', None)
+        if isinstance(user, SimpleLazyObject) and hasattr(request, 'auser'):
+            user = await request.auser()
+        self.report(request, response, recorder, user)
+        return response
+
+    def is_sampled(self, request):
+        return self.force_header in request.META or random.random() < self.sample_rate
+
+    def wrap_connections(self, recorder):
+        """
+        Install the recorder on every connection of the current thread.
+        Closing the returned stack removes it again.
+        """
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(recorder))
+        return stack
+
+    def report(self, request, response, recorder, user):
+        slowest = recorder.slowest_statements()
+
+        if user is not None and user.is_staff:
+            response['X-SQL-Queries'] = str(recorder.count)
+            response['X-SQL-Time-Ms'] = f'{recorder.duration * 1000:.2f}'
+            if slowest:
+                response['X-SQL-Slowest'] = ' | '.join(
+                    f'{elapsed * 1000:.2f}ms {statement_preview(sql)}' for elapsed, sql in slowest
+                ).encode('ascii', 'replace').decode()
+
+        if recorder.count > self.query_budget or recorder.duration > self.time_budget:
+            view = request.resolver_match.view_name if request.resolver_match else None
+            logger.warning(
+                'SQL budget exceeded: %s %s (%s) ran %d queries in %.1f ms; slowest: %s',
+                request.method, request.path, view, recorder.count, recorder.duration * 1000,
+                '; '.join(f'{elapsed * 1000:.1f} ms {statement_preview(sql)}' for elapsed, sql in slowest),
+            )
+
+
+PROFILE_MODES = ('tree', 'collapsed', 'save')
+
+
+class RequestProfilingMiddleware:
+    """
+    Profiles a single request of a staff user who asks for it with the
+    HEADER header or QUERY_PARAM query parameter set to a mode:
+
+    - tree: respond with the call tree summary instead of the view's response
+    - collapsed: respond with collapsed stacks for flame graph tools
+    - save: respond normally and write both to DIRECTORY, named in the
+      X-Profile-Files response header
+
+    Staff status is checked before the view runs, from the session or the
+    API token, so nobody else can make the server profile. Requests without
+    the header or parameter only pay for two lookups. Only the thread
+    serving the request is profiled; under ASGI that is the event loop, so
+    ORM calls are left out and other requests' coroutines show up.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.header = 'HTTP_' + get_setting('REQUEST_PROFILING', 'HEADER').upper().replace('-', '_')
+        self.query_param = get_setting('REQUEST_PROFILING', 'QUERY_PARAM')
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        mode = self.requested_mode(request)
+        if mode is None or not self.is_staff(request):
+            return self.get_response(request)
+
+        with StackProfiler() as profiler:
+            response = self.get_response(request)
+        return self.profile_response(request, response, profiler, mode)
+
+    async def __acall__(self, request):
+        mode = self.requested_mode(request)
+        if mode is None or not await sync_to_async(self.is_staff)(request):
+            return await self.get_response(request)
+
+        with StackProfiler() as profiler:
+            response = await self.get_response(request)
+        return self.profile_response(request, response, profiler, mode)
+
+    def requested_mode(self, request):
+        mode = request.META.get(self.header)
+        if mode is None:
+            if f'{self.query_param}=' not in request.META.get('QUERY_STRING', ''):
+                return None
+            mode = request.GET.get(self.query_param)
+        return mode if mode in PROFILE_MODES else None
+
+    def is_staff(self, request):
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            return user.is_staff
+        try:
+            credentials = CachedTokenAuthentication().authenticate(request)
+        except AuthenticationFailed:
+            return False
+        return bool(credentials) and credentials[0].is_staff
+
+    def profile_response(self, request, response, profiler, mode):
+        tree = profiler.call_tree(get_setting('REQUEST_PROFILING', 'MIN_FRACTION'))
+        if mode == 'tree':
+            return HttpResponse(tree, content_type='text/plain; charset=utf-8')
+        if mode == 'collapsed':
+            return HttpResponse(profiler.collapsed(), content_type='text/plain; charset=utf-8')
+
+        directory = get_setting('REQUEST_PROFILING', 'DIRECTORY') or settings.BASE_DIR / 'profiles'
+        os.makedirs(directory, exist_ok=True)
+        slug = re.sub(r'[^A-Za-z0-9]+', '-', request.path).strip('-') or 'root'
+        name = os.path.join(directory, f"{timezone.now():%Y%m%dT%H%M%S%f}-{request.method}-{slug}")
+        with open(f'{name}.txt', 'w') as tree_file:
+            tree_file.write(tree)
+        with open(f'{name}.collapsed', 'w') as collapsed_file:
+            collapsed_file.write(profiler.collapsed())
+        response['X-Profile-Files'] = f'{name}.txt, {name}.collapsed'
+        return response
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Lets user.routers.ReplicaRouter send the reads of safe requests to the
+    replicas, and remembers clients whose request wrote, or was unsafe, so
+    their next DATABASE_ROUTING['STICKY_SECONDS'] of reads see the primary.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        key = sticky_key(request)
+        state = RoutingState(self.may_use_replicas(request, key and cache.get(key)))
+        token = routing_state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            routing_state.reset(token)
+        if key and self.is_sticky(request, state):
+            cache.set(key, True, timeout=get_setting('DATABASE_ROUTING', 'STICKY_SECONDS'))
+        return response
+
+    async def __acall__(self, request):
+        key = sticky_key(request)
+        state = RoutingState(self.may_use_replicas(request, key and await cache.aget(key)))
+        token = routing_state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            routing_state.reset(token)
+        if key and self.is_sticky(request, state):
+            await cache.aset(key, True, timeout=get_setting('DATABASE_ROUTING', 'STICKY_SECONDS'))
+        return response
+
+    def may_use_replicas(self, request, wrote_recently):
+        return bool(get_setting('DATABASE_ROUTING', 'REPLICAS')) and request.method in SAFE_METHODS and not wrote_recently
+
+    def is_sticky(self, request, state):
+        return state.wrote or request.method not in SAFE_METHODS
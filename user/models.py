@@ -8,7 +8,7 @@ from django.utils.translation import gettext_lazy as _
 from mysite import settings
 
 from .manager import CustomUserManager
-from .utils import RolesChoices, BookingStates
+from .utils import RolesChoices, BookingStates, SlotStates
 
 
 class TimeStampModel(models.Model):
@@ -36,6 +36,9 @@ def __str__(self) -> str:
 class BarberProfile(TimeStampModel):
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='barber_profile')
     is_available = models.BooleanField(default=False)
+    # Denormalized from Review by user.reviews, so profiles show them without a query
+    review_count = models.IntegerField(default=0)
+    latest_reviews = models.JSONField(default=list, blank=True)
         
     def __str__(self) -> str:
         return self.user.email
@@ -44,6 +47,23 @@ class Slots(TimeStampModel):
     start_time = models.DateTimeField(null=True)
     end_time = models.DateTimeField(null=True)
     barber = models.ForeignKey(BarberProfile, on_delete=models.CASCADE, related_name='slots')
+    # Denormalized from Booking so free slots can be read without joining bookings.
+    # Kept in step with Booking in the same transaction by the booking views.
+    state = models.CharField(max_length=15, choices=SlotStates.states, default=SlotStates.FREE.value)
+
+    class Meta:
+        constraints = [
+            # Also the (barber, start_time) index behind barber and datetime window searches
+            models.UniqueConstraint(fields=['barber', 'start_time'], name='unique_barber_slot_start'),
+        ]
+        indexes = [
+            models.Index(fields=['barber', 'state', 'start_time'], name='slot_availability_idx'),
+            # Free slots in end time order, for the expiry task
+            models.Index(fields=['state', 'end_time'], name='slot_expiry_idx'),
+            # Slots of all barbers by start time: the admin's date drill-down
+            # and its first/last date
+            models.Index(fields=['start_time'], name='slot_start_time_idx'),
+        ]
     
 class Booking(TimeStampModel):
     customer = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='bookings')
@@ -52,10 +72,79 @@ class Booking(TimeStampModel):
     reason = models.TextField(blank=True, null=True)
     amount = models.PositiveIntegerField(blank=True, null=True)            
 
+    class Meta:
+        indexes = [
+            # Only ongoing bookings, which the expiry task looks up; stays small
+            # as bookings are completed or cancelled
+            models.Index(fields=['slot'], condition=models.Q(state=BookingStates.ONGOING.value), name='booking_ongoing_idx'),
+            # Booking search by state, joined to the slot
+            models.Index(fields=['state', 'slot'], name='booking_state_slot_idx'),
+        ]
+
+class DailyBookingRollup(TimeStampModel):
+    """
+    Number of bookings and sum of their amounts per barber, per day of the
+    slot's start time and per booking state. Kept current by user.rollups
+    as bookings change and recomputed by the ReconcileBookingRollups task.
+    """
+    barber = models.ForeignKey(BarberProfile, on_delete=models.CASCADE, related_name='booking_rollups')
+    day = models.DateField()
+    state = models.CharField(max_length=15, choices=BookingStates.states)
+    bookings = models.IntegerField(default=0)
+    amount = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['barber', 'state', 'day'], name='unique_booking_rollup'),
+        ]
+
+class ArchivedSlot(models.Model):
+    """
+    A finished slot moved out of Slots by user.archive, keeping its id and
+    timestamps. Expired slots and slots whose booking is completed or
+    cancelled are archived once they are older than the retention window.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    barber = models.ForeignKey(BarberProfile, on_delete=models.CASCADE, related_name='archived_slots')
+    start_time = models.DateTimeField(null=True)
+    end_time = models.DateTimeField(null=True)
+    state = models.CharField(max_length=15, choices=SlotStates.states)
+    created_at = models.DateTimeField()
+    modified_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['barber', 'start_time'], name='archived_slot_barber_idx'),
+        ]
+
+class ArchivedBooking(models.Model):
+    """
+    The booking of an ArchivedSlot, with the id it had in Booking.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    customer = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='archived_bookings')
+    slot = models.OneToOneField(ArchivedSlot, on_delete=models.CASCADE, related_name='booking')
+    state = models.CharField(max_length=15, choices=BookingStates.states)
+    reason = models.TextField(blank=True, null=True)
+    amount = models.PositiveIntegerField(blank=True, null=True)
+    created_at = models.DateTimeField()
+    modified_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
 class Review(TimeStampModel):
     review = models.TextField()
     barber = models.ForeignKey(BarberProfile, related_name='reviews', on_delete=models.CASCADE)
-    slot = models.ForeignKey(Slots, related_name='reviews', on_delete=models.CASCADE)
+    # A review keeps pointing at its slot after archival through archived_slot
+    slot = models.ForeignKey(Slots, related_name='reviews', null=True, on_delete=models.SET_NULL)
+    archived_slot = models.ForeignKey(ArchivedSlot, related_name='reviews', null=True, blank=True, on_delete=models.SET_NULL)
     customer = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='reviews', null=True, on_delete=models.SET_NULL)
 
+    class Meta:
+        indexes = [
+            # A barber's reviews newest first. The full-text index on review is
+            # created by user.reviews, as it differs between database backends.
+            models.Index(fields=['barber', '-id'], name='review_barber_latest_idx'),
+        ]
+
 
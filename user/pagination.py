@@ -0,0 +1,212 @@
+import base64
+import binascii
+import json
+from datetime import date, datetime
+from functools import reduce
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor (keyset) pagination over a unique composite ordering.
+
+    Instead of OFFSET, every page after the first is fetched with a
+    `(a, b) > (last_a, last_b)` predicate, so the cost of a page does not
+    depend on how deep the client has scrolled and the ordering index can be
+    used as a range scan. The last field of `ordering` must be unique
+    (normally `id`) to break ties. Fields prefixed with '-' are descending.
+    """
+    ordering = ('id',)
+    page_size = 50
+    max_page_size = 500
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def __init__(self, ordering=None, page_size=None):
+        if ordering is not None:
+            self.ordering = tuple(ordering)
+        if page_size is not None:
+            self.page_size = page_size
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset = self.page_queryset(queryset, request)
+        try:
+            rows = list(queryset)
+        except ValidationError:
+            raise NotFound(self.invalid_cursor_message)
+        return self.set_page(rows)
+
+    def paginate_querysets(self, querysets, request, view=None):
+        """
+        Paginate over the union of several querysets that share the ordering
+        fields and whose rows never tie on them, e.g. a table and its archive.
+        The ordering must be ascending.
+        Each is read with the same keyset predicate and the rows are merged.
+        """
+        rows = []
+        try:
+            for queryset in querysets:
+                rows.extend(self.page_queryset(queryset, request))
+        except ValidationError:
+            raise NotFound(self.invalid_cursor_message)
+        rows.sort(key=self.get_position)
+        return self.set_page(rows[:self.page_size + 1])
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """
+        Same as paginate_queryset, fetching the page with the async ORM.
+        """
+        queryset = self.page_queryset(queryset, request)
+        try:
+            rows = [row async for row in queryset]
+        except ValidationError:
+            raise NotFound(self.invalid_cursor_message)
+        return self.set_page(rows)
+
+    def page_queryset(self, queryset, request):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+
+        position = self.decode_cursor(request)
+        if position is not None:
+            position = self.clean_position(position, queryset.model)
+            queryset = queryset.filter(self.keyset_filter(position))
+
+        # Fetch one extra row to know whether another page exists without a COUNT(*)
+        return queryset.order_by(*self.ordering)[:self.page_size + 1]
+
+    def set_page(self, rows):
+        self.has_next = len(rows) > self.page_size
+        page = rows[:self.page_size]
+        self.next_position = self.get_position(page[-1]) if self.has_next else None
+        return page
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'results': data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_position))
+
+    def keyset_filter(self, position):
+        """
+        Build `(f0, f1, ...) > (v0, v1, ...)` as
+        `f0 >= v0 AND (f0 > v0 OR (f0 = v0 AND (f1, ...) > (v1, ...)))`,
+        with the comparisons reversed on descending fields. The leading
+        `>=` gives the planner a plain range condition on the first
+        indexed column.
+        """
+        fields = [(field.lstrip('-'), field.startswith('-'), value) for field, value in zip(self.ordering, position)]
+
+        def after(field, descending, value):
+            return Q(**{f"{field}__{'lt' if descending else 'gt'}": value})
+
+        condition = reduce(
+            lambda rest, item: after(*item) | (Q(**{item[0]: item[2]}) & rest),
+            reversed(fields[:-1]),
+            after(*fields[-1]),
+        )
+        first_field, descending, first_value = fields[0]
+        return Q(**{f"{first_field}__{'lte' if descending else 'gte'}": first_value}) & condition
+
+    def clean_position(self, position, model):
+        """
+        The cursor's values converted to and validated as the ordering
+        fields of `model`, so a tampered cursor is a 404 instead of an error
+        in the query.
+        """
+        cleaned = []
+        for field, value in zip(self.ordering, position):
+            # JSON objects, arrays and booleans are never positions, even where
+            # a field would coerce them
+            if not isinstance(value, (str, int, float)) or isinstance(value, bool):
+                raise NotFound(self.invalid_cursor_message)
+            try:
+                cleaned.append(ordering_field(model, field.lstrip('-')).clean(value, None))
+            except (ValidationError, TypeError, ValueError):
+                raise NotFound(self.invalid_cursor_message)
+        return cleaned
+
+    def get_position(self, instance):
+        position = []
+        for field in self.ordering:
+            field = field.lstrip('-')
+            # Rows from .values() and .values_list(named=True) are keyed by the full lookup path
+            if isinstance(instance, dict):
+                position.append(instance[field])
+                continue
+            if isinstance(instance, tuple):
+                position.append(getattr(instance, field))
+                continue
+            value = instance
+            for attr in field.split('__'):
+                value = getattr(value, attr)
+            position.append(value)
+        return position
+
+    def encode_cursor(self, position):
+        values = [value.isoformat() if isinstance(value, (date, datetime)) else value for value in position]
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(encoded.encode()).decode())
+        except (TypeError, ValueError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.ordering) or None in position:
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+
+def ordering_field(model, lookup):
+    """
+    The model field an ordering lookup such as 'slot__start_time' ends on.
+    """
+    *relations, name = lookup.split('__')
+    for relation in relations:
+        model = model._meta.get_field(relation).related_model
+    return model._meta.get_field(name)
+
+
+class SlotCursorPagination(KeysetPagination):
+    ordering = ('start_time', 'id')
+
+
+class BookingCursorPagination(KeysetPagination):
+    ordering = ('id',)
+
+
+class BookingSearchPagination(KeysetPagination):
+    ordering = ('slot__start_time', 'id')
+
+
+class ReviewCursorPagination(KeysetPagination):
+    ordering = ('-id',)
@@ -0,0 +1,106 @@
+import os
+import sys
+import time
+from collections import defaultdict
+
+
+def frame_label(code):
+    filename = os.path.basename(code.co_filename)
+    return f'{code.co_name} ({filename}:{code.co_firstlineno})'.replace(';', ',')
+
+
+def builtin_label(function):
+    return f"<built-in {getattr(function, '__qualname__', repr(function))}>".replace(';', ',')
+
+
+class StackProfiler:
+    """
+    Deterministic profiler that times every call made on the current thread
+    while it runs, keyed by the full call stack.
+
+    Results come out as a call tree (inclusive time, self time and calls per
+    stack path) and as collapsed stacks with self time in microseconds,
+    which flamegraph.pl, speedscope and similar tools read. Only meant for
+    profiling one request at a time: every call pays for the hook.
+    """
+
+    def __init__(self):
+        self.stack = []
+        # path -> [calls, inclusive seconds, self seconds]
+        self.paths = defaultdict(lambda: [0, 0.0, 0.0])
+        self.total = 0.0
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        sys.setprofile(self.profile)
+        return self
+
+    def __exit__(self, *exc_info):
+        sys.setprofile(None)
+        self.total = time.perf_counter() - self.started
+
+    def profile(self, frame, event, arg):
+        now = time.perf_counter()
+        if event == 'call' or event == 'c_call':
+            label = frame_label(frame.f_code) if event == 'call' else builtin_label(arg)
+            parent = self.stack[-1][0] if self.stack else None
+            path = f'{parent};{label}' if parent else label
+            self.stack.append([path, now, 0.0])
+        elif self.stack:
+            # Returns of frames entered before profiling started leave the stack empty
+            path, started, children = self.stack.pop()
+            elapsed = now - started
+            stats = self.paths[path]
+            stats[0] += 1
+            stats[1] += elapsed
+            stats[2] += elapsed - children
+            if self.stack:
+                self.stack[-1][2] += elapsed
+
+    def collapsed(self):
+        """
+        Collapsed stack lines, 'outer;inner;leaf <self microseconds>'.
+        """
+        return '\n'.join(
+            f'{path} {round(stats[2] * 1e6)}' for path, stats in sorted(self.paths.items()) if stats[2] >= 1e-6
+        ) + '\n'
+
+    def call_tree(self, min_fraction=0.01, top=20):
+        """
+        A text summary: the call tree pruned to paths that take at least
+        `min_fraction` of the profiled time, then the `top` functions by
+        self time over all paths.
+        """
+        children = defaultdict(list)
+        for path in self.paths:
+            parent, _, _ = path.rpartition(';')
+            children[parent].append(path)
+
+        threshold = self.total * min_fraction
+        lines = [
+            f'Profiled {self.total * 1000:.2f} ms. Paths under {min_fraction:.0%} are left out.',
+            '',
+            f"{'total ms':>10} {'self ms':>10} {'calls':>7}  function",
+        ]
+
+        def walk(parent, depth):
+            for path in sorted(children[parent], key=lambda path: self.paths[path][1], reverse=True):
+                calls, inclusive, own = self.paths[path]
+                if inclusive < threshold:
+                    continue
+                label = path.rpartition(';')[2]
+                lines.append(f"{inclusive * 1000:10.2f} {own * 1000:10.2f} {calls:7d}  {'  ' * depth}{label}")
+                walk(path, depth + 1)
+
+        walk('', 0)
+
+        functions = defaultdict(lambda: [0, 0.0])
+        for path, (calls, _, own) in self.paths.items():
+            function = functions[path.rpartition(';')[2]]
+            function[0] += calls
+            function[1] += own
+
+        lines += ['', f"{'self ms':>10} {'calls':>7}  function"]
+        for label, (calls, own) in sorted(functions.items(), key=lambda item: item[1][1], reverse=True)[:top]:
+            lines.append(f'{own * 1000:10.2f} {calls:7d}  {label}')
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,174 @@
+from django.db import connections, transaction
+from django.db.models import Count, F
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+
+from . import serializers
+from .conf import get_setting
+from .models import BarberProfile, Review
+
+
+SEARCH_INDEX = 'review_search_idx'
+
+
+def review_summary(review):
+    return dict(serializers.BarberReviewSerializer(review).data)
+
+
+def write_review(barber, customer, slot, text):
+    """
+    Save a review and add it to the barber's review count and latest
+    reviews in the same transaction.
+    """
+    with transaction.atomic():
+        review = Review.objects.create(barber=barber, customer=customer, slot=slot, review=text)
+        # The row lock makes concurrent reviews of a barber take turns, so none
+        # of them is lost from the latest reviews
+        latest = BarberProfile.objects.select_for_update().values_list('latest_reviews', flat=True).get(pk=barber.pk)
+        BarberProfile.objects.filter(pk=barber.pk).update(
+            review_count=F('review_count') + 1,
+            latest_reviews=[review_summary(review), *latest][:get_setting('REVIEWS', 'LATEST_COUNT')],
+            modified_at=timezone.now(),
+        )
+    return review
+
+
+def refresh_review_summaries(barber_ids):
+    """
+    Recompute the review count and latest reviews of the given barbers from
+    the Review table, after reviews were deleted or written in bulk.
+    """
+    barber_ids = sorted(set(barber_ids))
+    limit = get_setting('REVIEWS', 'LATEST_COUNT')
+    with transaction.atomic():
+        list(BarberProfile.objects.select_for_update().filter(pk__in=barber_ids).values_list('pk'))
+        counts = dict(
+            Review.objects.filter(barber_id__in=barber_ids).values('barber_id')
+            .annotate(reviews=Count('id')).values_list('barber_id', 'reviews')
+        )
+        for barber_id in barber_ids:
+            latest = Review.objects.filter(barber_id=barber_id).order_by('-id')[:limit]
+            BarberProfile.objects.filter(pk=barber_id).update(
+                review_count=counts.get(barber_id, 0),
+                latest_reviews=[review_summary(review) for review in latest],
+                modified_at=timezone.now(),
+            )
+
+
+def refresh_review_summaries_on_commit(barber_ids):
+    """
+    Refresh the review summaries of the given barbers once the current
+    transaction commits. Barbers queued by several calls in one transaction,
+    such as the post_delete signals of a queryset delete, are refreshed
+    together, once.
+    """
+    connection = transaction.get_connection()
+    if not hasattr(connection, 'pending_review_summaries'):
+        connection.pending_review_summaries = set()
+    pending = connection.pending_review_summaries
+    pending.update(pk for pk in barber_ids if pk is not None)
+
+    def refresh():
+        # The first callback of the transaction refreshes every queued barber,
+        # the others find nothing left; barbers queued by a rolled back
+        # transaction are only refreshed again, which is harmless
+        if pending:
+            barber_ids = list(pending)
+            pending.clear()
+            refresh_review_summaries(barber_ids)
+
+    transaction.on_commit(refresh)
+
+
+def refresh_all_review_summaries(batch_size=1000):
+    """
+    Recompute the review summaries of every barber, `batch_size` barbers per
+    transaction. Returns the number of barbers refreshed.
+    """
+    refreshed, last_id = 0, 0
+    while True:
+        barber_ids = list(
+            BarberProfile.objects.filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not barber_ids:
+            return refreshed
+        refresh_review_summaries(barber_ids)
+        refreshed += len(barber_ids)
+        last_id = barber_ids[-1]
+
+
+def search_vector():
+    from django.contrib.postgres.search import SearchVector
+    return SearchVector('review', config=get_setting('REVIEWS', 'SEARCH_CONFIG'))
+
+
+def fts_table():
+    return f'{Review._meta.db_table}_fts'
+
+
+def search_reviews(reviews, query):
+    """
+    Narrow `reviews` down to those containing every word of `query`, through
+    the full-text index create_search_index made: a GIN index over the
+    review's tsvector on PostgreSQL, an FTS5 table on SQLite. Other backends
+    fall back to scanning with icontains.
+    """
+    words = query.split()
+    if not words:
+        return reviews
+
+    connection = connections[reviews.db]
+    if connection.vendor == 'postgresql':
+        from django.contrib.postgres.search import SearchQuery
+        # The same expression as the index, so the planner can use it
+        return reviews.alias(search=search_vector()).filter(
+            search=SearchQuery(query, config=get_setting('REVIEWS', 'SEARCH_CONFIG')))
+
+    if connection.vendor == 'sqlite':
+        # Quoted, the words are matched as plain strings instead of FTS5 query syntax
+        match = ' '.join('"{}"'.format(word.replace('"', '""')) for word in words)
+        table = connection.ops.quote_name(fts_table())
+        return reviews.filter(id__in=RawSQL(f'SELECT rowid FROM {table} WHERE {table} MATCH %s', [match]))
+
+    for word in words:
+        reviews = reviews.filter(review__icontains=word)
+    return reviews
+
+
+def create_search_index(using):
+    """
+    Create the full-text index of Review.review unless it exists. Run after
+    every migrate; a SQLite table rebuild by a migration drops the FTS5
+    triggers, which are then recreated and the FTS5 table rebuilt.
+    """
+    connection = connections[using]
+    table = Review._meta.db_table
+
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            if SEARCH_INDEX in connection.introspection.get_constraints(cursor, table):
+                return
+        from django.contrib.postgres.indexes import GinIndex
+        with connection.schema_editor() as editor:
+            editor.add_index(Review, GinIndex(search_vector(), name=SEARCH_INDEX))
+
+    elif connection.vendor == 'sqlite':
+        fts, review_table = connection.ops.quote_name(fts_table()), connection.ops.quote_name(table)
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' AND name LIKE %s", [f'{fts_table()}_%'])
+            if cursor.fetchone()[0] == 3:
+                return
+            # Porter stemming, like the english configuration on PostgreSQL
+            cursor.execute(
+                f'CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5('
+                f"review, content={review_table}, content_rowid='id', tokenize='porter unicode61')")
+            cursor.execute(
+                f'CREATE TRIGGER IF NOT EXISTS {fts_table()}_insert AFTER INSERT ON {review_table} BEGIN '
+                f'INSERT INTO {fts}(rowid, review) VALUES (new.id, new.review); END')
+            cursor.execute(
+                f'CREATE TRIGGER IF NOT EXISTS {fts_table()}_delete AFTER DELETE ON {review_table} BEGIN '
+                f"INSERT INTO {fts}({fts}, rowid, review) VALUES ('delete', old.id, old.review); END")
+            cursor.execute(
+                f'CREATE TRIGGER IF NOT EXISTS {fts_table()}_update AFTER UPDATE OF review ON {review_table} BEGIN '
+                f"INSERT INTO {fts}({fts}, rowid, review) VALUES ('delete', old.id, old.review); "
+                f'INSERT INTO {fts}(rowid, review) VALUES (new.id, new.review); END')
+            cursor.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
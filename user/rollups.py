@@ -0,0 +1,160 @@
+import datetime
+from collections import defaultdict
+
+from django.db import connection, transaction
+from django.db.models import Count, Max, Min, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import ArchivedBooking, Booking, DailyBookingRollup
+
+
+def booking_day(start_time):
+    """
+    The rollup day of a slot start time, taken in the current time zone.
+    """
+    return timezone.localdate(start_time)
+
+
+class RollupDeltas:
+    """
+    Collects changes to DailyBookingRollup counters so a request that touches
+    several bookings writes them with a single statement.
+    """
+
+    def __init__(self):
+        self.deltas = defaultdict(lambda: [0, 0])
+
+    def add(self, barber_id, start_time, state, amount=None, sign=1):
+        delta = self.deltas[(barber_id, booking_day(start_time), state)]
+        delta[0] += sign
+        delta[1] += sign * (amount or 0)
+
+    def remove(self, barber_id, start_time, state, amount=None):
+        self.add(barber_id, start_time, state, amount, sign=-1)
+
+    def move(self, barber_id, start_time, old_state, old_amount, new_state, new_amount):
+        self.remove(barber_id, start_time, old_state, old_amount)
+        self.add(barber_id, start_time, new_state, new_amount)
+
+    def apply(self):
+        """
+        Add the collected deltas to their rollup rows, creating missing rows,
+        with one INSERT ... ON CONFLICT DO UPDATE. Call it inside the
+        transaction that changes the bookings.
+        """
+        rows = [
+            (barber_id, day, state, bookings, amount)
+            for (barber_id, day, state), (bookings, amount) in self.deltas.items()
+            if bookings or amount
+        ]
+        self.deltas.clear()
+        if rows:
+            apply_rollup_deltas(rows)
+
+
+def apply_rollup_deltas(rows):
+    """
+    Increment rollup counters by (barber_id, day, state, bookings, amount) rows.
+    The upsert is understood by both PostgreSQL and SQLite.
+    """
+    table = connection.ops.quote_name(DailyBookingRollup._meta.db_table)
+    now = timezone.now()
+    sql = (
+        f'INSERT INTO {table} (barber_id, day, state, bookings, amount, created_at, modified_at) '
+        f'VALUES (%s, %s, %s, %s, %s, %s, %s) '
+        f'ON CONFLICT (barber_id, state, day) DO UPDATE SET '
+        f'bookings = {table}.bookings + EXCLUDED.bookings, '
+        f'amount = {table}.amount + EXCLUDED.amount, '
+        f'modified_at = EXCLUDED.modified_at'
+    )
+    # Sorted so concurrent requests lock rollup rows in the same order
+    params = [(*row, now, now) for row in sorted(rows)]
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, params)
+
+
+def rollup_totals(barber, state, start_date=None, end_date=None):
+    """
+    Total bookings and amount of a barber in a state, read from the daily
+    rollups between start_date and end_date inclusive.
+    """
+    rollups = DailyBookingRollup.objects.filter(barber=barber, state=state)
+    if start_date:
+        rollups = rollups.filter(day__gte=start_date)
+    if end_date:
+        rollups = rollups.filter(day__lte=end_date)
+    return rollups.aggregate(bookings=Coalesce(Sum('bookings'), 0), amount=Coalesce(Sum('amount'), 0))
+
+
+def rollup_day_range():
+    """
+    The first and last day that has bookings, archived bookings or rollup
+    rows, or (None, None) when there are none.
+    """
+    days = []
+    for model in (Booking, ArchivedBooking):
+        bounds = model.objects.aggregate(first=Min('slot__start_time'), last=Max('slot__start_time'))
+        days += [booking_day(bound) for bound in bounds.values() if bound is not None]
+    bounds = DailyBookingRollup.objects.aggregate(first=Min('day'), last=Max('day'))
+    days += [bound for bound in bounds.values() if bound is not None]
+    return (min(days), max(days)) if days else (None, None)
+
+
+def reconcile_rollups(start_date=None, end_date=None):
+    """
+    Recompute the rollups of every day from start_date to end_date inclusive
+    from the Booking and ArchivedBooking tables, one day per transaction.
+    Either bound left out extends to the first or last day of the whole
+    history, which backfills rollups for bookings that predate them.
+
+    Returns the number of rollup rows whose counters were wrong.
+    """
+    if start_date is None or end_date is None:
+        first, last = rollup_day_range()
+        if first is None:
+            return 0
+        start_date = first if start_date is None else start_date
+        end_date = last if end_date is None else end_date
+
+    tz = timezone.get_current_timezone()
+    corrected = 0
+    day = start_date
+    while day <= end_date:
+        day_start = datetime.datetime.combine(day, datetime.time.min, tzinfo=tz)
+        day_end = day_start + datetime.timedelta(days=1)
+
+        with transaction.atomic():
+            # Lock the day's rollups before counting, so increments from bookings
+            # committed after the count wait and land on top of the new values
+            stored = {
+                (rollup.barber_id, rollup.state): rollup
+                for rollup in DailyBookingRollup.objects.select_for_update().filter(day=day)
+            }
+            # Archived bookings keep counting towards the rollups of their day
+            actual = {}
+            for model in (Booking, ArchivedBooking):
+                for row in (
+                    model.objects.filter(slot__start_time__gte=day_start, slot__start_time__lt=day_end)
+                    .values('slot__barber_id', 'state')
+                    .annotate(bookings=Count('id'), amount=Coalesce(Sum('amount'), 0))
+                ):
+                    bookings, amount = actual.get((row['slot__barber_id'], row['state']), (0, 0))
+                    actual[row['slot__barber_id'], row['state']] = (bookings + row['bookings'], amount + row['amount'])
+
+            for key, rollup in stored.items():
+                bookings, amount = actual.pop(key, (0, 0))
+                if (rollup.bookings, rollup.amount) != (bookings, amount):
+                    rollup.bookings, rollup.amount = bookings, amount
+                    rollup.save(update_fields=['bookings', 'amount', 'modified_at'])
+                    corrected += 1
+
+            # A row created meanwhile by a booking change wins; the next run corrects it
+            DailyBookingRollup.objects.bulk_create([
+                DailyBookingRollup(barber_id=barber_id, day=day, state=state, bookings=bookings, amount=amount)
+                for (barber_id, state), (bookings, amount) in actual.items()
+            ], ignore_conflicts=True)
+            corrected += len(actual)
+
+        day += datetime.timedelta(days=1)
+    return corrected
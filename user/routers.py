@@ -0,0 +1,100 @@
+import hashlib
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from .conf import get_setting
+
+
+STICKY_KEY = 'db:primary:{}'
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Read right after another request of the client created them, before it has
+# anything to be recognized by: its login session and API token
+PRIMARY_MODELS = {'sessions.session', 'authtoken.token'}
+
+
+class RoutingState:
+    """
+    Whether the current request may read from a replica, and whether it has
+    written to the primary since, after which it reads from the primary too.
+    """
+    __slots__ = ('use_replicas', 'wrote')
+
+    def __init__(self, use_replicas):
+        self.use_replicas = use_replicas
+        self.wrote = False
+
+
+# Set by ReplicaRoutingMiddleware for the request being served; code running
+# outside of a request (tasks, commands, shell) always uses the primary
+routing_state = ContextVar('routing_state', default=None)
+primary_only = ContextVar('primary_only', default=False)
+
+
+@contextmanager
+def read_from_primary():
+    """
+    Send the reads of the block to the primary, for data that must not lag
+    behind a write, such as what gets cached under a fresh cache version.
+    """
+    token = primary_only.set(True)
+    try:
+        yield
+    finally:
+        primary_only.reset(token)
+
+
+def sticky_key(request):
+    """
+    Cache key remembering that a client wrote recently, from its API token
+    or session cookie; None for anonymous clients without a session.
+    """
+    credentials = request.META.get('HTTP_AUTHORIZATION') or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    if not credentials:
+        return None
+    return STICKY_KEY.format(hashlib.sha256(credentials.encode()).hexdigest())
+
+
+class ReplicaRouter:
+    """
+    Sends reads of safe requests (GET, HEAD, OPTIONS) to a random one of
+    DATABASE_ROUTING['REPLICAS'], and everything else to the primary:
+    writes, reads inside a transaction (select_for_update among them),
+    reads of a request after it wrote, and reads of a client for
+    STICKY_SECONDS after any of its writes, so it reads its own writes.
+    Sessions and API tokens are always read from the primary. With no
+    replicas configured every query goes to the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        replicas = get_setting('DATABASE_ROUTING', 'REPLICAS')
+        state = routing_state.get()
+        if not replicas or state is None or not state.use_replicas or state.wrote or primary_only.get():
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block or model._meta.label_lower in PRIMARY_MODELS:
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        state = routing_state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *get_setting('DATABASE_ROUTING', 'REPLICAS')}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get the schema through replication
+        if db in get_setting('DATABASE_ROUTING', 'REPLICAS'):
+            return False
+        return None
+
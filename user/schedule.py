@@ -0,0 +1,72 @@
+import datetime
+
+from django.utils import timezone
+
+from .cache import bump_slot_versions
+from .conf import get_setting
+from .models import Slots
+
+
+def iter_slot_times(start_date, days, opening_hour, closing_hour, slot_minutes):
+    """
+    Yield (start_time, end_time) for every slot in the working hours of
+    `days` days beginning at `start_date`. Hours are in the current time zone.
+    """
+    tz = timezone.get_current_timezone()
+    length = datetime.timedelta(minutes=slot_minutes)
+
+    for offset in range(days):
+        day = start_date + datetime.timedelta(days=offset)
+        start_time = datetime.datetime.combine(day, datetime.time(hour=opening_hour), tzinfo=tz)
+        closing_time = datetime.datetime.combine(day, datetime.time.min, tzinfo=tz) + datetime.timedelta(hours=closing_hour)
+
+        while start_time + length <= closing_time:
+            yield start_time, start_time + length
+            start_time += length
+
+
+def generate_slots(barber_ids, days=None, start_date=None, opening_hour=None,
+                   closing_hour=None, slot_minutes=None, batch_size=None):
+    """
+    Create the slots of the given barbers for the next `days` days.
+
+    Slots that already exist for a barber at the same start time are skipped,
+    so running it again over the same window only fills in the gaps. Rows are
+    written with bulk_create in batches of `batch_size`.
+
+    Returns the number of slots created.
+    """
+    days = days or get_setting('BARBER_SCHEDULE', 'HORIZON_DAYS')
+    start_date = start_date or timezone.localdate()
+    opening_hour = get_setting('BARBER_SCHEDULE', 'OPENING_HOUR') if opening_hour is None else opening_hour
+    closing_hour = get_setting('BARBER_SCHEDULE', 'CLOSING_HOUR') if closing_hour is None else closing_hour
+    slot_minutes = slot_minutes or get_setting('BARBER_SCHEDULE', 'SLOT_MINUTES')
+    batch_size = batch_size or get_setting('BARBER_SCHEDULE', 'BATCH_SIZE')
+
+    if not 0 <= opening_hour < closing_hour <= 24:
+        raise ValueError('Opening hour must come before closing hour, both within 0-24.')
+
+    slot_times = list(iter_slot_times(start_date, days, opening_hour, closing_hour, slot_minutes))
+    if not slot_times:
+        return 0
+
+    barber_ids = list(barber_ids)
+    existing = set(
+        Slots.objects.filter(
+            barber_id__in=barber_ids,
+            start_time__gte=slot_times[0][0],
+            start_time__lte=slot_times[-1][0],
+        ).values_list('barber_id', 'start_time')
+    )
+
+    new_slots = [
+        Slots(barber_id=barber_id, start_time=start_time, end_time=end_time)
+        for barber_id in barber_ids
+        for start_time, end_time in slot_times
+        if (barber_id, start_time) not in existing
+    ]
+    # ignore_conflicts covers a concurrent run inserting the same slots in between
+    Slots.objects.bulk_create(new_slots, batch_size=batch_size, ignore_conflicts=True)
+    if new_slots:
+        bump_slot_versions({slot.barber_id for slot in new_slots})
+    return len(new_slots)
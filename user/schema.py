@@ -0,0 +1,93 @@
+import gzip
+import hashlib
+import json
+import logging
+import threading
+
+from django.conf import settings
+from drf_yasg import openapi
+from drf_yasg.app_settings import swagger_settings
+from drf_yasg.codecs import OpenAPICodecJson, yaml_dump
+
+from .conf import get_setting
+
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_MEDIA_TYPES = {
+    '.json': 'application/json',
+    '.yaml': 'application/yaml',
+}
+
+api_info = openapi.Info(
+    title="Barber Booking System API",
+    default_version='v1',
+    description="Test description",
+    terms_of_service="https://www.google.com/policies/terms/",
+    contact=openapi.Contact(email="contact@snippets.local"),
+    license=openapi.License(name="BSD License"),
+)
+
+
+def schema_path():
+    return get_setting('OPENAPI_SCHEMA', 'PATH') or settings.BASE_DIR / 'openapi.json'
+
+
+def render_schema():
+    """
+    The public schema of the live views as pretty-printed JSON bytes. It has
+    no host, so clients resolve the paths against the server they fetched it
+    from.
+    """
+    generator = swagger_settings.DEFAULT_GENERATOR_CLASS(api_info)
+    return OpenAPICodecJson(validators=[], pretty=True).encode(generator.get_schema(request=None, public=True))
+
+
+class SchemaVariant:
+    """
+    One encoding of the schema, with its gzip-compressed copy and ETag.
+    """
+    __slots__ = ('media_type', 'content', 'gzipped', 'etag')
+
+    def __init__(self, media_type, content):
+        self.media_type = media_type
+        self.content = content
+        self.gzipped = gzip.compress(content, mtime=0)
+        self.etag = '"{}"'.format(hashlib.sha256(content).hexdigest()[:32])
+
+
+class PrebuiltSchema:
+    """
+    The schema as JSON and YAML, built from the JSON document build_schema
+    wrote to OPENAPI_SCHEMA['PATH']. When that file is missing the schema is
+    rendered from the views instead, once per process.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.variants = None
+
+    def get(self, schema_format):
+        if self.variants is None:
+            with self.lock:
+                if self.variants is None:
+                    self.variants = self.load()
+        return self.variants.get(schema_format)
+
+    def load(self):
+        try:
+            content = schema_path().read_bytes()
+        except FileNotFoundError:
+            logger.warning('No prebuilt schema at %s, rendering it; run manage.py build_schema when deploying', schema_path())
+            content = render_schema()
+        return {
+            '.json': SchemaVariant(SCHEMA_MEDIA_TYPES['.json'], content),
+            '.yaml': SchemaVariant(SCHEMA_MEDIA_TYPES['.yaml'], yaml_dump(json.loads(content), binary=True)),
+        }
+
+    def clear(self):
+        with self.lock:
+            self.variants = None
+
+
+prebuilt_schema = PrebuiltSchema()
@@ -0,0 +1,109 @@
+import datetime
+import random
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+
+from .cache import bump_slot_versions
+from .models import BarberProfile, Booking, CustomUser, Review, Slots
+from .reviews import refresh_review_summaries
+from .rollups import reconcile_rollups
+from .schedule import generate_slots
+from .utils import BookingStates, RolesChoices, SlotStates
+
+
+SEED_EMAIL = '{prefix}-{role}-{index}@example.invalid'
+SEED_PASSWORD = 'Seed-password-1'
+
+CANCEL_REASONS = ['Running late', 'Feeling unwell', 'Changed plans', 'Booked by mistake', None]
+REVIEWS = [
+    'Great fade, will come back.',
+    'Quick and friendly.',
+    'Had to wait a bit but the cut was worth it.',
+    'Beard trim was spot on.',
+    'Not my best haircut.',
+]
+
+
+def seed_email(prefix, role, index):
+    return SEED_EMAIL.format(prefix=prefix, role=role.lower(), index=index)
+
+
+def seed_users(prefix):
+    return CustomUser.objects.filter(email__startswith=f'{prefix}-')
+
+
+def seed_data(barbers=20, customers=200, days=14, start_date=None, booked_ratio=0.6,
+              review_ratio=0.3, prefix='seed', batch_size=5000, rng=None):
+    """
+    Fill the database with synthetic barbers, customers, slots, bookings in
+    every BookingStates value and reviews, written with bulk_create.
+
+    Slots cover `days` days from `start_date` (default: half of them in the
+    past). Past bookings are mostly completed, future ones mostly ongoing,
+    and some of both are cancelled. Users have emails like
+    seed-customer-7@example.invalid and the password SEED_PASSWORD, hashed
+    once for all of them.
+
+    Returns the number of rows created per model.
+    """
+    rng = rng or random.Random()
+    start_date = start_date or timezone.localdate() - datetime.timedelta(days=days // 2)
+    now = timezone.now()
+    password = make_password(SEED_PASSWORD)
+
+    with transaction.atomic():
+        users = CustomUser.objects.bulk_create([
+            CustomUser(email=seed_email(prefix, role.value, index), password=password, role=role.value,
+                       first_name=role.value, last_name=str(index))
+            for role, count in ((RolesChoices.BARBER, barbers), (RolesChoices.CUSTOMER, customers))
+            for index in range(count)
+        ], batch_size=batch_size)
+        barber_profiles = BarberProfile.objects.bulk_create([
+            BarberProfile(user=user, is_available=rng.random() < 0.8) for user in users[:barbers]
+        ], batch_size=batch_size)
+        customer_ids = [user.pk for user in users[barbers:]]
+        barber_ids = [barber.pk for barber in barber_profiles]
+
+        slot_count = generate_slots(barber_ids, days=days, start_date=start_date, batch_size=batch_size)
+        slots = list(Slots.objects.filter(barber_id__in=barber_ids).values_list('pk', 'barber_id', 'start_time'))
+
+        booked_slots = rng.sample(slots, int(len(slots) * booked_ratio)) if customer_ids else []
+        bookings = []
+        reviews = []
+        for slot_id, barber_id, start_time in booked_slots:
+            customer_id = rng.choice(customer_ids)
+            if start_time < now:
+                state = BookingStates.COMPLETED if rng.random() < 0.8 else BookingStates.CANCELLED
+            else:
+                state = BookingStates.ONGOING if rng.random() < 0.85 else BookingStates.CANCELLED
+
+            bookings.append(Booking(
+                slot_id=slot_id, customer_id=customer_id, state=state.value,
+                reason=rng.choice(CANCEL_REASONS) if state == BookingStates.CANCELLED else None,
+                amount=rng.randrange(500, 5000, 50) if state == BookingStates.COMPLETED else None,
+            ))
+            if state == BookingStates.COMPLETED and rng.random() < review_ratio:
+                reviews.append(Review(
+                    barber_id=barber_id, slot_id=slot_id, customer_id=customer_id, review=rng.choice(REVIEWS)))
+
+        Booking.objects.bulk_create(bookings, batch_size=batch_size)
+        Review.objects.bulk_create(reviews, batch_size=batch_size)
+        booked_ids = [booking.slot_id for booking in bookings]
+        for offset in range(0, len(booked_ids), batch_size):
+            Slots.objects.filter(pk__in=booked_ids[offset:offset + batch_size]).update(state=SlotStates.BOOKED.value)
+
+        if bookings:
+            reconcile_rollups(start_date, start_date + datetime.timedelta(days=days))
+        if reviews:
+            refresh_review_summaries({review.barber_id for review in reviews})
+        bump_slot_versions(barber_ids)
+
+    return {
+        'users': len(users),
+        'barbers': len(barber_profiles),
+        'slots': slot_count,
+        'bookings': len(bookings),
+        'reviews': len(reviews),
+    }
@@ -71,7 +71,8 @@ class BarberSerializer(serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
     class Meta:
         model = models.BarberProfile
-        fields = ['user', 'is_available']
+        fields = ['user', 'is_available', 'review_count', 'latest_reviews']
+        read_only_fields = ['review_count', 'latest_reviews']
         
     
 
@@ -104,6 +105,12 @@ class ReviewSerializer(serializers.ModelSerializer):
 
     def __str__(self) -> str:
         return super().__str__()
+
+
+class BarberReviewSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = models.Review
+        fields = ['id', 'review', 'created_at']
     
 class BookingSerializer(DynamicFieldModelSerializer):
     barber = BarberSerializer(read_only=True)
@@ -114,4 +121,20 @@ class BookingSerializer(DynamicFieldModelSerializer):
     class Meta:
         model = models.Booking
         fields = ['reason', 'slot', 'barber', 'amount']
-    
+
+
+class BookingSearchSerializer(BookingSerializer):
+    """
+    A booking as the booking search lists it: with its id, state and
+    customer, which staff and barbers searching other people's bookings
+    need to tell them apart.
+    """
+    customer = UserSerializer(read_only=True)
+
+    class Meta(BookingSerializer.Meta):
+        fields = ['id', 'state', 'customer'] + BookingSerializer.Meta.fields
+
+
+class BatchBookingSerializer(serializers.Serializer):
+    slots = serializers.ListField(child=serializers.IntegerField(), allow_empty=False, max_length=50)
+    mode = serializers.ChoiceField(choices=['all_or_nothing', 'best_effort'], default='all_or_nothing')
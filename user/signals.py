@@ -0,0 +1,56 @@
+from django.db.models.signals import post_save, post_delete, post_migrate
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import invalidate_tokens, invalidate_user_tokens
+from .cache import bump_slot_versions
+from .models import CustomUser, Slots, Booking, Review
+from .reviews import create_search_index, refresh_review_summaries_on_commit
+
+
+@receiver([post_save, post_delete], sender=Slots)
+def invalidate_slot_cache_on_slot_change(sender, instance, **kwargs):
+    bump_slot_versions([instance.barber_id])
+
+
+@receiver([post_save, post_delete], sender=Booking)
+def invalidate_slot_cache_on_booking_change(sender, instance, **kwargs):
+    if Booking.slot.is_cached(instance):
+        barber_id = instance.slot.barber_id
+    else:
+        barber_id = Slots.objects.filter(pk=instance.slot_id).values_list('barber_id', flat=True).first()
+    bump_slot_versions([barber_id])
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_token_cache_on_token_delete(sender, instance, **kwargs):
+    invalidate_tokens([instance.key])
+
+
+@receiver(post_save, sender=CustomUser)
+def invalidate_token_cache_on_user_change(sender, instance, created, **kwargs):
+    # Cached tokens carry a copy of the user, so any update (deactivation,
+    # role or permission change) has to drop them
+    if not created:
+        invalidate_user_tokens(instance.pk)
+
+
+@receiver(post_delete, sender=Review)
+def refresh_review_summary_on_review_delete(sender, instance, **kwargs):
+    # Deleting many reviews refreshes each barber once, after the delete
+    # commits; a barber deleted with their reviews is simply not found
+    refresh_review_summaries_on_commit([instance.barber_id])
+
+
+@receiver(post_save, sender=Review)
+def refresh_review_summary_on_review_change(sender, instance, created, **kwargs):
+    # New reviews are added to the summary by write_review; edits, such as
+    # the admin's, are only picked up by a refresh
+    if not created:
+        refresh_review_summaries_on_commit([instance.barber_id])
+
+
+@receiver(post_migrate)
+def create_review_search_index(sender, using, **kwargs):
+    if sender.name == 'user':
+        create_search_index(using)
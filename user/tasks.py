@@ -1,22 +1,105 @@
-# from celery import shared_task
+import datetime
+import logging
+import time
 
-# from .models import BarberProfile, Slots
-# from django.utils import timezone
+from celery import shared_task
+from django.core.cache import cache
+from django.utils import timezone
 
-# @shared_task
-# def CheckSlotTime():
-#     slots = Slots.objects.all()
-#     current_time = timezone.now()
+from .archive import archive_history
+from .conf import get_setting
+from .expiry import expire_slots, resolve_stale_bookings
+from .models import BarberProfile
+from .rollups import reconcile_rollups
+from .schedule import generate_slots
 
-#     barbers = BarberProfile.objects.filter(is_available=True)
+logger = logging.getLogger(__name__)
 
-#     for slot in slots:
-#         if current_time > slot.end_time:
-#             print('Time is over. Setting slots to None')
-#             slot.start_time = None
-#             slot.end_time = None
-#             slot.customer = None
-#             slot.save()
 
-#         else:
-#             print('Time is not over')
\ No newline at end of file
+@shared_task
+def ExtendBarberSchedules(barbers_per_batch=200):
+    """
+    Nightly task that tops up every barber's slots to the configured horizon.
+    Existing slots are skipped, so a missed or repeated run is harmless.
+    """
+    days = get_setting('BARBER_SCHEDULE', 'HORIZON_DAYS')
+    barber_ids = BarberProfile.objects.order_by('pk').values_list('pk', flat=True)
+
+    created = 0
+    batch = []
+    for barber_id in barber_ids.iterator(chunk_size=barbers_per_batch):
+        batch.append(barber_id)
+        if len(batch) == barbers_per_batch:
+            created += generate_slots(batch, days=days)
+            batch = []
+    if batch:
+        created += generate_slots(batch, days=days)
+
+    logger.info('Extended barber schedules to %s days, %s slots created.', days, created)
+    return created
+
+
+@shared_task
+def ReconcileBookingRollups(days_back=7, days_ahead=None):
+    """
+    Recompute the daily booking rollups from the Booking table for a window
+    around today, correcting any drift from the incremental updates.
+    The window reaches forward over the schedule horizon because future
+    slots are booked and cancelled too. With days_back=None it reaches back
+    to the first booking, for changes to old bookings made outside the
+    booking views, such as in the admin.
+    """
+    today = timezone.localdate()
+    days_ahead = get_setting('BARBER_SCHEDULE', 'HORIZON_DAYS') if days_ahead is None else days_ahead
+    start_date = None if days_back is None else today - datetime.timedelta(days=days_back)
+    end_date = today + datetime.timedelta(days=days_ahead)
+
+    corrected = reconcile_rollups(start_date, end_date)
+    logger.info(
+        'Reconciled booking rollups from %s to %s, %s row(s) corrected.',
+        start_date or 'the first booking', end_date, corrected)
+    return corrected
+
+
+EXPIRY_LOCK_KEY = 'tasks:expire-slots:lock'
+EXPIRY_LOCK_TIMEOUT = 15 * 60
+
+
+@shared_task
+def ExpireSlots(chunk_size=None):
+    """
+    Periodic task that marks past free slots expired and resolves ongoing
+    bookings whose slot ended more than the grace period ago.
+
+    Runs overlapping on several workers are skipped through a cache lock;
+    without a shared cache the row-level SKIP LOCKED in user.expiry still
+    keeps concurrent runs apart.
+    """
+    if not cache.add(EXPIRY_LOCK_KEY, 1, timeout=EXPIRY_LOCK_TIMEOUT):
+        logger.info('Slot expiry is already running elsewhere, skipped.')
+        return None
+
+    try:
+        started = time.perf_counter()
+        expired = expire_slots(chunk_size=chunk_size)
+        resolved = resolve_stale_bookings(chunk_size=chunk_size)
+        logger.info(
+            'Expired %s slot(s) and resolved %s stale booking(s) in %.2fs.',
+            expired, resolved, time.perf_counter() - started)
+        return {'expired_slots': expired, 'resolved_bookings': resolved}
+    finally:
+        cache.delete(EXPIRY_LOCK_KEY)
+
+
+@shared_task
+def ArchiveHistory(batch_size=None, max_batches=None):
+    """
+    Nightly task that moves finished slots and bookings older than
+    settings.ARCHIVE['RETENTION_DAYS'] into the archive tables.
+    """
+    started = time.perf_counter()
+    moved = archive_history(batch_size=batch_size, max_batches=max_batches)
+    logger.info(
+        'Archived %s slot(s) and %s booking(s) in %s batch(es), %.2fs.',
+        moved['slots'], moved['bookings'], moved['batches'], time.perf_counter() - started)
+    return moved
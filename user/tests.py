@@ -1,3 +1,1951 @@
-from django.test import TestCase
+import base64
+import contextlib
+import csv
+import datetime
+import gzip
+import io
+import json
+import pickle
+import random
+import tempfile
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from unittest import skipUnless
+from unittest.mock import patch
 
-# Create your tests here.
+import yaml
+
+from django.contrib.admin import site
+from django.core.cache import cache, caches
+from django.core.checks import run_checks
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection, connections, transaction
+from django.http import HttpResponse
+from django.test import (
+    RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature,
+)
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient
+
+from . import serializers
+from .admin import CustomUserAdmin, EstimatedCountPaginator
+from .archive import archive_history
+from .authentication import CachedTokenAuthentication, invalidate_user_tokens, issue_token, local_token_cache
+from .availability import availability_index
+from .booking import delete_booking, save_booking_state
+from .cache import SLOT_CHANGES_KEY, bump_slot_versions, get_or_build, get_slot_version
+from .checks import check_shared_cache
+from .conf import DEFAULTS, get_setting
+from .expiry import expire_slots, resolve_stale_bookings
+from .fastserializers import booking_search_serializer, booking_serializer, slot_serializer
+from .imports import BarberImporter, ImportReport, SlotImporter
+from .middleware import ReplicaRoutingMiddleware, SQLInstrumentationMiddleware
+from .models import (
+    CustomUser, BarberProfile, Slots, Booking, Review, ArchivedSlot, ArchivedBooking, DailyBookingRollup,
+)
+from .reviews import refresh_review_summaries, search_reviews
+from .rollups import reconcile_rollups, rollup_totals
+from .routers import ReplicaRouter, RoutingState, read_from_primary, routing_state
+from .schedule import generate_slots
+from .schema import prebuilt_schema
+from .seed import seed_data, seed_users
+from .tasks import EXPIRY_LOCK_KEY, ExpireSlots, ExtendBarberSchedules, ReconcileBookingRollups
+from .urls import urlpatterns
+from .utils import BookingStates, RolesChoices, SlotStates, filter_bookings
+
+
+def encode_cursor(position):
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+
+class SlotListingTest(TestCase):
+    """
+    The slot listing filters by barber, window and status, pages through
+    (start_time, id) without overlapping or skipping slots that start at the
+    same time, runs the same queries however many slots a page holds, and
+    answers a tampered cursor with a 404.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = CustomUser.objects.create_user(email='customer@example.com', password=None)
+        cls.barbers = [
+            BarberProfile.objects.create(user=CustomUser.objects.create_user(
+                email=f'barber{index}@example.com', password=None, phone_number=str(index)))
+            for index in range(3)
+        ]
+        cls.start = datetime.datetime(2030, 3, 4, 9, tzinfo=datetime.timezone.utc)
+        # Every barber has a slot at each of three times, so pages end on ties
+        cls.slots = [
+            Slots.objects.create(
+                barber=barber, start_time=cls.start + datetime.timedelta(hours=hour),
+                end_time=cls.start + datetime.timedelta(hours=hour + 1))
+            for hour in range(3) for barber in cls.barbers
+        ]
+        for slot in cls.slots[::4]:
+            slot.state = SlotStates.BOOKED.value
+            slot.save()
+
+    def setUp(self):
+        cache.clear()
+
+    def list_ids(self, query='', path='/api/barber/slots/'):
+        ids, url = [], f'{path}?{query}'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, response.content)
+            ids += [slot['id'] for slot in response.json()['results']]
+            url = response.json()['next']
+        return ids
+
+    def test_filters(self):
+        barber = self.barbers[1]
+        self.assertEqual(self.list_ids(f'barber={barber.pk}'), [slot.pk for slot in self.slots if slot.barber == barber])
+
+        window = 'start=2030-03-04T10:00:00Z&end=2030-03-04T11:00:00Z'
+        self.assertEqual(self.list_ids(window), [slot.pk for slot in self.slots[3:6]])
+
+        booked = [slot.pk for slot in self.slots[::4]]
+        self.assertEqual(self.list_ids('status=booked'), booked)
+        self.assertEqual(self.list_ids('status=free'), [slot.pk for slot in self.slots if slot.pk not in booked])
+        self.assertEqual(self.list_ids(f'barber={barber.pk}&status=booked&{window}'), [self.slots[4].pk])
+
+        for query in ('status=cancelled', 'start=someday', 'barber=x'):
+            self.assertEqual(self.client.get(f'/api/barber/slots/?{query}').status_code, 400, query)
+
+    def test_pages_neither_overlap_nor_skip(self):
+        expected = [slot.pk for slot in sorted(self.slots, key=lambda slot: (slot.start_time, slot.pk))]
+        for path in ('/api/barber/slots/', '/api/barber/slots/async/'):
+            for query in ('page_size=2', 'page_size=2&serializer=fast', 'page_size=3', 'page_size=4&serializer=fast'):
+                self.assertEqual(self.list_ids(query, path), expected, (path, query))
+
+    def test_query_count_does_not_grow_with_rows(self):
+        def queries(query):
+            cache.clear()
+            with CaptureQueriesContext(connection) as context:
+                self.assertEqual(self.client.get(f'/api/barber/slots/?{query}').status_code, 200)
+            return len(context)
+
+        few = queries(f'barber={self.barbers[0].pk}&page_size=1')
+        self.assertEqual(queries('page_size=9'), few)
+        self.assertEqual(queries('page_size=9&serializer=fast'), few)
+        self.assertLessEqual(few, 1)
+
+    def test_tampered_cursor_is_not_found(self):
+        client = APIClient()
+        client.force_authenticate(self.customer)
+        barber = self.barbers[0]
+        Review.objects.create(barber=barber, customer=self.customer, slot=self.slots[0], review='Fine')
+        urls = ('/api/barber/slots/', '/api/barber/slots/async/', '/api/bookings/search/',
+                f'/api/barbers/{barber.pk}/reviews/')
+        cursors = [
+            encode_cursor(position)
+            for position in (['2024-01-01T00:00:00Z', 'abc'], [{'a': 1}, 1], [1, 2], [True, False], ['x'],
+                             ['2024-01-01T00:00:00Z', 10 ** 30], ['', 1], 'x')
+        ] + ['["x"]', 'not base64!', encode_cursor(['x']).rstrip('=') + '\xff']
+        for url in urls:
+            for cursor in cursors:
+                response = client.get(url, {'cursor': cursor})
+                self.assertEqual(response.status_code, 404, (url, cursor, response.content))
+
+        # A cursor from a page still works
+        response = client.get('/api/barber/slots/', {'page_size': 2})
+        self.assertEqual(client.get(response.json()['next']).status_code, 200)
+
+
+class SlotAvailabilityTest(TestCase):
+    """
+    Slots.state follows bookings being made, deleted and archived, and
+    rebuild_slot_availability reports drift from the Booking table with
+    --check and repairs it without.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = CustomUser.objects.create_user(email='customer@example.com', password=None)
+        cls.barber = BarberProfile.objects.create(user=CustomUser.objects.create_user(
+            email='barber@example.com', password=None, phone_number='1'))
+        start = timezone.now().replace(microsecond=0) + datetime.timedelta(days=1)
+        cls.slots = [
+            Slots.objects.create(
+                barber=cls.barber, start_time=start + datetime.timedelta(hours=hour),
+                end_time=start + datetime.timedelta(hours=hour + 1))
+            for hour in range(3)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer)
+
+    def state(self, slot):
+        return Slots.objects.values_list('state', flat=True).get(pk=slot.pk)
+
+    def rebuild(self, check=False):
+        out = io.StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('rebuild_slot_availability', check=check, stdout=out)
+        return out.getvalue()
+
+    def test_state_follows_bookings(self):
+        slot = self.slots[0]
+        self.assertEqual(self.client.post(f'/api/barber/slots/book/{slot.pk}/').status_code, 201)
+        self.assertEqual(self.state(slot), SlotStates.BOOKED.value)
+        self.assertEqual(self.client.post(f'/api/barber/slots/book/{slot.pk}/').status_code, 409)
+
+        self.assertEqual(self.client.delete(f'/api/barber/slots/delete/{slot.pk}/').status_code, 204)
+        self.assertEqual(self.state(slot), SlotStates.FREE.value)
+        self.assertIn('consistent', self.rebuild(check=True))
+
+        # A finished booking leaves with its slot, which stays booked in the archive
+        Slots.objects.filter(pk=slot.pk).update(
+            start_time=timezone.now() - datetime.timedelta(days=400),
+            end_time=timezone.now() - datetime.timedelta(days=400) + datetime.timedelta(hours=1))
+        self.assertEqual(self.client.post(f'/api/barber/slots/book/{slot.pk}/').status_code, 201)
+        Booking.objects.filter(slot=slot).update(state=BookingStates.COMPLETED.value, amount=100)
+        archive_history(retention_days=180)
+        self.assertFalse(Slots.objects.filter(pk=slot.pk).exists())
+        self.assertEqual(ArchivedSlot.objects.get(pk=slot.pk).state, SlotStates.BOOKED.value)
+        self.assertIn('consistent', self.rebuild(check=True))
+
+    def test_rebuild_repairs_drift(self):
+        booked, free, expired = self.slots
+        self.assertEqual(self.client.post(f'/api/barber/slots/book/{booked.pk}/').status_code, 201)
+        Slots.objects.filter(pk=booked.pk).update(state=SlotStates.FREE.value)
+        Slots.objects.filter(pk=free.pk).update(state=SlotStates.BOOKED.value)
+        Slots.objects.filter(pk=expired.pk).update(state=SlotStates.EXPIRED.value)
+
+        out = io.StringIO()
+        with self.assertRaises(CommandError):
+            call_command('rebuild_slot_availability', check=True, stdout=out)
+        self.assertIn('1 booked slot(s) marked free, 1 free slot(s) marked booked.', out.getvalue())
+        # Checking changes nothing
+        self.assertEqual(self.state(booked), SlotStates.FREE.value)
+
+        version = get_slot_version(self.barber.pk)
+        self.assertIn('1 marked booked, 1 marked free', self.rebuild())
+        self.assertEqual(
+            [self.state(slot) for slot in self.slots],
+            [SlotStates.BOOKED.value, SlotStates.FREE.value, SlotStates.EXPIRED.value])
+        self.assertNotEqual(get_slot_version(self.barber.pk), version)
+        self.assertIn('consistent', self.rebuild(check=True))
+
+
+@override_settings(TIME_ZONE='UTC')
+class ScheduleGeneratorTest(TestCase):
+    """
+    generate_slots lays out the working hours of every day in the window,
+    and running it again only fills in the slots that are missing.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.barbers = [
+            BarberProfile.objects.create(user=CustomUser.objects.create_user(
+                email=f'barber{index}@example.com', password=None, phone_number=str(index)))
+            for index in range(2)
+        ]
+
+    def test_generate_slots(self):
+        start_date = datetime.date(2030, 1, 7)
+        barber_ids = [barber.pk for barber in self.barbers]
+        options = {'start_date': start_date, 'opening_hour': 9, 'closing_hour': 12, 'slot_minutes': 50}
+
+        # 9:00, 9:50, 10:40; 11:30 would end after closing
+        self.assertEqual(generate_slots(barber_ids, days=2, **options), 2 * 2 * 3)
+        first = Slots.objects.filter(barber=self.barbers[0]).order_by('start_time').first()
+        self.assertEqual(first.start_time, datetime.datetime(2030, 1, 7, 9, tzinfo=datetime.timezone.utc))
+        self.assertEqual(first.end_time - first.start_time, datetime.timedelta(minutes=50))
+        self.assertEqual(first.state, SlotStates.FREE.value)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(generate_slots(
+                barber_ids, days=1, start_date=start_date, opening_hour=9, closing_hour=10, slot_minutes=90), 0)
+        self.assertEqual(generate_slots(barber_ids, days=2, **options), 0)
+
+        # A deleted slot and a third day are filled in, nothing else is duplicated
+        first.delete()
+        self.assertEqual(generate_slots(barber_ids, days=3, **options), 1 + 2 * 3)
+        self.assertEqual(Slots.objects.count(), 2 * 3 * 3)
+        self.assertEqual(
+            Slots.objects.values('barber', 'start_time').distinct().count(), Slots.objects.count())
+
+        with self.assertRaises(ValueError):
+            generate_slots(barber_ids, start_date=start_date, opening_hour=12, closing_hour=9)
+
+    @override_settings(BARBER_SCHEDULE={'OPENING_HOUR': 10, 'CLOSING_HOUR': 12, 'SLOT_MINUTES': 60, 'HORIZON_DAYS': 3})
+    def test_extend_schedules_task(self):
+        self.assertEqual(ExtendBarberSchedules(barbers_per_batch=1), 2 * 3 * 2)
+        self.assertEqual(ExtendBarberSchedules(barbers_per_batch=1), 0)
+        self.assertEqual(
+            set(Slots.objects.values_list('start_time__date', flat=True)),
+            {timezone.localdate() + datetime.timedelta(days=offset) for offset in range(3)})
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class ConcurrentBookingTest(TransactionTestCase):
+    """
+    Fires many parallel booking requests at a handful of slots, each from its
+    own thread and database connection, and checks every slot ends up with
+    exactly one booking while every losing request gets a clean 409.
+    """
+    attempts = 300
+    workers = 30
+    slot_count = 5
+
+    def setUp(self):
+        barber_user = CustomUser.objects.create_user(email='barber@example.com', password=None)
+        barber = BarberProfile.objects.create(user=barber_user)
+
+        start = timezone.now().replace(minute=0, second=0, microsecond=0)
+        self.slots = [
+            Slots.objects.create(
+                barber=barber,
+                start_time=start + datetime.timedelta(hours=hour),
+                end_time=start + datetime.timedelta(hours=hour + 1))
+            for hour in range(self.slot_count)
+        ]
+        self.customers = [
+            CustomUser.objects.create_user(email=f'customer{i}@example.com', password=None, phone_number=str(i))
+            for i in range(self.workers)
+        ]
+
+    def book(self, attempt):
+        slot = self.slots[attempt % self.slot_count]
+        customer = self.customers[attempt % self.workers]
+        client = APIClient()
+        client.force_authenticate(customer)
+        try:
+            response = client.post(f'/api/barber/slots/book/{slot.pk}/')
+            return slot.pk, response.status_code
+        finally:
+            connection.close()
+
+    def test_each_slot_has_exactly_one_winner(self):
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            results = list(executor.map(self.book, range(self.attempts)))
+
+        codes = Counter(code for _, code in results)
+        self.assertEqual(set(codes), {201, 409})
+        self.assertEqual(codes[201], self.slot_count)
+
+        winners = Counter(slot_id for slot_id, code in results if code == 201)
+        self.assertEqual(winners, Counter({slot.pk: 1 for slot in self.slots}))
+
+        self.assertEqual(Booking.objects.count(), self.slot_count)
+        self.assertEqual(Slots.objects.filter(state=SlotStates.BOOKED.value).count(), self.slot_count)
+
+
+class BatchBookingTest(TestCase):
+    """
+    An all-or-nothing batch books every slot or none of them; a best-effort
+    batch books the free slots and reports the rest.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = CustomUser.objects.create_user(email='customer@example.com', password=None)
+        cls.other = CustomUser.objects.create_user(email='other@example.com', password=None, phone_number='1')
+        barber = BarberProfile.objects.create(user=CustomUser.objects.create_user(
+            email='barber@example.com', password=None, phone_number='2'))
+        start = timezone.now().replace(microsecond=0) + datetime.timedelta(hours=1)
+        cls.slots = [
+            Slots.objects.create(
+                barber=barber, start_time=start + datetime.timedelta(hours=index),
+                end_time=start + datetime.timedelta(hours=index + 1))
+            for index in range(3)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer)
+
+    def book(self, slot_ids, **data):
+        return self.client.post('/api/barber/slots/book/batch/', {'slots': slot_ids, **data}, format='json')
+
+    def results(self, response):
+        return {result['slot']: result['status'] for result in response.data['Results']}
+
+    def test_all_or_nothing(self):
+        free, taken = self.slots[0].pk, self.slots[1].pk
+        other = APIClient()
+        other.force_authenticate(self.other)
+        self.assertEqual(other.post(f'/api/barber/slots/book/{taken}/').status_code, 201)
+
+        response = self.book([free, taken, 0])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['Booked'], 0)
+        self.assertEqual(self.results(response), {0: 'not_found', free: 'not_booked', taken: 'already_booked'})
+        self.assertEqual(Slots.objects.get(pk=free).state, SlotStates.FREE.value)
+        self.assertFalse(Booking.objects.filter(customer=self.customer).exists())
+
+        slot_ids = [self.slots[0].pk, self.slots[2].pk]
+        response = self.book(slot_ids + slot_ids[:1])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.results(response), dict.fromkeys(slot_ids, 'booked'))
+        self.assertEqual(
+            set(Booking.objects.filter(customer=self.customer).values_list('slot_id', flat=True)), set(slot_ids))
+        self.assertEqual(
+            Slots.objects.filter(pk__in=slot_ids, state=SlotStates.BOOKED.value).count(), 2)
+        self.assertEqual(rollup_totals(self.slots[0].barber, BookingStates.ONGOING.value)['bookings'], 3)
+
+    def test_best_effort(self):
+        taken = self.slots[1].pk
+        self.assertEqual(self.book([taken]).status_code, 201)
+
+        response = self.book([slot.pk for slot in self.slots] + [0], mode='best_effort')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['Booked'], 2)
+        self.assertEqual(self.results(response), {
+            self.slots[0].pk: 'booked', taken: 'already_booked', self.slots[2].pk: 'booked', 0: 'not_found'})
+        self.assertEqual(Booking.objects.filter(customer=self.customer).count(), 3)
+
+        response = self.book([taken], mode='best_effort')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['Booked'], 0)
+
+    def test_invalid_batches(self):
+        self.assertEqual(self.book([]).status_code, 400)
+        self.assertEqual(self.book(list(range(1, 52))).status_code, 400)
+        self.assertEqual(self.book([self.slots[0].pk], mode='some').status_code, 400)
+
+
+class BookingRollupTest(TestCase):
+    """
+    Report totals come from the daily rollups: booking changes move them
+    incrementally, and reconciling backfills bookings the rollups never saw
+    and corrects changes made behind their back.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = CustomUser.objects.create_user(email='admin@example.com', password=None, is_staff=True)
+        cls.customer = CustomUser.objects.create_user(email='customer@example.com', password=None, phone_number='1')
+        cls.barber = BarberProfile.objects.create(user=CustomUser.objects.create_user(
+            email='barber@example.com', password=None, phone_number='2'))
+        noon = datetime.datetime.combine(
+            timezone.localdate(), datetime.time(12), tzinfo=timezone.get_current_timezone())
+        cls.slots = [
+            Slots.objects.create(
+                barber=cls.barber, start_time=noon + datetime.timedelta(days=days, hours=hours),
+                end_time=noon + datetime.timedelta(days=days, hours=hours + 1))
+            for days, hours in ((-90, 0), (-30, 0), (-30, 1), (1, 0), (2, 0))
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def report(self, url, total_key):
+        response = self.client.post(url, {'email': 'barber@example.com'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.data[total_key], response.data['Total Amount']
+
+    def cancelled(self):
+        return self.report('/api/barber/slots/all-cancelled/', 'Total Cancelled Bookings')
+
+    def completed(self):
+        return self.report('/api/barber/slots/completed/', 'Total Completed Bookings')
+
+    def test_incremental_updates(self):
+        customer = APIClient()
+        customer.force_authenticate(self.customer)
+        slot_ids = [slot.pk for slot in self.slots[3:]]
+        for slot_id in slot_ids:
+            self.assertEqual(customer.post(f'/api/barber/slots/book/{slot_id}/').status_code, 201)
+        self.assertEqual(rollup_totals(self.barber, BookingStates.ONGOING.value)['bookings'], 2)
+
+        self.assertEqual(customer.put(f'/api/barber/slots/cancel/{slot_ids[0]}/', {'reason': 'Busy'}).status_code, 200)
+        self.assertEqual(customer.put(f'/api/barber/slots/complete/{slot_ids[1]}/', {'amount': 2500}).status_code, 200)
+        self.assertEqual(self.cancelled(), (1, 0))
+        self.assertEqual(self.completed(), (1, 2500))
+        self.assertEqual(rollup_totals(self.barber, BookingStates.ONGOING.value)['bookings'], 0)
+
+        self.assertEqual(customer.delete(f'/api/barber/slots/delete/{slot_ids[0]}/').status_code, 204)
+        self.assertEqual(self.cancelled(), (0, 0))
+        self.assertEqual(reconcile_rollups(), 0)
+
+    def test_racing_state_changes_count_once(self):
+        slot = self.slots[3]
+        booking = Booking.objects.create(slot=slot, customer=self.customer)
+        reconcile_rollups()
+        # Two requests load the ongoing booking, then cancel and complete it in turn
+        cancel, complete = Booking.objects.get(pk=booking.pk), Booking.objects.get(pk=booking.pk)
+        cancel.state = BookingStates.CANCELLED.value
+        serializer = serializers.BookingSerializer(cancel, data={'reason': 'Busy'}, fields=('reason',))
+        self.assertTrue(serializer.is_valid())
+        save_booking_state(serializer, slot)
+        complete.state = BookingStates.COMPLETED.value
+        serializer = serializers.BookingSerializer(complete, data={'amount': 900}, exclude=('reason',))
+        self.assertTrue(serializer.is_valid())
+        save_booking_state(serializer, slot)
+
+        self.assertEqual(rollup_totals(self.barber, BookingStates.ONGOING.value)['bookings'], 0)
+        self.assertEqual(self.cancelled(), (0, 0))
+        self.assertEqual(self.completed(), (1, 900))
+
+        # And a stale copy still deletes what the booking holds now
+        delete_booking(cancel, slot)
+        self.assertEqual(self.completed(), (0, 0))
+        self.assertEqual(reconcile_rollups(), 0)
+
+    def test_backfill_existing_bookings(self):
+        # Bookings written before the rollups existed, straight into the table
+        states = [BookingStates.CANCELLED, BookingStates.COMPLETED, BookingStates.COMPLETED]
+        for slot, state, amount in zip(self.slots, states, [None, 1000, 700]):
+            Booking.objects.create(slot=slot, customer=self.customer, state=state.value, amount=amount)
+        self.assertEqual(self.completed(), (0, 0))
+
+        out = io.StringIO()
+        call_command('reconcile_rollups', stdout=out)
+        # The cancelled day and the day with both completed bookings
+        self.assertIn('2 row(s) corrected', out.getvalue())
+        self.assertEqual(self.cancelled(), (1, 0))
+        self.assertEqual(self.completed(), (2, 1700))
+        self.assertEqual(
+            DailyBookingRollup.objects.order_by('day').first().day, timezone.localdate(self.slots[0].start_time))
+
+        # An old booking edited outside the booking views is only seen by a full reconcile
+        Booking.objects.filter(slot=self.slots[0]).update(state=BookingStates.COMPLETED.value, amount=300)
+        ReconcileBookingRollups()
+        self.assertEqual(self.completed(), (2, 1700))
+        ReconcileBookingRollups(days_back=None)
+        self.assertEqual(self.cancelled(), (0, 0))
+        self.assertEqual(self.completed(), (3, 2000))
+
+        with self.assertRaises(CommandError):
+            call_command('reconcile_rollups', start_date=datetime.date(2030, 1, 2), end_date=datetime.date(2030, 1, 1))
+
+
+class SlotListingCacheTest(TestCase):
+    """
+    Slot listings are served from the cache until a slot or booking of the
+    barber changes, which bumps the barber's version and the all-slots
+    version once the change commits.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = CustomUser.objects.create_user(email='customer@example.com', password=None)
+        cls.barbers = [
+            BarberProfile.objects.create(user=CustomUser.objects.create_user(
+                email=f'barber{index}@example.com', password=None, phone_number=str(index)))
+            for index in range(2)
+        ]
+        start = timezone.now().replace(microsecond=0) + datetime.timedelta(hours=1)
+        cls.slots = [
+            Slots.objects.create(
+                barber=cls.barbers[index % 2], start_time=start + datetime.timedelta(hours=index),
+                end_time=start + datetime.timedelta(hours=index + 1))
+            for index in range(4)
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def listing(self, query=''):
+        response = APIClient().get(f'/api/barber/slots/?{query}')
+        self.assertEqual(response.status_code, 200)
+        return [slot['id'] for slot in response.data['results']]
+
+    def test_versions_follow_changes(self):
+        barber, other = self.barbers
+        versions = [get_slot_version(barber.pk), get_slot_version(other.pk), get_slot_version()]
+
+        query = f'barber={barber.pk}&status=free'
+        self.assertEqual(self.listing(query), [self.slots[0].pk, self.slots[2].pk])
+        with self.assertNumQueries(0):
+            self.listing(query)
+            self.listing(query)
+
+        client = APIClient()
+        client.force_authenticate(self.customer)
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.assertEqual(client.post(f'/api/barber/slots/book/{self.slots[0].pk}/').status_code, 201)
+        # Nothing is bumped before the booking commits
+        self.assertEqual(get_slot_version(barber.pk), versions[0])
+        for callback in callbacks:
+            callback()
+
+        self.assertGreater(get_slot_version(barber.pk), versions[0])
+        self.assertEqual(get_slot_version(other.pk), versions[1])
+        self.assertGreater(get_slot_version(), versions[2])
+        self.assertEqual(self.listing(query), [self.slots[2].pk])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Slots.objects.filter(pk=self.slots[2].pk).get().delete()
+        self.assertEqual(self.listing(query), [])
+        self.assertEqual(self.listing(), [self.slots[0].pk, self.slots[1].pk, self.slots[3].pk])
+
+    def test_sync_and_async_listings_are_cached_apart(self):
+        client = APIClient()
+        for path in ('/api/barber/slots/', '/api/barber/slots/async/'):
+            response = client.get(f'{path}?page_size=2')
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.json()['next'].startswith(f'http://testserver{path}?'), path)
+
+    def test_lost_version_restarts_from_the_clock(self):
+        version = get_slot_version(self.barbers[0].pk)
+        cache.clear()
+        self.assertGreater(get_slot_version(self.barbers[0].pk), version)
+
+    def test_single_flight_rebuild(self):
+        builds = []
+
+        def build():
+            builds.append(1)
+            return len(builds)
+
+        self.assertEqual(get_or_build('listing', build, 60), 1)
+        self.assertEqual(get_or_build('listing', build, 60), 1)
+
+        # While another worker holds the lock the value is waited for, then built here
+        cache.add('other:lock', 1)
+        with patch('user.cache.REBUILD_WAIT', 0.1):
+            self.assertEqual(get_or_build('other', build, 60), 2)
+        self.assertIsNone(cache.get('other'))
+
+    def test_bumps_from_other_processes(self):
+        # Two aliases on one directory stand for a web process and a Celery worker sharing a cache
+        with tempfile.TemporaryDirectory() as directory, override_settings(CACHES={
+            alias: {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directory}
+            for alias in ('default', 'worker')
+        }):
+            version = get_slot_version()
+            query = f'barber={self.barbers[0].pk}'
+            self.assertEqual(self.listing(query), [self.slots[0].pk, self.slots[2].pk])
+
+            with patch('user.cache.cache', caches['worker']), self.captureOnCommitCallbacks(execute=True):
+                Slots.objects.filter(pk=self.slots[0].pk).get().delete()
+            self.assertGreater(get_slot_version(), version)
+            self.assertEqual(self.listing(query), [self.slots[2].pk])
+
+
+class CachedTokenAuthenticationTest(TestCase):
+    """
+    Cached tokens authenticate without queries, keep the password hash out
+    of the cache, and stop working the moment their token or user changes,
+    without evicting anyone else's.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(email='customer@example.com', password='secret-password')
+        cls.other = CustomUser.objects.create_user(email='other@example.com', password=None, phone_number='1')
+        cls.token = Token.objects.create(user=cls.user)
+        cls.other_token = Token.objects.create(user=cls.other)
+
+    def setUp(self):
+        cache.clear()
+        local_token_cache.clear()
+
+    def authenticate(self, key):
+        request = RequestFactory().get('/api/profile/', HTTP_AUTHORIZATION=f'Token {key}')
+        return CachedTokenAuthentication().authenticate(Request(request))
+
+    def test_cached_lookup(self):
+        with self.assertNumQueries(1):
+            user, token = self.authenticate(self.token.key)
+        self.assertEqual((user.pk, user.email, token.key), (self.user.pk, self.user.email, self.token.key))
+
+        with self.assertNumQueries(0):
+            user, token = self.authenticate(self.token.key)
+        self.assertEqual((user.pk, user.role, token.user_id), (self.user.pk, self.user.role, self.user.pk))
+        # Another process only has the shared cache
+        local_token_cache.clear()
+        with self.assertNumQueries(0):
+            self.authenticate(self.token.key)
+
+        cached = pickle.dumps(cache.get(f'auth:token:{self.token.key}'))
+        self.assertNotIn(self.user.password.encode(), cached)
+        self.assertNotIn(b'password', cached)
+        # The password is loaded when something asks for it
+        with self.assertNumQueries(1):
+            self.assertTrue(user.check_password('secret-password'))
+
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate('0' * 40)
+
+    def test_logout(self):
+        self.authenticate(self.token.key)
+        self.authenticate(self.other_token.key)
+
+        client = APIClient()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.post('/api/logout/', HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.assertEqual(response.status_code, 200)
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(self.token.key)
+        with self.assertNumQueries(0):
+            self.authenticate(self.other_token.key)
+
+    def test_user_update(self):
+        self.authenticate(self.token.key)
+        self.authenticate(self.other_token.key)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            user = CustomUser.objects.get(pk=self.user.pk)
+            user.role = RolesChoices.BARBER.value
+            user.save()
+        self.assertEqual(self.authenticate(self.token.key)[0].role, RolesChoices.BARBER.value)
+        with self.assertNumQueries(0):
+            self.authenticate(self.other_token.key)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            user.is_active = False
+            user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(self.token.key)
+
+    def test_token_rotation(self):
+        self.authenticate(self.token.key)
+        with self.captureOnCommitCallbacks(execute=True):
+            new_key = issue_token(self.user, rotate=True)
+        self.assertNotEqual(new_key, self.token.key)
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(self.token.key)
+        self.assertEqual(self.authenticate(new_key)[0].pk, self.user.pk)
+        self.assertEqual(issue_token(self.user), new_key)
+
+    def test_invalidation_waits_for_commit(self):
+        self.authenticate(self.token.key)
+        with self.captureOnCommitCallbacks() as callbacks:
+            CustomUser.objects.filter(pk=self.user.pk).update(is_active=False)
+            invalidate_user_tokens(self.user.pk)
+        self.assertEqual(len(callbacks), 1)
+        with self.assertNumQueries(0):
+            self.authenticate(self.token.key)
+        callbacks[0]()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(self.token.key)
+
+    def test_revocation_reaches_other_processes(self):
+        # Two aliases on one directory stand for two processes sharing a cache
+        with tempfile.TemporaryDirectory() as directory, override_settings(CACHES={
+            alias: {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directory}
+            for alias in ('default', 'worker')
+        }):
+            key = self.token.key
+            self.authenticate(key)
+            # The logout is handled by another process, this one keeps its LRU entry
+            with patch('user.authentication.cache', caches['worker']), self.captureOnCommitCallbacks(execute=True):
+                self.token.delete()
+            self.assertIsNotNone(local_token_cache.get(key))
+            with self.assertRaises(AuthenticationFailed):
+                self.authenticate(key)
+
+    def test_process_local_cache_is_flagged(self):
+        self.assertEqual([warning.id for warning in check_shared_cache(None)], ['user.W001'])
+        self.assertIn('user.W001', [message.id for message in run_checks(include_deployment_checks=True)])
+        with override_settings(CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://cache:6379/0'}}):
+            self.assertEqual(check_shared_cache(None), [])
+
+
+@override_settings(PASSWORD_HASHER_ITERATIONS=1000)
+class LoginTokenTest(TransactionTestCase):
+    """
+    Logging in writes at most one token row: none for a returning user, one
+    UPDATE when tokens rotate. The async login checks the password on its
+    thread pool, so it runs against committed users here.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user(email='customer@example.com', password='secret-password')
+
+    def login(self, url='/api/login/', password='secret-password'):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                url, {'email': 'customer@example.com', 'password': password}, content_type='application/json')
+        writes = [
+            query['sql'] for query in queries
+            if 'authtoken_token' in query['sql'] and not query['sql'].startswith('SELECT')]
+        return response, writes
+
+    def test_login_writes_at_most_one_token_row(self):
+        response, writes = self.login()
+        self.assertEqual(response.status_code, 200)
+        key = response.json()['Token']
+        self.assertEqual(len(writes), 1)
+        self.assertTrue(writes[0].startswith('INSERT'))
+
+        response, writes = self.login()
+        self.assertEqual(response.json()['Token'], key)
+        self.assertEqual(writes, [])
+
+        with override_settings(AUTH_ROTATE_TOKEN_ON_LOGIN=True):
+            response, writes = self.login()
+        new_key = response.json()['Token']
+        self.assertNotEqual(new_key, key)
+        self.assertEqual(len(writes), 1)
+        self.assertTrue(writes[0].startswith('UPDATE'))
+        self.assertEqual(list(Token.objects.values_list('key', flat=True)), [new_key])
+        self.assertEqual(self.client.get('/api/profile/', HTTP_AUTHORIZATION=f'Token {key}').status_code, 401)
+        self.assertEqual(self.client.get('/api/profile/', HTTP_AUTHORIZATION=f'Token {new_key}').status_code, 200)
+
+        self.assertEqual(self.login(password='wrong')[0].status_code, 401)
+
+    def test_async_login(self):
+        response, writes = self.login('/api/login/async/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['Token'], Token.objects.get(user=self.user).key)
+        self.assertEqual(self.login('/api/login/async/')[0].json(), response.json())
+
+        self.assertEqual(self.login('/api/login/async/', password='wrong')[0].status_code, 401)
+        self.assertEqual(self.client.post(
+            '/api/login/async/', 'not json', content_type='application/json').status_code, 400)
+        self.assertEqual(self.client.post(
+            '/api/login/async/', {'email': 'customer@example.com'}, content_type='application/json').status_code, 400)
+
+    def test_rehash_on_new_work_factor(self):
+        self.assertIn('$1000$', self.user.password)
+        with override_settings(PASSWORD_HASHER_ITERATIONS=1200):
+            self.assertEqual(self.login()[0].status_code, 200)
+        self.user.refresh_from_db()
+        self.assertIn('$1200$', self.user.password)
+
+
+class FastSerializerParityTest(TestCase):
+    """
+    The fast serializers must render exactly the bytes the DRF serializers
+    they mirror render, including nulls, time zones and microseconds.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        customer = CustomUser.objects.create_user(email='customer@example.com', password=None, phone_number='100')
+        barbers = [
+            BarberProfile.objects.create(user=CustomUser.objects.create_user(
+                email=f'barber{index}@example.com', password=None, phone_number=phone))
+            for index, phone in enumerate(['200', None])
+        ]
+
+        start = datetime.datetime(2024, 3, 10, 23, 30, 15, 123456, tzinfo=datetime.timezone.utc)
+        for index in range(6):
+            slot = Slots.objects.create(
+                barber=barbers[index % 2],
+                start_time=start + datetime.timedelta(hours=index),
+                end_time=None if index == 5 else start + datetime.timedelta(hours=index + 1),
+                state=SlotStates.BOOKED.value if index < 4 else SlotStates.FREE.value,
+            )
+            if index < 4:
+                Booking.objects.create(
+                    slot=slot, customer=customer,
+                    state=[BookingStates.ONGOING, BookingStates.COMPLETED, BookingStates.CANCELLED][index % 3].value,
+                    reason=[None, '', 'Late \u2013 caf\u00e9 "closed"', 'x' * 300][index],
+                    amount=[None, 0, 1500, 2 ** 31 - 1][index],
+                )
+
+    def setUp(self):
+        cache.clear()
+
+    def assertSameJSON(self, drf_data, fast_data):
+        renderer = JSONRenderer()
+        self.assertEqual(renderer.render(fast_data), renderer.render(drf_data))
+
+    def check_parity(self):
+        slots = Slots.objects.select_related('barber__user').order_by('start_time', 'id')
+        self.assertSameJSON(
+            serializers.SlotSerializer(slots, many=True).data,
+            slot_serializer.serialize(slot_serializer.values(slots)))
+
+        bookings = Booking.objects.select_related('slot__barber__user').order_by('id')
+        self.assertSameJSON(
+            serializers.BookingSerializer(bookings, many=True).data,
+            booking_serializer.serialize(booking_serializer.values(bookings)))
+
+        bookings = bookings.select_related('customer')
+        self.assertSameJSON(
+            serializers.BookingSearchSerializer(bookings, many=True).data,
+            booking_search_serializer.serialize(booking_search_serializer.values(bookings)))
+
+    def test_parity(self):
+        self.check_parity()
+
+    @override_settings(TIME_ZONE='UTC')
+    def test_parity_in_utc(self):
+        self.check_parity()
+
+    def test_slot_listing_endpoint(self):
+        client = APIClient()
+        pages = {}
+        for choice in ('drf', 'fast'):
+            results, url = [], f'/api/barber/slots/?page_size=4&serializer={choice}'
+            while url:
+                response = client.get(url)
+                self.assertEqual(response.status_code, 200)
+                results += response.data['results']
+                url = response.data['next']
+            pages[choice] = results
+        self.assertEqual(len(pages['fast']), 6)
+        self.assertSameJSON(pages['drf'], pages['fast'])
+
+    def test_booking_report_endpoint(self):
+        admin = CustomUser.objects.create_user(email='admin@example.com', password=None, is_staff=True)
+        client = APIClient()
+        client.force_authenticate(admin)
+
+        rows = {}
+        for choice in ('drf', 'fast'):
+            response = client.post(
+                f'/api/barber/slots/all-cancelled/?serializer={choice}',
+                {'email': 'barber0@example.com', 'include_bookings': True}, format='json')
+            self.assertEqual(response.status_code, 200)
+            rows[choice] = response.data['All Cancelled Bookings']
+        self.assertEqual(len(rows['fast']), 1)
+        self.assertSameJSON(rows['drf'], rows['fast'])
+
+
+@override_settings(PASSWORD_HASHER_ITERATIONS=1000)
+class EndpointBenchmarkTest(TransactionTestCase):
+    """
+    Smoke test of seed_data and benchmark_endpoints: every route gets a
+    request, none of them fails with a server error and the JSON report
+    holds the measurements. The seeded data is committed, as it is outside
+    of tests, so the async login's thread pool sees the users it logs in.
+    """
+
+    def test_benchmark_covers_every_route(self):
+        counts = seed_data(barbers=2, customers=5, days=4, rng=random.Random(0))
+        self.assertTrue(counts['bookings'])
+        self.assertEqual(
+            set(Booking.objects.values_list('state', flat=True).distinct()),
+            {state.value for state in BookingStates})
+
+        login = contextlib.nullcontext()
+        if connection.vendor == 'sqlite':
+            # The in-memory test database locks the users table the benchmark's
+            # transaction wrote to against every other connection, so the pool
+            # thread checks the password against users read up front instead
+            users = {user.email: user for user in seed_users('seed')}
+
+            def authenticate_seeded(email, password):
+                user = users.get(email)
+                return user if user and user.check_password(password) else None
+
+            login = patch('user.async_views.authenticate_off_thread', authenticate_seeded)
+
+        with tempfile.NamedTemporaryFile(suffix='.json') as output, login:
+            call_command('benchmark_endpoints', iterations=1, warmup=0, output=output.name, stdout=io.StringIO())
+            report = json.load(output)
+
+        self.assertEqual(set(report['endpoints']), {str(pattern.pattern) for pattern in urlpatterns})
+        for route, result in report['endpoints'].items():
+            self.assertTrue(all(int(code) < 500 for code in result['status']), (route, result['status']))
+            self.assertGreaterEqual(result['p95_ms'], result['p50_ms'])
+        for route in ('login/', 'login/async/', 'profile/', 'profile/async/'):
+            self.assertEqual(report['endpoints'][route]['status'], {'200': 1}, route)
+
+
+class SQLInstrumentationTest(TestCase):
+    """
+    Only a sample of requests is instrumented unless the force header is
+    sent, partial SQL_INSTRUMENTATION settings keep the other defaults, and
+    staff get the figures back in response headers.
+    """
+
+    def setUp(self):
+        cache.clear()
+
+    def test_defaults_and_overrides(self):
+        self.assertEqual(SQLInstrumentationMiddleware(HttpResponse).sample_rate, DEFAULTS['SQL_INSTRUMENTATION']['SAMPLE_RATE'])
+        with override_settings(SQL_INSTRUMENTATION={'SAMPLE_RATE': 1.0}):
+            middleware = SQLInstrumentationMiddleware(HttpResponse)
+            self.assertEqual(get_setting('SQL_INSTRUMENTATION', 'QUERY_BUDGET'), 50)
+        self.assertEqual((middleware.sample_rate, middleware.query_budget), (1.0, 50))
+
+    @override_settings(SQL_INSTRUMENTATION={'SAMPLE_RATE': 0.0})
+    def test_forced_request_reports_to_staff(self):
+        admin = CustomUser.objects.create_user(email='admin@example.com', password=None, is_staff=True)
+        staff = {'HTTP_AUTHORIZATION': f'Token {Token.objects.create(user=admin).key}'}
+        response = self.client.get('/api/profile/', **staff)
+        self.assertNotIn('X-SQL-Queries', response)
+
+        response = self.client.get('/api/profile/', HTTP_X_SQL_INSTRUMENT='1', **staff)
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(int(response['X-SQL-Queries']), 0)
+        self.assertIn('X-SQL-Time-Ms', response)
+
+        response = self.client.get('/api/barber/slots/', HTTP_X_SQL_INSTRUMENT='1')
+        self.assertNotIn('X-SQL-Queries', response)
+
+
+class RequestProfilingTest(TestCase):
+    """
+    Staff get a call tree or collapsed stacks of the request instead of its
+    response, or have both written to the profile directory; everyone
+    else's requests are served as usual.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = CustomUser.objects.create_user(email='admin@example.com', password=None, is_staff=True)
+        cls.customer = CustomUser.objects.create_user(email='customer@example.com', password=None)
+        cls.admin_token = Token.objects.create(user=cls.admin)
+        cls.customer_token = Token.objects.create(user=cls.customer)
+
+    def setUp(self):
+        cache.clear()
+        local_token_cache.clear()
+
+    def get_profile(self, token, **extra):
+        return self.client.get('/api/profile/', HTTP_AUTHORIZATION=f'Token {token.key}', **extra)
+
+    def test_tree_and_collapsed(self):
+        response = self.get_profile(self.admin_token, HTTP_X_PROFILE='tree')
+        self.assertEqual(response['Content-Type'], 'text/plain; charset=utf-8')
+        tree = response.content.decode()
+        self.assertTrue(tree.startswith('Profiled '))
+        self.assertIn('Profile (views.py:', tree)
+
+        response = self.client.get(
+            '/api/profile/?_profile=collapsed', HTTP_AUTHORIZATION=f'Token {self.admin_token.key}')
+        lines = response.content.decode().splitlines()
+        self.assertTrue(lines)
+        for line in lines:
+            stack, _, microseconds = line.rpartition(' ')
+            self.assertTrue(stack)
+            self.assertGreater(int(microseconds), 0)
+        self.assertTrue(any('Profile (views.py:' in line for line in lines))
+
+    def test_only_staff_are_profiled(self):
+        for extra in ({'HTTP_X_PROFILE': 'tree'}, {'HTTP_X_PROFILE': 'unknown'}, {}):
+            response = self.get_profile(self.customer_token, **extra)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data['User Profile']['email'], self.customer.email)
+        response = self.client.get('/api/barber/slots/', HTTP_X_PROFILE='tree', HTTP_AUTHORIZATION='Token invalid')
+        self.assertNotEqual(response.get('Content-Type'), 'text/plain; charset=utf-8')
+
+    def test_save_writes_both_files(self):
+        with tempfile.TemporaryDirectory() as directory, \
+                override_settings(REQUEST_PROFILING={'DIRECTORY': directory}):
+            response = self.get_profile(self.admin_token, HTTP_X_PROFILE='save')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data['User Profile']['email'], self.admin.email)
+            files = response['X-Profile-Files'].split(', ')
+            self.assertEqual(sorted(Path(name).suffix for name in files), ['.collapsed', '.txt'])
+            self.assertEqual(
+                sorted(path.name for path in Path(directory).iterdir()), sorted(Path(name).name for name in files))
+            self.assertIn('-GET-api-profile.', files[0])
+            self.assertTrue(Path(files[0]).read_text().startswith('Profiled '))
+
+
+class SlotExpiryTest(TransactionTestCase):
+    """
+    Past free slots are expired and ongoing bookings past the grace period
+    resolved chunk by chunk, with the rollups and cached slot versions kept
+    in step; rows another worker holds are skipped, not waited on, and
+    overlapping task runs are skipped through the cache lock.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.barber = BarberProfile.objects.create(user=CustomUser.objects.create_user(
+            email='barber@example.com', password=None, phone_number='1'))
+        self.customer = CustomUser.objects.create_user(email='customer@example.com', password=None)
+        self.now = timezone.now()
+        self.past = [self.add_slot(-hours) for hours in (4, 3, 2)]
+        self.future = self.add_slot(2)
+        # Ended two days ago, past the grace period, and an hour ago, within it
+        self.stale = self.add_booking(-48)
+        self.recent = self.add_booking(-1)
+        reconcile_rollups()
+
+    def add_slot(self, hours, state=SlotStates.FREE):
+        start = self.now + datetime.timedelta(hours=hours - 1)
+        return Slots.objects.create(
+            barber=self.barber, start_time=start, end_time=start + datetime.timedelta(hours=1), state=state.value)
+
+    def add_booking(self, hours):
+        return Booking.objects.create(
+            slot=self.add_slot(hours, SlotStates.BOOKED), customer=self.customer, amount=1000)
+
+    def slot_states(self):
+        return dict(Slots.objects.values_list('pk', 'state'))
+
+    def test_expire_slots_in_chunks(self):
+        version = get_slot_version(self.barber.pk)
+        self.assertEqual(expire_slots(now=self.now, chunk_size=2), 3)
+
+        states = self.slot_states()
+        self.assertEqual({states[slot.pk] for slot in self.past}, {SlotStates.EXPIRED.value})
+        self.assertEqual(states[self.future.pk], SlotStates.FREE.value)
+        self.assertEqual(states[self.stale.slot_id], SlotStates.BOOKED.value)
+        self.assertNotEqual(get_slot_version(self.barber.pk), version)
+        self.assertEqual(expire_slots(now=self.now, chunk_size=2), 0)
+
+    def test_resolve_stale_bookings(self):
+        self.assertEqual(resolve_stale_bookings(now=self.now, chunk_size=1), 1)
+
+        self.stale.refresh_from_db()
+        self.recent.refresh_from_db()
+        self.assertEqual(self.stale.state, BookingStates.COMPLETED.value)
+        self.assertEqual(self.recent.state, BookingStates.ONGOING.value)
+        self.assertEqual(rollup_totals(self.barber, BookingStates.ONGOING.value)['bookings'], 1)
+        self.assertEqual(rollup_totals(self.barber, BookingStates.COMPLETED.value)['bookings'], 1)
+        self.assertEqual(reconcile_rollups(), 0)
+
+        self.assertEqual(resolve_stale_bookings(now=self.now, grace=datetime.timedelta(0)), 1)
+        self.assertEqual(rollup_totals(self.barber, BookingStates.ONGOING.value)['bookings'], 0)
+
+    @skipUnlessDBFeature('has_select_for_update_skip_locked')
+    def test_locked_rows_are_skipped(self):
+        locked, release = threading.Event(), threading.Event()
+
+        def hold_lock():
+            try:
+                with transaction.atomic():
+                    list(Slots.objects.select_for_update().filter(pk=self.past[0].pk))
+                    locked.set()
+                    release.wait(10)
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            holder = executor.submit(hold_lock)
+            self.assertTrue(locked.wait(10))
+            try:
+                self.assertEqual(expire_slots(now=self.now, chunk_size=1), 2)
+            finally:
+                release.set()
+            holder.result()
+
+        self.assertEqual(self.slot_states()[self.past[0].pk], SlotStates.FREE.value)
+        self.assertEqual(expire_slots(now=self.now), 1)
+
+    def test_task_skips_overlapping_runs(self):
+        cache.add(EXPIRY_LOCK_KEY, 1)
+        self.assertIsNone(ExpireSlots())
+        self.assertEqual(self.slot_states()[self.past[0].pk], SlotStates.FREE.value)
+
+        cache.delete(EXPIRY_LOCK_KEY)
+        self.assertEqual(ExpireSlots(), {'expired_slots': 3, 'resolved_bookings': 1})
+        self.assertTrue(cache.add(EXPIRY_LOCK_KEY, 1))
+
+
+class ArchiveHistoryTest(TestCase):
+    """
+    archive_history moves only finished slots past the retention window,
+    keeps their reviews and leaves the rollups as they were.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = CustomUser.objects.create_user(email='customer@example.com', password=None)
+        cls.barber = BarberProfile.objects.create(
+            user=CustomUser.objects.create_user(email='barber@example.com', password=None))
+
+        now = timezone.now()
+        cls.old = now - datetime.timedelta(days=400)
+        slots = [
+            # Archived: completed, cancelled, expired
+            (cls.old, SlotStates.BOOKED, BookingStates.COMPLETED),
+            (cls.old + datetime.timedelta(hours=1), SlotStates.BOOKED, BookingStates.CANCELLED),
+            (cls.old + datetime.timedelta(hours=2), SlotStates.EXPIRED, None),
+            # Kept: still ongoing, too recent
+            (cls.old + datetime.timedelta(hours=3), SlotStates.BOOKED, BookingStates.ONGOING),
+            (now - datetime.timedelta(days=1), SlotStates.BOOKED, BookingStates.COMPLETED),
+        ]
+        for start, slot_state, booking_state in slots:
+            slot = Slots.objects.create(
+                barber=cls.barber, start_time=start, end_time=start + datetime.timedelta(minutes=30),
+                state=slot_state.value)
+            if booking_state:
+                Booking.objects.create(slot=slot, customer=cls.customer, state=booking_state.value, amount=1000)
+        cls.review = Review.objects.create(
+            review='Good', barber=cls.barber, customer=cls.customer,
+            slot=Slots.objects.get(start_time=cls.old))
+
+    def setUp(self):
+        cache.clear()
+
+    def test_archive_history(self):
+        reconcile_rollups(self.old.date(), timezone.now().date())
+        rollups = list(self.barber.booking_rollups.values_list('day', 'state', 'bookings', 'amount'))
+
+        moved = archive_history(retention_days=180, batch_size=2)
+
+        self.assertEqual(moved, {'slots': 3, 'bookings': 2, 'batches': 2})
+        self.assertEqual(Slots.objects.count(), 2)
+        self.assertEqual(ArchivedSlot.objects.count(), 3)
+        self.assertEqual(
+            set(ArchivedBooking.objects.values_list('state', flat=True)),
+            {BookingStates.COMPLETED.value, BookingStates.CANCELLED.value})
+
+        self.review.refresh_from_db()
+        self.assertIsNone(self.review.slot_id)
+        self.assertEqual(self.review.archived_slot.start_time, self.old)
+
+        # Rollups already counted the archived bookings
+        self.assertEqual(reconcile_rollups(self.old.date(), timezone.now().date()), 0)
+        self.assertEqual(list(self.barber.booking_rollups.values_list('day', 'state', 'bookings', 'amount')), rollups)
+
+        self.assertEqual(archive_history(retention_days=180), {'slots': 0, 'bookings': 0, 'batches': 0})
+
+    def test_reports_include_archived(self):
+        archive_history(retention_days=180)
+        admin = CustomUser.objects.create_user(email='admin@example.com', password=None, is_staff=True)
+        client = APIClient()
+        client.force_authenticate(admin)
+
+        for choice in ('drf', 'fast'):
+            rows = {}
+            for include_archived in (False, True):
+                response = client.post(
+                    f'/api/barber/slots/completed/?serializer={choice}',
+                    {'email': 'barber@example.com', 'include_bookings': True, 'include_archived': include_archived},
+                    format='json')
+                self.assertEqual(response.status_code, 200)
+                rows[include_archived] = response.data['Completed Bookings']
+            self.assertEqual(len(rows[False]), 1)
+            self.assertEqual(len(rows[True]), 2)
+
+
+class BookingSearchTest(TestCase):
+    """
+    The booking search filters on a real datetime window and is served by
+    the (barber, start_time) and (state, slot) indexes.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customers = [
+            CustomUser.objects.create_user(email=f'customer{index}@example.com', password=None, phone_number=str(index))
+            for index in range(2)
+        ]
+        cls.barber = BarberProfile.objects.create(
+            user=CustomUser.objects.create_user(email='barber@example.com', password=None))
+        cls.admin = CustomUser.objects.create_user(email='admin@example.com', password=None, is_staff=True)
+
+        cls.start = datetime.datetime(2024, 5, 1, 10, tzinfo=datetime.timezone.utc)
+        states = [BookingStates.COMPLETED, BookingStates.CANCELLED, BookingStates.ONGOING]
+        # Two bookings a day at the same time of day, over six days
+        for index in range(12):
+            slot = Slots.objects.create(
+                barber=cls.barber,
+                start_time=cls.start + datetime.timedelta(days=index // 2, hours=index % 2),
+                state=SlotStates.BOOKED.value)
+            Booking.objects.create(
+                slot=slot, customer=cls.customers[index % 2], state=states[index % 3].value, amount=index * 100)
+
+    def search(self, query, user=None):
+        client = APIClient()
+        client.force_authenticate(user or self.admin)
+        results, url = [], f'/api/bookings/search/?page_size=2&{query}'
+        while url:
+            response = client.get(url)
+            self.assertEqual(response.status_code, 200, response.data)
+            results += response.data['results']
+            url = response.data['next']
+        return results
+
+    def test_filters(self):
+        window = f'barber={self.barber.pk}&start=2024-05-02&end=2024-05-04T10:30:00Z'
+        results = self.search(window)
+        # 2024-05-02 and 03 fully, 2024-05-04 10:00 only, in start time order
+        self.assertEqual([row['amount'] for row in results], [200, 300, 400, 500, 600])
+        # Each booking says which one it is, its state and whose it is
+        booking = Booking.objects.select_related('customer').get(amount=200)
+        self.assertEqual(
+            (results[0]['id'], results[0]['state'], results[0]['customer']['id'], results[0]['customer']['email']),
+            (booking.pk, booking.state, booking.customer.pk, booking.customer.email))
+
+        self.assertEqual(
+            [row['amount'] for row in self.search(f'{window}&state=completed&min_amount=300&max_amount=600')], [300, 600])
+        self.assertEqual(self.search('serializer=fast&state=CANCELLED'), self.search('serializer=drf&state=CANCELLED'))
+
+        # Customers only find their own bookings
+        own = self.search(f'customer={self.customers[1].pk}', user=self.customers[0])
+        self.assertEqual(own, [])
+        self.assertEqual(len(self.search('', user=self.customers[0])), 6)
+
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        self.assertEqual(client.get('/api/bookings/search/?state=unknown').status_code, 400)
+        self.assertEqual(client.get('/api/bookings/search/?start=yesterday').status_code, 400)
+
+    @skipUnless(connection.vendor == 'postgresql', 'Checks PostgreSQL query plans')
+    def test_query_plans_use_indexes(self):
+        def plan(params):
+            bookings = filter_bookings(Booking.objects.all(), params)
+            return bookings.order_by('slot__start_time', 'id').explain()
+
+        # With a dozen rows a sequential scan is cheapest; take it off the table
+        # so the plan shows whether an index can serve the query at all
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+
+        self.assertIn('unique_barber_slot_start', plan(
+            {'barber': self.barber.pk, 'start': '2024-05-02', 'end': '2024-05-04'}))
+        self.assertIn('booking_state_slot_idx', plan({'state': BookingStates.CANCELLED.value}))
+
+
+@override_settings(REVIEWS={'LATEST_COUNT': 2, 'SEARCH_CONFIG': 'english'})
+class BarberReviewsTest(TestCase):
+    """
+    Writing, editing and deleting reviews keep the barber's review summary
+    current, and reviews are listed newest first and found through the
+    full-text index.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = CustomUser.objects.create_user(email='customer@example.com', password=None)
+        cls.barber = BarberProfile.objects.create(
+            user=CustomUser.objects.create_user(email='barber@example.com', password=None))
+        start = datetime.datetime(2024, 5, 1, 10, tzinfo=datetime.timezone.utc)
+        cls.slots = [
+            Slots.objects.create(barber=cls.barber, start_time=start + datetime.timedelta(hours=index))
+            for index in range(3)
+        ]
+
+    def test_reviews(self):
+        client = APIClient()
+        client.force_authenticate(self.customer)
+        texts = ['Great fade, will come back.', 'Quick and friendly service.', 'Friendly barbers, great beard trims.']
+        for slot, text in zip(self.slots, texts):
+            response = client.post(f'/api/barber/write-review/{slot.pk}/', {'review': text, 'email': 'barber@example.com'})
+            self.assertEqual(response.status_code, 201)
+
+        self.barber.refresh_from_db()
+        self.assertEqual(self.barber.review_count, 3)
+        self.assertEqual([review['review'] for review in self.barber.latest_reviews], texts[:0:-1])
+
+        response = client.get(f'/api/barbers/{self.barber.pk}/reviews/?page_size=2')
+        self.assertEqual(response.data['Review Count'], 3)
+        self.assertEqual([review['review'] for review in response.data['results']], texts[:0:-1])
+        response = client.get(response.data['next'])
+        self.assertEqual([review['review'] for review in response.data['results']], texts[:1])
+        self.assertIsNone(response.data['next'])
+
+        # Stemmed, case-insensitive, every word must match
+        response = client.get(f'/api/barbers/{self.barber.pk}/reviews/', {'q': 'FRIENDLY trim'})
+        self.assertEqual([review['review'] for review in response.data['results']], texts[2:])
+        response = client.get(f'/api/barbers/{self.barber.pk}/reviews/', {'q': 'great'})
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertEqual(client.get('/api/barbers/0/reviews/').status_code, 404)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.get(review=texts[2]).delete()
+        self.barber.refresh_from_db()
+        self.assertEqual(self.barber.review_count, 2)
+        self.assertEqual([review['review'] for review in self.barber.latest_reviews], texts[1::-1])
+
+    def test_summaries_follow_edits_deletes_and_backfill(self):
+        # Reviews written before the summaries existed, straight into the table
+        reviews = [
+            Review.objects.create(barber=self.barber, customer=self.customer, slot=slot, review=f'Review {index}')
+            for index, slot in enumerate(self.slots)
+        ]
+        self.barber.refresh_from_db()
+        self.assertEqual((self.barber.review_count, self.barber.latest_reviews), (0, []))
+
+        out = io.StringIO()
+        call_command('refresh_review_summaries', batch_size=1, stdout=out)
+        self.assertIn('1 barber(s)', out.getvalue())
+        self.barber.refresh_from_db()
+        self.assertEqual(self.barber.review_count, 3)
+        self.assertEqual([review['review'] for review in self.barber.latest_reviews], ['Review 2', 'Review 1'])
+
+        # An edit made outside write_review, as in the admin
+        reviews[2].review = 'Edited'
+        with self.captureOnCommitCallbacks(execute=True):
+            reviews[2].save()
+        self.barber.refresh_from_db()
+        self.assertEqual([review['review'] for review in self.barber.latest_reviews], ['Edited', 'Review 1'])
+
+        # Deleting many reviews refreshes the barber once
+        with patch('user.reviews.refresh_review_summaries', wraps=refresh_review_summaries) as refresh, \
+                self.captureOnCommitCallbacks(execute=True):
+            Review.objects.filter(pk__in=[reviews[1].pk, reviews[2].pk]).delete()
+        self.assertEqual(refresh.call_count, 1)
+        self.barber.refresh_from_db()
+        self.assertEqual(self.barber.review_count, 1)
+        self.assertEqual([review['review'] for review in self.barber.latest_reviews], ['Review 0'])
+
+    @skipUnless(connection.vendor == 'postgresql', 'Checks PostgreSQL query plans')
+    def test_search_uses_index(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        self.assertIn('review_search_idx', search_reviews(Review.objects.all(), 'friendly').explain())
+
+
+class EarliestFreeSlotsTest(TestCase):
+    """
+    The availability index answers from memory and follows bookings,
+    cancellations and new slots through the slot versions.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = CustomUser.objects.create_user(email='customer@example.com', password=None)
+        cls.barbers = [
+            BarberProfile.objects.create(user=CustomUser.objects.create_user(
+                email=f'barber{index}@example.com', password=None, phone_number=str(index)))
+            for index in range(2)
+        ]
+        start = timezone.now().replace(microsecond=0) + datetime.timedelta(hours=1)
+        cls.slots = [
+            Slots.objects.create(
+                barber=cls.barbers[index % 2], start_time=start + datetime.timedelta(minutes=30 * index),
+                end_time=start + datetime.timedelta(minutes=30 * (index + 1)))
+            for index in range(6)
+        ]
+        Slots.objects.create(barber=cls.barbers[0], start_time=start - datetime.timedelta(hours=3))
+
+    def setUp(self):
+        cache.clear()
+
+    def earliest(self, query=''):
+        response = APIClient().get(f'/api/barber/slots/earliest/?{query}')
+        self.assertEqual(response.status_code, 200)
+        return [slot['id'] for slot in response.data['results']]
+
+    def test_earliest(self):
+        ids = [slot.pk for slot in self.slots]
+        self.assertEqual(self.earliest('limit=4'), ids[:4])
+        self.assertEqual(self.earliest(f'barbers={self.barbers[1].pk}&limit=2'), ids[1:4:2])
+        after = self.slots[4].start_time.isoformat().replace('+00:00', 'Z')
+        self.assertEqual(self.earliest(f'after={after}'), ids[4:])
+        with self.assertNumQueries(0):
+            availability_index.earliest(limit=3)
+
+        client = APIClient()
+        client.force_authenticate(self.customer)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(client.post(f'/api/barber/slots/book/{ids[0]}/').status_code, 201)
+        self.assertEqual(self.earliest('limit=2'), ids[1:3])
+
+        # A cancelled booking keeps its slot; deleting the booking frees it
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(client.put(f'/api/barber/slots/cancel/{ids[0]}/', {'reason': 'Busy'}).status_code, 200)
+        self.assertEqual(self.earliest('limit=1'), ids[1:2])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(client.delete(f'/api/barber/slots/delete/{ids[0]}/').status_code, 204)
+        with self.captureOnCommitCallbacks(execute=True):
+            new_slot = Slots.objects.create(
+                barber=self.barbers[1], start_time=self.slots[0].start_time - datetime.timedelta(minutes=30))
+        self.assertEqual(self.earliest('limit=2'), [new_slot.pk, ids[0]])
+
+        self.assertEqual(APIClient().get('/api/barber/slots/earliest/?barbers=x').status_code, 400)
+
+    def test_refresh_reloads_changed_barbers(self):
+        ids = [slot.pk for slot in self.slots]
+        self.assertEqual([slot[1] for slot in availability_index.earliest(limit=2)], ids[:2])
+
+        # Only the booked slot's barber is reloaded: one query, and no barber list
+        with self.captureOnCommitCallbacks(execute=True):
+            Slots.objects.filter(pk=ids[0]).update(state=SlotStates.BOOKED.value)
+            bump_slot_versions([self.barbers[0].pk])
+        with CaptureQueriesContext(connection) as queries:
+            found = availability_index.earliest(limit=2)
+        self.assertEqual([slot[1] for slot in found], ids[1:3])
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn(BarberProfile._meta.db_table, queries[0]['sql'])
+
+        # Without the log every barber's version is checked
+        with self.captureOnCommitCallbacks(execute=True):
+            Slots.objects.filter(pk=ids[1]).update(state=SlotStates.BOOKED.value)
+            bump_slot_versions([self.barbers[1].pk])
+        cache.delete(SLOT_CHANGES_KEY.format(get_slot_version()))
+        with self.assertNumQueries(2):
+            found = availability_index.earliest(limit=2)
+        self.assertEqual([slot[1] for slot in found], ids[2:4])
+
+
+class ExportBookingsTest(TestCase):
+    """
+    The export streams bookings, archived ones on request, as CSV or NDJSON,
+    with CSV cells that spreadsheets would run as formulas neutralized.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = CustomUser.objects.create_user(email='admin@example.com', password=None, is_staff=True)
+        customer = CustomUser.objects.create_user(email='customer@example.com', password=None)
+        barber = BarberProfile.objects.create(user=CustomUser.objects.create_user(email='barber@example.com', password=None))
+        start = timezone.now() - datetime.timedelta(days=400)
+        for index in range(5):
+            slot_start = start + datetime.timedelta(days=index * 100)
+            slot = Slots.objects.create(
+                barber=barber, start_time=slot_start, end_time=slot_start + datetime.timedelta(minutes=30),
+                state=SlotStates.BOOKED.value)
+            Booking.objects.create(
+                slot=slot, customer=customer, amount=1000 + index,
+                state=BookingStates.COMPLETED.value if index % 2 == 0 else BookingStates.CANCELLED.value,
+                reason='Said "no", then left' if index == 1 else None)
+        archive_history(retention_days=180)
+
+    def export(self, query, user=None):
+        client = APIClient()
+        client.force_authenticate(user or self.admin)
+        response = client.get(f'/api/bookings/export/?{query}')
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv(self):
+        rows = list(csv.DictReader(io.StringIO(self.export('state=Completed&include_archived=true'))))
+        self.assertEqual([row['amount'] for row in rows], ['1004', '1000', '1002'])
+        self.assertEqual(rows[0]['barber_email'], 'barber@example.com')
+        self.assertEqual(rows[0]['customer_email'], 'customer@example.com')
+        self.assertTrue(rows[0]['start_time'])
+
+        rows = list(csv.DictReader(io.StringIO(self.export('email=barber@example.com&state=CANCELLED&include_archived=1'))))
+        # Live bookings come first, then archived ones
+        self.assertEqual([row['reason'] for row in rows], ['', 'Said "no", then left'])
+
+    def test_csv_neutralizes_formulas(self):
+        reasons = ['=HYPERLINK("http://example.com")', '+1', '-2+3', '@SUM(A1)', '\tTab', '\rReturn', 'Fine = ok']
+        booking = Booking.objects.get(amount=1004)
+        for reason in reasons:
+            Booking.objects.filter(pk=booking.pk).update(reason=reason)
+            rows = list(csv.DictReader(io.StringIO(self.export('state=Completed'))))
+            self.assertEqual(rows[-1]['reason'], reason if reason == 'Fine = ok' else f"'{reason}")
+            self.assertEqual(rows[-1]['amount'], '1004')
+
+        rows = [json.loads(line) for line in self.export('export_format=ndjson&state=Completed').splitlines()]
+        self.assertEqual(rows[-1]['reason'], 'Fine = ok')
+
+    def test_ndjson(self):
+        rows = [json.loads(line) for line in self.export('export_format=ndjson').splitlines()]
+        self.assertEqual([row['amount'] for row in rows], [1003, 1004])
+        self.assertIsNone(rows[0]['reason'])
+
+    def test_errors(self):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        self.assertEqual(client.get('/api/bookings/export/?export_format=xml').status_code, 400)
+        self.assertEqual(client.get('/api/bookings/export/?email=nobody@example.com').status_code, 404)
+        client.force_authenticate(CustomUser.objects.get(email='customer@example.com'))
+        self.assertEqual(client.get('/api/bookings/export/').status_code, 403)
+
+
+class ImportRosterTest(TestCase):
+    """
+    Imports create barbers and slots in batches, skip existing ones, report
+    bad rows without stopping and count only the rows they created.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = CustomUser.objects.create_user(email='admin@example.com', password=None, is_staff=True)
+        cls.barber = BarberProfile.objects.create(
+            user=CustomUser.objects.create_user(email='barber@example.com', password=None, phone_number='111'))
+        cls.start = datetime.datetime(2030, 1, 7, 9, tzinfo=datetime.timezone.utc)
+        Slots.objects.create(barber=cls.barber, start_time=cls.start)
+
+    def upload(self, kind, name, content):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        response = client.post(
+            '/api/import/', {'kind': kind, 'file': SimpleUploadedFile(name, content.encode())}, format='multipart')
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+
+    def test_import_barbers(self):
+        content = '\n'.join([
+            'email,first_name,last_name,phone_number,is_available',
+            'new1@example.com,Ann,Lee,222,true',
+            'barber@example.com,Existing,Barber,,false',
+            'not-an-email,Bad,Row,,true',
+            'new1@example.com,Again,Lee,,true',
+            'new2@example.com,Bo,Kim,111,yes',
+            'new3@example.com,Cy,Ng,,maybe',
+            'new4@example.com,Di,Oz,,',
+        ])
+        report = self.upload('barbers', 'roster.csv', content)
+        self.assertEqual((report['Created'], report['Skipped'], report['Failed']), (2, 1, 4))
+        self.assertEqual([error['row'] for error in report['Errors']], [3, 4, 5, 6])
+
+        barber = BarberProfile.objects.select_related('user').get(user__email='new1@example.com')
+        self.assertTrue(barber.is_available)
+        self.assertEqual(barber.user.role, RolesChoices.BARBER.value)
+        self.assertFalse(barber.user.has_usable_password())
+        self.assertFalse(BarberProfile.objects.get(user__email='new4@example.com').is_available)
+
+    def test_import_slots(self):
+        rows = [
+            {'barber_email': 'barber@example.com', 'start_time': self.start.isoformat()},
+            {'barber_email': 'barber@example.com', 'start_time': '2030-01-07T10:00:00Z', 'end_time': '2030-01-07T10:30:00Z'},
+            {'barber_email': 'barber@example.com', 'start_time': '2030-01-07T10:00:00Z'},
+            {'barber_email': 'nobody@example.com', 'start_time': '2030-01-07T11:00:00Z'},
+            {'barber_email': 'barber@example.com', 'start_time': '2030-01-07T12:00:00Z', 'end_time': '2030-01-07T11:00:00Z'},
+            {'barber_email': 'barber@example.com', 'start_time': 'soon'},
+        ]
+        content = '\n'.join(json.dumps(row) for row in rows) + '\nnot json\n'
+        content += json.dumps({'barber_email': 'barber@example.com', 'start_time': '2030-01-07T13:00:00Z'})
+        with self.captureOnCommitCallbacks(execute=True):
+            report = self.upload('slots', 'slots.ndjson', content)
+        self.assertEqual((report['Created'], report['Skipped'], report['Failed']), (2, 1, 5))
+
+        slots = Slots.objects.filter(barber=self.barber, start_time__gt=self.start).order_by('start_time')
+        self.assertEqual(
+            [(slot.start_time.hour, slot.end_time - slot.start_time, slot.state) for slot in slots],
+            [(10, datetime.timedelta(minutes=30), SlotStates.FREE.value),
+             (13, datetime.timedelta(minutes=60), SlotStates.FREE.value)])
+
+    def test_command(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv') as rows:
+            rows.write('barber_email,start_time\n')
+            rows.writelines(
+                f'barber@example.com,{(self.start + datetime.timedelta(hours=index)).isoformat()}\n'
+                for index in range(25))
+            rows.flush()
+            stdout = io.StringIO()
+            call_command('import_roster', rows.name, kind='slots', batch_size=10, stdout=stdout)
+        self.assertIn('Created 24, skipped 1 existing, 0 failed', stdout.getvalue())
+
+    def test_slots_created_meanwhile_are_not_counted(self):
+        # The first slot was created after the duplicate check let it through
+        report = ImportReport()
+        hour = datetime.timedelta(hours=1)
+        slots = [
+            (self.barber.pk, self.start, self.start + hour),
+            (self.barber.pk, self.start + hour, self.start + 2 * hour),
+        ]
+        self.assertEqual(SlotImporter(report).insert(slots), 1)
+        self.assertEqual(Slots.objects.filter(barber=self.barber).count(), 2)
+
+    def test_barbers_created_meanwhile_fail_alone(self):
+        report = ImportReport()
+        importer = BarberImporter(report)
+        insert = importer.insert
+
+        def racing_insert(rows):
+            # Another import registers the second email after the duplicate check
+            CustomUser.objects.create_user(email='new2@example.com', password=None)
+            return insert(rows)
+
+        batch = [(number, {'email': f'new{number}@example.com'}) for number in range(1, 4)]
+        with patch.object(importer, 'insert', racing_insert):
+            importer.import_batch(batch)
+        self.assertEqual((report.created, report.failed), (2, 1))
+        self.assertEqual([error['row'] for error in report.errors], [2])
+        self.assertEqual(
+            sorted(BarberProfile.objects.filter(user__email__startswith='new').values_list('user__email', flat=True)),
+            ['new1@example.com', 'new3@example.com'])
+
+    @override_settings(IMPORT={'BATCH_SIZE': 50})
+    def test_undecodable_file_keeps_earlier_batches(self):
+        lines = [
+            f'barber@example.com,{(self.start + datetime.timedelta(hours=index)).isoformat()}\n'.encode()
+            for index in range(1, 400)
+        ]
+        # Well past the first read of the text stream, so earlier rows decode
+        content = b'barber_email,start_time\n' + b''.join(lines[:300]) + b'caf\xe9,soon\n' + b''.join(lines[300:])
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        response = client.post(
+            '/api/import/', {'kind': 'slots', 'file': SimpleUploadedFile('slots.csv', content)}, format='multipart')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('UTF-8', response.data['Error'])
+        self.assertGreater(response.data['Created'], 0)
+        self.assertLess(response.data['Created'], 300)
+        self.assertEqual(Slots.objects.filter(barber=self.barber).count(), response.data['Created'] + 1)
+
+
+class AdminChangelistTest(TestCase):
+    """
+    Changelists run a fixed number of queries however many rows they show,
+    search by indexed email prefix and skip COUNT(*) on big tables.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = CustomUser.objects.create_superuser(email='admin@example.com', password='pass')
+        cls.start = timezone.now() + datetime.timedelta(days=1)
+        for index in range(3):
+            cls.add_booking(index)
+
+    @classmethod
+    def add_booking(cls, index):
+        barber = BarberProfile.objects.create(user=CustomUser.objects.create_user(
+            email=f'barber{index}@example.com', password=None, phone_number=f'555{index}'))
+        slot = Slots.objects.create(barber=barber, start_time=cls.start + datetime.timedelta(hours=index))
+        customer = CustomUser.objects.create_user(email=f'customer{index}@example.com', password=None)
+        Booking.objects.create(slot=slot, customer=customer)
+        Review.objects.create(barber=barber, customer=customer, slot=slot, review='Fine')
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def test_queries_do_not_grow_with_rows(self):
+        for index, model in enumerate(('customuser', 'barberprofile', 'slots', 'booking', 'review'), start=3):
+            url = f'/admin/user/{model}/'
+            with CaptureQueriesContext(connection) as few:
+                self.assertEqual(self.client.get(url).status_code, 200)
+            self.add_booking(index)
+            with CaptureQueriesContext(connection) as more:
+                self.assertEqual(self.client.get(url).status_code, 200)
+            self.assertEqual(len(more), len(few), model)
+
+    def test_search_by_email_and_phone(self):
+        response = self.client.get('/admin/user/booking/', {'q': 'customer1@'})
+        self.assertEqual([booking.customer.email for booking in response.context['cl'].result_list], ['customer1@example.com'])
+        response = self.client.get('/admin/user/barberprofile/', {'q': '5552'})
+        self.assertEqual([barber.user.email for barber in response.context['cl'].result_list], ['barber2@example.com'])
+
+        response = self.client.get('/admin/autocomplete/', {
+            'app_label': 'user', 'model_name': 'booking', 'field_name': 'customer', 'term': 'customer0'})
+        self.assertEqual([result['text'] for result in response.json()['results']], ['customer0@example.com'])
+
+    @skipUnless(connection.vendor == 'postgresql', 'Index plans checked on PostgreSQL')
+    def test_search_uses_index(self):
+        users, _ = CustomUserAdmin(CustomUser, site).get_search_results(None, CustomUser.objects.all(), 'customer1@')
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        plan = users.explain()
+        # The pattern (varchar_pattern_ops) indexes made for the unique columns
+        self.assertIn('customuser_email', plan)
+        self.assertIn('_like', plan)
+        self.assertNotIn('Seq Scan', plan)
+
+    def test_estimated_count(self):
+        paginator = EstimatedCountPaginator(Booking.objects.order_by('pk'), 100)
+        self.assertEqual(paginator.count, 3)
+        if connection.vendor != 'postgresql':
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(f'ANALYZE {connection.ops.quote_name(Booking._meta.db_table)}')
+        paginator = EstimatedCountPaginator(Booking.objects.order_by('pk'), 100)
+        paginator.exact_below = 0
+        with self.assertNumQueries(1):
+            self.assertEqual(paginator.count, 3)
+        Booking.objects.filter(customer__email='customer0@example.com').delete()
+        self.assertEqual(EstimatedCountPaginator(Booking.objects.order_by('pk'), 100).count, 2)
+        # Still the statistics from before the delete, while filtered lists are counted
+        paginator = EstimatedCountPaginator(Booking.objects.order_by('pk'), 100)
+        paginator.exact_below = 0
+        self.assertEqual(paginator.count, 3)
+        paginator = EstimatedCountPaginator(Booking.objects.filter(state=BookingStates.ONGOING.value), 100)
+        paginator.exact_below = 0
+        self.assertEqual(paginator.count, 2)
+
+
+@override_settings(DATABASE_ROUTING={'REPLICAS': ['replica1', 'replica2'], 'STICKY_SECONDS': 10})
+class ReplicaRoutingTest(SimpleTestCase):
+    """
+    Safe requests read from a replica unless they or their client wrote
+    recently; everything else uses the primary.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.router = ReplicaRouter()
+        self.factory = RequestFactory()
+
+    def read_db(self, model=Slots, state=None):
+        token = routing_state.set(state)
+        try:
+            return self.router.db_for_read(model)
+        finally:
+            routing_state.reset(token)
+
+    def test_router(self):
+        self.assertEqual(self.read_db(state=None), 'default')
+        self.assertEqual(self.read_db(state=RoutingState(False)), 'default')
+        self.assertIn(self.read_db(state=RoutingState(True)), ('replica1', 'replica2'))
+        self.assertEqual(self.read_db(Token, RoutingState(True)), 'default')
+        with read_from_primary():
+            self.assertEqual(self.read_db(state=RoutingState(True)), 'default')
+        with patch.object(connections['default'], 'in_atomic_block', True):
+            self.assertEqual(self.read_db(state=RoutingState(True)), 'default')
+        with override_settings(DATABASE_ROUTING={'REPLICAS': []}):
+            self.assertEqual(self.read_db(state=RoutingState(True)), 'default')
+
+        state = RoutingState(True)
+        token = routing_state.set(state)
+        try:
+            self.assertEqual(self.router.db_for_write(Slots), 'default')
+        finally:
+            routing_state.reset(token)
+        self.assertEqual(self.read_db(state=state), 'default')
+
+        self.assertFalse(self.router.allow_migrate('replica1', 'user'))
+        self.assertIsNone(self.router.allow_migrate('default', 'user'))
+
+    def test_read_your_writes(self):
+        seen = []
+
+        def view(request):
+            seen.append(self.router.db_for_read(Slots))
+            if request.GET.get('write'):
+                self.router.db_for_write(Slots)
+            return HttpResponse()
+
+        middleware = ReplicaRoutingMiddleware(view)
+        alice, bob = {'HTTP_AUTHORIZATION': 'Token alice'}, {'HTTP_AUTHORIZATION': 'Token bob'}
+        middleware(self.factory.get('/', **alice))
+        middleware(self.factory.post('/', **alice))
+        middleware(self.factory.get('/', **alice))
+        middleware(self.factory.get('/', **bob))
+        self.assertEqual([db == 'default' for db in seen], [False, True, True, False])
+
+        # A safe request that writes makes its client sticky too
+        middleware(self.factory.get('/', {'write': 1}, **bob))
+        middleware(self.factory.get('/', **bob))
+        self.assertEqual(seen[-1], 'default')
+
+        # Stickiness ends after STICKY_SECONDS
+        cache.clear()
+        middleware(self.factory.get('/', **alice))
+        self.assertNotEqual(seen[-1], 'default')
+
+
+class PrebuiltSchemaTest(SimpleTestCase):
+    """
+    build_schema writes the schema once; it is then served from memory with
+    an ETag and compression, and --check catches a file out of step with the views.
+    """
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = Path(directory.name) / 'openapi.json'
+        settings_override = override_settings(OPENAPI_SCHEMA={'PATH': self.path, 'MAX_AGE': 60})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        prebuilt_schema.clear()
+        self.addCleanup(prebuilt_schema.clear)
+
+    def test_build_and_check(self):
+        with self.assertRaisesMessage(CommandError, 'No prebuilt schema'):
+            call_command('build_schema', check=True, stdout=io.StringIO())
+        call_command('build_schema', stdout=io.StringIO())
+        self.assertIn('/bookings/search/', json.loads(self.path.read_bytes())['paths'])
+        call_command('build_schema', check=True, stdout=io.StringIO())
+
+        schema = json.loads(self.path.read_bytes())
+        del schema['paths']['/bookings/search/']
+        self.path.write_text(json.dumps(schema, indent=4))
+        with self.assertRaisesMessage(CommandError, 'out of date'):
+            call_command('build_schema', check=True, stdout=io.StringIO(), stderr=io.StringIO())
+
+    def test_served_from_memory(self):
+        call_command('build_schema', stdout=io.StringIO())
+        with patch('user.schema.render_schema', side_effect=AssertionError('rendered per request')):
+            response = self.client.get('/swagger.json/')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.content, self.path.read_bytes())
+            self.assertEqual(response['Cache-Control'], 'public, max-age=60')
+            etag = response['ETag']
+
+            response = self.client.get('/swagger.json/', HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.content, b'')
+
+            response = self.client.get('/swagger.json/', HTTP_ACCEPT_ENCODING='gzip, deflate')
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+            self.assertEqual(gzip.decompress(response.content), self.path.read_bytes())
+            self.assertEqual(self.client.get(
+                '/swagger.json/', HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+            response = self.client.get('/swagger.yaml/')
+            self.assertEqual(yaml.safe_load(response.content), json.loads(self.path.read_bytes()))
+            self.assertEqual(self.client.get('/swagger.xml/').status_code, 404)
+
+            self.assertContains(self.client.get('/swagger/'), '/swagger.json/')
+
+
+class ConditionalGetTest(TestCase):
+    """
+    Slot, barber and profile reads carry an ETag (and Last-Modified where the
+    rows have one); a client sending it back gets a 304 until the data
+    changes, without the response being built again.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = CustomUser.objects.create_user(email='customer@example.com', password=None)
+        cls.token = Token.objects.create(user=cls.customer)
+        cls.barber = BarberProfile.objects.create(user=CustomUser.objects.create_user(
+            email='barber@example.com', password=None, phone_number='1'))
+        start = timezone.now().replace(microsecond=0) + datetime.timedelta(hours=1)
+        cls.slots = [
+            Slots.objects.create(
+                barber=cls.barber, start_time=start + datetime.timedelta(minutes=30 * index),
+                end_time=start + datetime.timedelta(minutes=30 * (index + 1)))
+            for index in range(3)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer)
+
+    def test_slot_listing(self):
+        urls = (f'/api/barber/slots/?barber={self.barber.pk}', f'/api/barber/slots/async/?barber={self.barber.pk}')
+        # The pages hold absolute 'next' links to their own endpoint, so a shared
+        # cache must not answer one endpoint with the other's page
+        self.assertNotEqual(*(self.client.get(url)['ETag'] for url in urls))
+
+        for url in urls:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Cache-Control'], 'no-cache, public')
+            self.assertEqual(len(response.json()['results']), 3)
+            etag = response['ETag']
+
+            with patch('user.views.get_or_build', side_effect=AssertionError('page built')), \
+                    patch('user.async_views.aget_or_build', side_effect=AssertionError('page built')):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response['ETag'], etag)
+
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertEqual(self.client.post(f'/api/barber/slots/book/{self.slots[0].pk}/').status_code, 201)
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertEqual(self.client.delete(f'/api/barber/slots/delete/{self.slots[0].pk}/').status_code, 204)
+
+    def test_profile(self):
+        response = self.client.get('/api/profile/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Cache-Control'], 'no-cache, private')
+        etag, last_modified = response['ETag'], response['Last-Modified']
+        async_response = self.client.get('/api/profile/async/', HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.assertEqual(async_response['ETag'], etag)
+
+        self.assertEqual(self.client.get('/api/profile/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.get('/api/profile/', HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+        self.assertEqual(self.client.get(
+            '/api/profile/async/', HTTP_AUTHORIZATION=f'Token {self.token.key}', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # POST is not a conditional read
+        self.assertEqual(self.client.post('/api/profile/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        self.customer.phone_number = '555'
+        self.customer.save()
+        self.assertEqual(self.client.get('/api/profile/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_barbers(self):
+        url = f'/api/barbers/{self.barber.pk}/'
+        with patch('user.views.IsShopOwner.has_permission', return_value=True):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            etag = response['ETag']
+            with patch('user.serializers.BarberSerializer', side_effect=AssertionError('serialized')):
+                self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+            self.barber.is_available = True
+            self.barber.save()
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        headers = {'HTTP_AUTHORIZATION': f'Token {self.token.key}'}
+        response = self.client.get('/api/barbers/async/', **headers)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertEqual(self.client.get('/api/barbers/async/', HTTP_IF_NONE_MATCH=etag, **headers).status_code, 304)
+        self.assertEqual(self.client.get('/api/barbers/async/?available=false', HTTP_IF_NONE_MATCH=etag, **headers).status_code, 200)
+        BarberProfile.objects.create(user=CustomUser.objects.create_user(
+            email='other@example.com', password=None, phone_number='2'))
+        self.assertEqual(self.client.get('/api/barbers/async/', HTTP_IF_NONE_MATCH=etag, **headers).status_code, 200)
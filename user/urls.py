@@ -1,19 +1,26 @@
 from django.urls import path
  
-from . import views
+from . import views, async_views
 
 urlpatterns = [
     path('users/', views.RetrieveUpdateDeleteUser),
     path('user/<int:pk>/', views.RetrieveUpdateDeleteUser),
     path('register/', views.RegisterUser),
     path('login/', views.LoginView),
+    path('login/async/', async_views.LoginAsyncView),
     path('logout/', views.LogoutView),
     path('barbers/', views.ListRetrieveDeleteUpdateBarber),
     path('barbers/<int:pk>/', views.ListRetrieveDeleteUpdateBarber),
+    path('barbers/<int:pk>/reviews/', views.ListBarberReviews),
+    path('barbers/async/', async_views.ListBarbersAsync),
     path('barber/signup/', views.CreateBarberProfile),
     path('profile/', views.Profile),
+    path('profile/async/', async_views.ProfileAsync),
     path('barber/slots/', views.ListBarberSlots),
+    path('barber/slots/async/', async_views.ListBarberSlotsAsync),
+    path('barber/slots/earliest/', views.EarliestFreeSlots),
     path('barber/slots/book/<int:pk>/', views.BookCancelDeletedBarberSlot),
+    path('barber/slots/book/batch/', views.BookBarberSlotsBatch),
     path('barber/slots/cancel/<int:pk>/', views.BookCancelDeletedBarberSlot),
     path('barber/slots/delete/<int:pk>/', views.BookCancelDeletedBarberSlot),
     path('barber/slots/complete/<int:pk>/', views.Complete_and_Pay_Booking),
@@ -21,5 +28,8 @@ urlpatterns = [
     path('barber/slots/all-cancelled/', views.Check_Cancelled_Barber_Slots),
     path('barber/slots/cancelled/', views.Check_Cancelled_Bookings_With_Datetime),
     path('barber/slots/completed/', views.Check_Completed_Slots_of_Barber),
+    path('bookings/search/', views.SearchBookings),
+    path('bookings/export/', views.ExportBookings),
+    path('import/', views.ImportRoster),
     
 ]
\ No newline at end of file
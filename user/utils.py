@@ -2,6 +2,7 @@ from enum import Enum
 import datetime
 
 from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 from django.core.exceptions import ObjectDoesNotExist
 
 from . import models
@@ -23,17 +24,17 @@ class BookingStates(Enum):
     def states(cls):
         return [(key.value, key.name) for key in cls]
 
-    
-def CreateSlots(barber):
-    hours = 12
-    today = datetime.datetime.today()
-    for hour in range(hours):
-        start_time = datetime.datetime(today.year, today.month, today.day, hour=hour, minute=0, tzinfo=timezone.timezone.utc)
-        end_time = datetime.datetime(today.year, today.month, today.day, hour=hour+1, minute=0, tzinfo=timezone.timezone.utc)
 
-        slot = models.Slots.objects.create(barber=barber, start_time=start_time, end_time=end_time)
-        slot.save()
+class SlotStates(Enum):
+    FREE = 'Free'
+    BOOKED = 'Booked'
+    EXPIRED = 'Expired'
+
+    @classmethod
+    def states(cls):
+        return [(key.value, key.name) for key in cls]
 
+    
 def get_slot_for_booking(slot):
     """
     Get slot from Booking model.
@@ -43,6 +44,23 @@ def get_slot_for_booking(slot):
     except ObjectDoesNotExist:
         return None
     
+def parse_datetime_param(value):
+    """
+    Parse an ISO-8601 date or datetime from a query parameter.
+    Dates mean the start of that day and naive values are taken in the
+    current time zone. Raises ValueError on malformed input.
+    """
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f'Invalid date or datetime: {value}')
+        parsed = datetime.datetime.combine(day, datetime.time.min)
+
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
 def get_barber_by_email(email):
     """
     Get barber from database by email
@@ -50,4 +68,59 @@ def get_barber_by_email(email):
     try:
         return models.BarberProfile.objects.get(user__email=email)
     except models.BarberProfile.DoesNotExist:
-        return None
\ No newline at end of file
+        return None
+
+def filter_slots(slots, params):
+    """
+    Apply the slot listing query parameters (barber, start, end, status)
+    to a Slots queryset. Returns (queryset, barber id or None) and raises
+    ValueError on invalid values.
+    """
+    barber_id = None
+    if params.get('barber'):
+        barber_id = int(params['barber'])
+        slots = slots.filter(barber_id=barber_id)
+    if params.get('start'):
+        slots = slots.filter(start_time__gte=parse_datetime_param(params['start']))
+    if params.get('end'):
+        slots = slots.filter(start_time__lt=parse_datetime_param(params['end']))
+
+    slot_status = params.get('status')
+    if slot_status == 'free':
+        slots = slots.filter(state=SlotStates.FREE.value)
+    elif slot_status == 'booked':
+        slots = slots.filter(state=SlotStates.BOOKED.value)
+    elif slot_status:
+        raise ValueError("status must be 'free' or 'booked'")
+    return slots, barber_id
+
+def filter_bookings(bookings, params):
+    """
+    Apply the booking search query parameters (barber, customer, state,
+    start, end, min_amount, max_amount) to a Booking queryset. The window
+    compares whole datetimes on the slot's start time, so a barber's
+    bookings are read as a range of the Slots (barber, start_time) index.
+    Raises ValueError on invalid values.
+    """
+    if params.get('barber'):
+        bookings = bookings.filter(slot__barber_id=int(params['barber']))
+    if params.get('customer'):
+        bookings = bookings.filter(customer_id=int(params['customer']))
+
+    if params.get('state'):
+        states = {state.value.lower(): state.value for state in BookingStates}
+        state = states.get(params['state'].lower())
+        if state is None:
+            raise ValueError(f"state must be one of {', '.join(states.values())}")
+        bookings = bookings.filter(state=state)
+
+    if params.get('start'):
+        bookings = bookings.filter(slot__start_time__gte=parse_datetime_param(params['start']))
+    if params.get('end'):
+        bookings = bookings.filter(slot__start_time__lt=parse_datetime_param(params['end']))
+
+    if params.get('min_amount'):
+        bookings = bookings.filter(amount__gte=int(params['min_amount']))
+    if params.get('max_amount'):
+        bookings = bookings.filter(amount__lte=int(params['max_amount']))
+    return bookings
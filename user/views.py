@@ -1,23 +1,47 @@
 from rest_framework.decorators import api_view, permission_classes, authentication_classes
 from rest_framework.response import Response
 from rest_framework import status
-from rest_framework.authtoken.models import Token
-from rest_framework.authentication import TokenAuthentication
 from rest_framework.authentication import authenticate
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from rest_framework.exceptions import NotFound
 
 from django.shortcuts import get_object_or_404
-from django.db.models import Count
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.views.decorators.http import require_safe
+from django.utils import timezone
+from django.db.models import Count, Sum, Q
+from django.db.models.functions import Coalesce
 from django.core.exceptions import ObjectDoesNotExist
 
+import io
+import re
 from datetime import datetime
 
 from drf_yasg.utils import swagger_auto_schema
 
-from .utils import RolesChoices, CreateSlots, BookingStates, get_slot_for_booking, get_barber_by_email
+from .utils import RolesChoices, BookingStates, SlotStates, get_slot_for_booking, get_barber_by_email, parse_datetime_param, filter_slots, filter_bookings
 from .permissions import  IsShopOwner, IsBarber
+from .pagination import SlotCursorPagination, BookingCursorPagination, BookingSearchPagination, ReviewCursorPagination
+from .rollups import rollup_totals
+from .authentication import CachedTokenAuthentication, issue_token
+from .cache import get_slot_version, get_or_build, slot_listing_key, slot_listing_timeout
+from .conf import get_setting
+from .conditional import add_validators, latest, list_validators, make_etag, not_modified
+from .schedule import generate_slots
+from .fastserializers import (
+    slot_serializer, booking_serializer, booking_search_serializer, use_fast_serializer, make_datetime_converter,
+)
+from .availability import availability_index
+from .export import EXPORT_FORMATS, export_stream
+from .imports import IMPORTERS, IMPORT_FORMATS, import_format_of, import_rows
+from .reviews import write_review, search_reviews
+from .schema import prebuilt_schema
+from .booking import book_slot, book_slots, save_booking_state, delete_booking, delete_customer, SlotAlreadyBooked, BOOKED
 from . import serializers
-from .models import CustomUser, BarberProfile, Slots, Review, Booking
+from .models import CustomUser, BarberProfile, Slots, Review, Booking, ArchivedBooking
+
+ACCEPTS_GZIP = re.compile(r'\bgzip\b')
 
 @api_view(['GET', 'POST', 'DELETE'])
 @permission_classes([IsAdminUser])
@@ -46,7 +70,7 @@ def RetrieveUpdateDeleteUser(request, pk=None):
 
         elif request.method == 'DELETE':
             user = CustomUser.objects.get(pk=pk)
-            user.delete()
+            delete_customer(user)
             return Response({'Message' : 'User deleted.'}, status=status.HTTP_204_NO_CONTENT)
 
     except Exception as e:
@@ -80,7 +104,7 @@ def RegisterUser(request):
             serializer.save()
             return Response({'Registered': serializer.data['email']}, status=status.HTTP_201_CREATED)
         
-@authentication_classes([TokenAuthentication])
+@authentication_classes([CachedTokenAuthentication])
 @swagger_auto_schema(request_body=serializers.LoginUserSerializer, method='post')        
 @api_view(['POST'])
 def LoginView(request):
@@ -105,11 +129,7 @@ def LoginView(request):
         if serializer.is_valid(raise_exception=True):
             user = authenticate(email=serializer.data['email'], password=serializer.data['password'])
             if user:
-                token, created = Token.objects.get_or_create(user=user)
-                if created:
-                    token.delete()
-                    token = Token.objects.create(user=user)
-                return Response({'Token' : token.key}, status=status.HTTP_200_OK)
+                return Response({'Token' : issue_token(user)}, status=status.HTTP_200_OK)
 
             return Response({'Message' : 'Invalid email or password'}, status=status.HTTP_401_UNAUTHORIZED)
 
@@ -145,20 +165,29 @@ def ListRetrieveDeleteUpdateBarber(request, pk=None):
         
         
     - Returns:
-        - 200 OK: Barbers data
+        - 200 OK: Barbers data, with ETag and Last-Modified
+        - 304 Not Modified: GET with If-None-Match or If-Modified-Since, nothing changed
         - 404 Not Found : No Barbers found
     """
     
     try:
-        user = get_object_or_404(BarberProfile, pk=pk) if pk else None
+        user = get_object_or_404(BarberProfile.objects.select_related('user'), pk=pk) if pk else None
         if request.method == 'GET':
             if pk:
+                etag = make_etag('barber', user.pk, user.modified_at, user.user.modified_at)
+                last_modified = latest(user.modified_at, user.user.modified_at)
+                if response := not_modified(request, etag, last_modified):
+                    return response
                 serializer = serializers.BarberSerializer(user)
-                return Response(serializer.data, status=status.HTTP_200_OK)
+                return add_validators(Response(serializer.data, status=status.HTTP_200_OK), etag, last_modified)
 
-            user = BarberProfile.objects.filter(owner=request.user.owner_profile)
+            user = BarberProfile.objects.filter(owner=request.user.owner_profile).select_related('user')
+            # The count and latest change of the barbers and their users
+            etag, last_modified = list_validators(user, ['modified_at', 'user__modified_at'], 'barbers')
+            if response := not_modified(request, etag, last_modified):
+                return response
             serializer = serializers.BarberSerializer(user, many=True)
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            return add_validators(Response(serializer.data, status=status.HTTP_200_OK), etag, last_modified)
         
         elif request.method == 'DELETE':
             user = BarberProfile.objects.get(pk=pk)
@@ -198,7 +227,7 @@ def CreateBarberProfile(request):
     
     # Create barber slots upon profile creation
     try:
-        create_slots = CreateSlots(barber)    
+        generate_slots([barber.pk])
     except:
         raise Exception('An error ocuured when creating slot for barber profie')
 
@@ -206,11 +235,11 @@ def CreateBarberProfile(request):
         {'Message' : 'Barber Profile Created.',
          'Time Slots Created' : 'Successfully'}, status=status.HTTP_201_CREATED)
 
-@api_view(['POST'])
+@api_view(['GET', 'POST'])
 @permission_classes([IsAuthenticated])
 def Profile(request):
     """
-    POST /api/profile/
+    GET, POST /api/profile/
     
     - Purpose:
         - A user can see his profile if he is already logged in. 
@@ -220,22 +249,251 @@ def Profile(request):
         - No parameters required
     
     - Returns:
-        200 OK : User profile 
+        200 OK : User profile, with ETag and Last-Modified
+        304 Not Modified : GET with If-None-Match or If-Modified-Since, the profile is unchanged
      
     """
     user = request.user
     profile = CustomUser.objects.get(pk=user.id)
+    etag = make_etag('profile', profile.pk, profile.modified_at)
+    if response := not_modified(request, etag, profile.modified_at):
+        return response
     serializer = serializers.UserSerializer(profile)
-    return Response({'User Profile': serializer.data}, status=status.HTTP_200_OK)
+    return add_validators(
+        Response({'User Profile': serializer.data}, status=status.HTTP_200_OK), etag, profile.modified_at)
 
 
 @api_view(['GET'])
 def ListBarberSlots(request):
+    """
+    GET /api/barber/slots/
+
+    - Purpose:
+        List barber slots ordered by start time, one page at a time.
+
+    - Query Parameters:
+        - barber - optional (int) : only slots of this barber profile id
+        - start - optional (date or datetime) : slots starting at or after this time
+        - end - optional (date or datetime) : slots starting before this time
+        - status - optional (string) : 'free' or 'booked'
+        - page_size - optional (int) : slots per page
+        - cursor - optional (string) : the cursor from the previous page's 'next' link
+        - serializer - optional (string) : 'fast' or 'drf', overrides settings.FAST_SERIALIZER_ENDPOINTS
+
+    - Returns:
+        200 OK : {'next': url of the next page or null, 'results': slots}, with an ETag
+        304 Not Modified : If-None-Match holds the ETag and the page is unchanged
+        400 Bad Request : Invalid filter values
+    """
     if request.method == 'GET':
-        slots = Slots.objects.all()
-        serializer = serializers.SlotSerializer(slots, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        params = request.query_params
+        # barber__user is joined in so serializing a page costs a single query
+        slots = Slots.objects.select_related('barber__user').filter(start_time__isnull=False)
+
+        try:
+            slots, barber_id = filter_slots(slots, params)
+        except ValueError as e:
+            return Response({'Error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        def build_page():
+            paginator = SlotCursorPagination()
+            if use_fast_serializer(request, 'slot_listing'):
+                page = paginator.paginate_queryset(slot_serializer.values(slots, paginator.ordering), request)
+                return paginator.get_paginated_response(slot_serializer.serialize(page)).data
+            page = paginator.paginate_queryset(slots, request)
+            serializer = serializers.SlotSerializer(page, many=True)
+            return paginator.get_paginated_response(serializer.data).data
+
+        # Keyed on the barber's slot version (or the all-slots version), which
+        # every slot or booking change bumps, so a stale page is never served.
+        # The ETag comes from the same key: an unchanged page is a 304 before
+        # the cache or the database is read.
+        version = get_slot_version(barber_id)
+        key = slot_listing_key(version, request)
+        etag = make_etag(key)
+        if response := not_modified(request, etag, private=False):
+            return response
+        data = get_or_build(key, build_page, slot_listing_timeout())
+        return add_validators(Response(data, status=status.HTTP_200_OK), etag, private=False)
     
+@api_view(['GET'])
+def EarliestFreeSlots(request):
+    """
+    GET /api/barber/slots/earliest/
+
+    - Purpose:
+        The next free slots with any barber, or with some barbers, earliest
+        first. Served from the in-process availability index.
+
+    - Query Parameters:
+        - after - optional (date or datetime) : slots starting at or after this time, default now
+        - barbers - optional (string) : comma separated barber profile ids
+        - limit - optional (int) : slots to return, default 10, at most 100
+
+    - Returns:
+        200 OK : {'results': [{'id', 'barber', 'start_time', 'end_time'}]}
+        400 Bad Request : Invalid parameter values
+    """
+    params = request.query_params
+    try:
+        after = parse_datetime_param(params['after']) if params.get('after') else None
+        barber_ids = [int(pk) for pk in params['barbers'].split(',')] if params.get('barbers') else None
+        limit = max(1, min(int(params.get('limit', 10)), 100))
+    except ValueError as e:
+        return Response({'Error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    convert = make_datetime_converter(timezone.get_current_timezone())
+    slots = availability_index.earliest(after, limit, barber_ids)
+    return Response({'results': [
+        {'id': slot_id, 'barber': barber_id, 'start_time': convert(start), 'end_time': convert(end)}
+        for start, slot_id, end, barber_id in slots
+    ]}, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def SearchBookings(request):
+    """
+    GET /api/bookings/search/
+
+    - Purpose:
+        Search bookings ordered by slot start time, one page at a time.
+        Staff search every booking, barbers the bookings of their slots and
+        their own, customers their own.
+
+    - Query Parameters:
+        - barber - optional (int) : only bookings of this barber profile id
+        - customer - optional (int) : only bookings of this user id
+        - state - optional (string) : 'OnGoing', 'Completed' or 'CANCELLED'
+        - start - optional (date or datetime) : slots starting at or after this time
+        - end - optional (date or datetime) : slots starting before this time
+        - min_amount - optional (int) : amount at least this
+        - max_amount - optional (int) : amount at most this
+        - page_size - optional (int) : bookings per page
+        - cursor - optional (string) : the cursor from the previous page's 'next' link
+        - serializer - optional (string) : 'fast' or 'drf', overrides settings.FAST_SERIALIZER_ENDPOINTS
+
+    - Returns:
+        200 OK : {'next': url of the next page or null, 'results': bookings with their id, state and customer}
+        400 Bad Request : Invalid filter values
+    """
+    bookings = Booking.objects.filter(slot__start_time__isnull=False)
+    user = request.user
+    if not user.is_staff:
+        if hasattr(user, 'barber_profile'):
+            bookings = bookings.filter(Q(slot__barber=user.barber_profile) | Q(customer=user))
+        else:
+            bookings = bookings.filter(customer=user)
+
+    try:
+        bookings = filter_bookings(bookings, request.query_params)
+    except ValueError as e:
+        return Response({'Error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    paginator = BookingSearchPagination()
+    if use_fast_serializer(request, 'booking_search'):
+        page = paginator.paginate_queryset(booking_search_serializer.values(bookings, paginator.ordering), request)
+        return paginator.get_paginated_response(booking_search_serializer.serialize(page))
+    page = paginator.paginate_queryset(bookings.select_related('slot__barber__user', 'customer'), request)
+    return paginator.get_paginated_response(serializers.BookingSearchSerializer(page, many=True).data)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def ExportBookings(request):
+    """
+    GET /api/bookings/export/
+
+    - Purpose:
+        Download bookings with their slot, barber and customer as CSV or
+        NDJSON. The file is streamed while it is read from the database, so
+        memory use does not grow with its size.
+
+    - Query Parameters:
+        - export_format - optional (string) : 'csv' (default) or 'ndjson'
+        - email - optional (string) : only bookings of the barber with this email
+        - include_archived - optional (bool) : also export archived bookings
+        - barber, customer, state, start, end, min_amount, max_amount - optional : as in /api/bookings/search/
+
+    - Returns:
+        200 OK : The export, as an attachment
+        400 Bad Request : Invalid parameter values
+        404 Not Found : Barber not found
+    """
+    params = request.query_params
+    export_format = params.get('export_format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        return Response({'Error': f"export_format must be one of {', '.join(EXPORT_FORMATS)}"},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    querysets = [Booking.objects.all()]
+    if wants_archived(request):
+        querysets.append(ArchivedBooking.objects.all())
+
+    if params.get('email'):
+        barber = get_barber_by_email(params['email'])
+        if barber is None:
+            return Response({'Error': 'Barber not found'}, status=status.HTTP_404_NOT_FOUND)
+        querysets = [queryset.filter(slot__barber=barber) for queryset in querysets]
+
+    try:
+        querysets = [filter_bookings(queryset, params) for queryset in querysets]
+    except ValueError as e:
+        return Response({'Error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    response = StreamingHttpResponse(export_stream(querysets, export_format), content_type=EXPORT_FORMATS[export_format])
+    response['Content-Disposition'] = f'attachment; filename="bookings-{timezone.now():%Y%m%d-%H%M%S}.{export_format}"'
+    return response
+
+
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+def ImportRoster(request):
+    """
+    POST /api/import/
+
+    - Purpose:
+        Create barbers or slots in bulk from an uploaded CSV or NDJSON file,
+        read and written in batches. Rows that fail validation are reported
+        and the rest are still imported.
+
+    - Request Parameters (multipart):
+        - kind - required (string) : 'barbers' (email, first_name, last_name, phone_number, is_available)
+          or 'slots' (barber_email, start_time, end_time)
+        - file - required (file) : the rows, CSV with a header line or NDJSON
+        - import_format - optional (string) : 'csv' or 'ndjson', default from the file extension
+
+    - Returns:
+        200 OK : {'Created', 'Skipped' (already existing), 'Failed', 'Errors': [{'row', 'error'}]}
+        400 Bad Request : Missing file, unknown kind or format, or a file that is not UTF-8, with
+            the counts of the rows imported before the part that could not be read
+    """
+    kind = request.data.get('kind')
+    upload = request.FILES.get('file')
+    if kind not in IMPORTERS:
+        return Response({'Error': f"kind must be one of {', '.join(IMPORTERS)}"}, status=status.HTTP_400_BAD_REQUEST)
+    if upload is None:
+        return Response({'Error': 'file not provided'}, status=status.HTTP_400_BAD_REQUEST)
+
+    import_format = request.data.get('import_format') or import_format_of(upload.name)
+    if import_format not in IMPORT_FORMATS:
+        return Response({'Error': f"import_format must be one of {', '.join(IMPORT_FORMATS)}"},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    stream = io.TextIOWrapper(upload, encoding='utf-8-sig', newline='')
+    report = import_rows(stream, kind, import_format)
+    data = {
+        'Created': report['created'],
+        'Skipped': report['skipped'],
+        'Failed': report['failed'],
+        'Errors': report['errors'],
+    }
+    if report['error']:
+        # The rows before the undecodable part are already imported
+        return Response({'Error': report['error'], **data}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(data, status=status.HTTP_200_OK)
+
+
 @api_view(['POST', 'DELETE', 'PUT'])
 @permission_classes([IsAuthenticated])
 def BookCancelDeletedBarberSlot(request, pk=None):
@@ -248,21 +506,29 @@ def BookCancelDeletedBarberSlot(request, pk=None):
         - A user can book barber slot.
         - A user can cance barber slot
         - A user can delte barber slot
+
+    - Returns (booking):
+        201 Created : Booking created
+        404 Not Found : Slot does not exist
+        409 Conflict : Slot is already booked, including by a concurrent request
         
     """
     try:
         customer = request.user
-        booking_slot = get_object_or_404(Slots, pk=pk) if pk else None    
         
         if request.method == 'POST':
-            if Booking.objects.filter(slot=booking_slot).exists():
-                return Response({'Error' : 'Slot is already booked'}, status=status.HTTP_400_BAD_REQUEST)
-            
-            create_booking = Booking.objects.create(slot=booking_slot, customer=customer)
-            create_booking.save()
+            try:
+                book_slot(pk, customer)
+            except SlotAlreadyBooked:
+                return Response({'Error' : 'Slot is already booked'}, status=status.HTTP_409_CONFLICT)
+            except Slots.DoesNotExist:
+                return Response({'Error' : 'Slot not found'}, status=status.HTTP_404_NOT_FOUND)
+
             return Response({'Succeed': 'Booking created'}, status=status.HTTP_201_CREATED)
+
+        booking_slot = get_object_or_404(Slots, pk=pk) if pk else None    
         
-        elif request.method == 'PUT':           
+        if request.method == 'PUT':           
             data = request.data
             booking_to_be_cancelled = get_slot_for_booking(booking_slot)
             
@@ -278,21 +544,61 @@ def BookCancelDeletedBarberSlot(request, pk=None):
                     booking_to_be_cancelled, data=data, fields=('reason',)) 
             
             if serializer.is_valid(raise_exception=True):
-                serializer.save()
+                save_booking_state(serializer, booking_slot)
                 return Response({'Message' : 'Booking Cancelled'}, status=status.HTTP_200_OK)
                         
         elif request.method == 'DELETE':
             booking_to_be_deleted = get_slot_for_booking(booking_slot)
+            if not booking_to_be_deleted:
+                return Response({'Error':'Booking not found on this slot to delete'}, status=status.HTTP_404_NOT_FOUND)
+
             if booking_to_be_deleted.customer != customer:
                 return Response({'Error':'You are not authorized to delete this booking.'}, status=status.HTTP_403_FORBIDDEN)
 
-            booking_to_be_deleted.delete()
+            delete_booking(booking_to_be_deleted, booking_slot)
             return Response({'Message': 'Booking Successfully Deleted'}, status=status.HTTP_204_NO_CONTENT)          
 
     except Exception as e:
         return Response({'Error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         
 
+@swagger_auto_schema(request_body=serializers.BatchBookingSerializer, method='post')
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def BookBarberSlotsBatch(request):
+    """
+    POST /api/barber/slots/book/batch/
+
+    - Purpose:
+        - A user can book several slots at once, e.g. back-to-back services
+          or a group booking at the front desk.
+
+    - Request Parameters:
+        - slots (list of int) : ids of the slots to book, at most 50
+        - mode - optional (string) : 'all_or_nothing' (default) books either every
+          slot or none of them, 'best_effort' books whichever slots are free
+
+    - Returns:
+        201 Created : At least one slot booked, with a result per slot
+        409 Conflict : Nothing booked, with a result per slot
+    """
+    serializer = serializers.BatchBookingSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+
+    try:
+        results = book_slots(
+            serializer.validated_data['slots'], request.user,
+            all_or_nothing=serializer.validated_data['mode'] == 'all_or_nothing')
+    except SlotAlreadyBooked:
+        return Response({'Error' : 'One of the slots is already booked'}, status=status.HTTP_409_CONFLICT)
+
+    booked = sum(1 for result in results.values() if result == BOOKED)
+    return Response({
+        'Booked': booked,
+        'Results': [{'slot': slot_id, 'status': result} for slot_id, result in results.items()]},
+        status=status.HTTP_201_CREATED if booked else status.HTTP_409_CONFLICT)
+
+
 @api_view(['PUT'])
 @permission_classes([IsAuthenticated])
 def Complete_and_Pay_Booking(request, pk):
@@ -316,7 +622,7 @@ def Complete_and_Pay_Booking(request, pk):
             booking.state = BookingStates.COMPLETED.value
             serializer = serializers.BookingSerializer(booking, data=request.data, exclude=('reason',))
             if serializer.is_valid(raise_exception=True):
-                serializer.save()
+                save_booking_state(serializer, slot)
                 return Response({
                     'Message': 'Booking marked as completed.',
                     'Amount Paid': serializer.validated_data['amount'],
@@ -343,47 +649,148 @@ def WriteReviewOfBarberView(request, pk):
     except:
         return Response({'Error' : 'Slot or Barber does not exist'}, status=status.HTTP_404_NOT_FOUND)    
         
-    review = Review.objects.create(barber=barber, customer=customer,slot=slot, review=serializer.validated_data['review'])
-    review.save()
+    write_review(barber, customer, slot, serializer.validated_data['review'])
 
     return Response({'Status' : 'Success', 'Message' : 'Review created.'}, status=status.HTTP_201_CREATED)
     
 
+@api_view(['GET'])
+def ListBarberReviews(request, pk):
+    """
+    GET /api/barbers/<pk>/reviews/
+
+    - Purpose:
+        List the reviews of a barber newest first, one page at a time,
+        optionally only those matching a full-text search.
+
+    - Query Parameters:
+        - q - optional (string) : only reviews containing every word of this
+        - page_size - optional (int) : reviews per page
+        - cursor - optional (string) : the cursor from the previous page's 'next' link
+
+    - Returns:
+        200 OK : {'Review Count': reviews of the barber, 'next': url of the next page or null, 'results': reviews}
+        404 Not Found : Barber does not exist
+    """
+    barber = BarberProfile.objects.only('review_count').filter(pk=pk).first()
+    if barber is None:
+        return Response({'Error': 'Barber does not exist'}, status=status.HTTP_404_NOT_FOUND)
+
+    reviews = search_reviews(Review.objects.filter(barber=barber), request.query_params.get('q', ''))
+    paginator = ReviewCursorPagination()
+    page = paginator.paginate_queryset(reviews, request)
+    return Response({
+        'Review Count': barber.review_count,
+        'next': paginator.get_next_link(),
+        'results': serializers.BarberReviewSerializer(page, many=True).data,
+    }, status=status.HTTP_200_OK)
+
+
+def request_flag(request, name):
+    value = request.data.get(name, request.query_params.get(name))
+    return value in (True, 'true', 'True', '1', 1)
+
+
+def wants_booking_rows(request):
+    """
+    Report endpoints return only totals unless the detailed rows are asked for.
+    """
+    return request_flag(request, 'include_bookings')
+
+
+def wants_archived(request):
+    """
+    Archived bookings only show up in report rows and time window totals when
+    include_archived is sent. Totals read from the daily rollups always count
+    them, as archiving does not touch the rollups.
+    """
+    return request_flag(request, 'include_archived')
+
+
+def booking_totals(request, bookings, archived_bookings):
+    """
+    Count and sum bookings in the database, adding the archived ones when asked to.
+    """
+    querysets = [bookings, archived_bookings] if wants_archived(request) else [bookings]
+    totals = {'bookings': 0, 'amount': 0}
+    for queryset in querysets:
+        result = queryset.aggregate(bookings=Count('id'), amount=Coalesce(Sum('amount'), 0))
+        totals['bookings'] += result['bookings']
+        totals['amount'] += result['amount']
+    return totals
+
+
+def booking_report_response(request, totals, bookings, total_key, rows_key, archived_bookings=None):
+    """
+    Build a report response from precomputed totals, adding one page of the
+    detailed booking rows when the client asks for them. Rows go through the
+    fast serializer when selected for 'booking_reports', and come from the
+    archive too with include_archived.
+    """
+    data = {total_key: totals['bookings'], 'Total Amount': totals['amount']}
+
+    if wants_booking_rows(request):
+        sources = [bookings]
+        if archived_bookings is not None and wants_archived(request):
+            sources.append(archived_bookings)
+
+        paginator = BookingCursorPagination()
+        if use_fast_serializer(request, 'booking_reports'):
+            page = paginator.paginate_querysets(
+                [booking_serializer.values(source, paginator.ordering) for source in sources], request)
+            data[rows_key] = booking_serializer.serialize(page)
+        else:
+            page = paginator.paginate_querysets(
+                [source.select_related('slot__barber__user') for source in sources], request)
+            data[rows_key] = serializers.BookingSerializer(page, many=True).data
+        data['Next'] = paginator.get_next_link()
+
+    return Response(data, status=status.HTTP_200_OK)
+
+
 @api_view(['POST'])
 @permission_classes([IsAdminUser])
 def Check_Cancelled_Barber_Slots(request):
     """
-    An admin can see cancelled slots of a barber
+    An admin can see cancelled slots of a barber.
+    Totals come from the daily rollups; send include_bookings=true to also get
+    the bookings themselves, a page at a time (page_size and cursor query parameters).
     """
     try:
         email = request.data['email']
         if not email:
             return Response({'Error': 'Email is required'}, status=status.HTTP_400_BAD_REQUEST)
 
-        try: 
-            get_barber = get_barber_by_email(email=email)
-        except:
+        get_barber = get_barber_by_email(email=email)
+        if not get_barber:
             return Response({'Error':'Barber not found with the provided email'}, status=status.HTTP_404_NOT_FOUND)
         
         # Get all cancelled bookings of barber 
         all_cancelled_bookings = Booking.objects.filter(
         slot__barber=get_barber, state=BookingStates.CANCELLED.value)      
 
-        serializer = serializers.BookingSerializer(all_cancelled_bookings, many=True)    
-        return Response({
-            'Total Cancelled Bookings' : len(all_cancelled_bookings),
-            'All Cancelled Bookings': serializer.data}, status=status.HTTP_200_OK)
+        archived_bookings = ArchivedBooking.objects.filter(
+            slot__barber=get_barber, state=BookingStates.CANCELLED.value)
+
+        totals = rollup_totals(get_barber, BookingStates.CANCELLED.value)
+        return booking_report_response(
+            request, totals, all_cancelled_bookings, 'Total Cancelled Bookings', 'All Cancelled Bookings',
+            archived_bookings)
 
+    except NotFound:
+        raise
     except Exception as e:
         print(f'Unexpected error {e}')
         return Response({'Error': 'Internal server error'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     
     
-@permission_classes([IsAdminUser])
 @api_view(['POST'])
+@permission_classes([IsAdminUser])
 def Check_Cancelled_Bookings_With_Datetime(request):
     """
-    Check cancelled slots of barber with given datetime range
+    Check cancelled slots of barber with given datetime range.
+    Only the time of day of the range is matched, on any date; /api/bookings/search/
+    filters on a real datetime window. Send include_bookings=true to also get the bookings themselves, a page at a time.
     """
     try:
         email = request.data['email']
@@ -405,9 +812,8 @@ def Check_Cancelled_Bookings_With_Datetime(request):
             return Response({'error': 'Start time must be lower then end time'})
 
         # ensure barber exists
-        try:
-            get_barber = get_barber_by_email(email=email)
-        except:
+        get_barber = get_barber_by_email(email=email)
+        if not get_barber:
             return Response({'Error':'Barber not found with the provided email'}, status=status.HTTP_404_NOT_FOUND)
         
         # Get all cancelled bookings of barber by time range
@@ -416,13 +822,20 @@ def Check_Cancelled_Bookings_With_Datetime(request):
             slot__start_time__time__range=(start_time, end_time),
             state=BookingStates.CANCELLED.value
             )
+        archived_bookings = ArchivedBooking.objects.filter(
+            slot__barber=get_barber,
+            slot__start_time__time__range=(start_time, end_time),
+            state=BookingStates.CANCELLED.value
+            )
 
-        serializer = serializers.BookingSerializer(all_cancelled_bookings, many=True)    
-        return Response({
-            'Total Cancelled Bookings': len(all_cancelled_bookings),
-            'Cancelled Bookings': serializer.data}, status=status.HTTP_200_OK)
-        
+        # A time-of-day window cuts across the daily rollups, so total it in the database
+        totals = booking_totals(request, all_cancelled_bookings, archived_bookings)
+        return booking_report_response(
+            request, totals, all_cancelled_bookings, 'Total Cancelled Bookings', 'Cancelled Bookings',
+            archived_bookings)
         
+    except NotFound:
+        raise
     except Exception as e:
         print(e)
         return Response({'error':'An internal server error occured'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -436,6 +849,8 @@ def Check_Completed_Slots_of_Barber(request):
     For example, if admin wants to see completed bookings within the range of
     from 5:00 AM to 8:PM of some certain day, he can send datetime range in the format
     yyyy-mm-dd hh:mmPM/AM
+    Totals include the amount paid. Send include_bookings=true to also get the
+    bookings themselves, a page at a time.
     """
     try:
         email = request.data.get('email')      
@@ -469,17 +884,57 @@ def Check_Completed_Slots_of_Barber(request):
                     slot__barber=barber, slot__start_time__time__range=(start_time, end_time),
                     state=BookingStates.COMPLETED.value
                 )
+                archived_bookings = ArchivedBooking.objects.filter(
+                    slot__barber=barber, slot__start_time__time__range=(start_time, end_time),
+                    state=BookingStates.COMPLETED.value
+                )
 
-                serializer = serializers.BookingSerializer(completed_bookings, many=True)
-                return Response(
-                    {'Total Completed Bookings': len(completed_bookings),
-                        'Completed Bookings': serializer.data}, status=status.HTTP_200_OK)
+                # A time-of-day window cuts across the daily rollups, so total it in the database
+                totals = booking_totals(request, completed_bookings, archived_bookings)
+                return booking_report_response(
+                    request, totals, completed_bookings, 'Total Completed Bookings', 'Completed Bookings',
+                    archived_bookings)
             
             # Without datetime
             all_completed_bookings = Booking.objects.filter(slot__barber=barber, state=BookingStates.COMPLETED.value                )
-            serializer = serializers.BookingSerializer(all_completed_bookings, many=True)
-                    
-            return Response({'Total Completed Bookings': len(all_completed_bookings),
-                                'Completed Bookings': serializer.data}, status=status.HTTP_200_OK)
+            archived_bookings = ArchivedBooking.objects.filter(slot__barber=barber, state=BookingStates.COMPLETED.value)
+            totals = rollup_totals(barber, BookingStates.COMPLETED.value)
+            return booking_report_response(
+                request, totals, all_completed_bookings, 'Total Completed Bookings', 'Completed Bookings',
+                archived_bookings)
+    except NotFound:
+        raise
     except Exception as e:
         return Response({'error': 'Internal server error'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@require_safe
+def OpenAPISchema(request, format):
+    """
+    GET /swagger.json/, /swagger.yaml/
+
+    - Purpose:
+        The API schema prebuilt by manage.py build_schema, served from memory
+        instead of being generated from the views on every request. The
+        Swagger UI and ReDoc pages load it from here too.
+
+    - Returns:
+        200 OK : The schema, gzip-compressed when the client accepts it, with an ETag
+        304 Not Modified : The client's copy (If-None-Match) is current
+    """
+    variant = prebuilt_schema.get(format)
+    if variant is None:
+        raise Http404
+    # A compressed body is a different representation, so it gets the weak ETag
+    gzipped = bool(ACCEPTS_GZIP.search(request.META.get('HTTP_ACCEPT_ENCODING', '')))
+    etag = f'W/{variant.etag}' if gzipped else variant.etag
+
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(variant.gzipped if gzipped else variant.content, content_type=variant.media_type)
+        if gzipped:
+            response['Content-Encoding'] = 'gzip'
+    response['ETag'] = etag
+    response['Cache-Control'] = f"public, max-age={get_setting('OPENAPI_SCHEMA', 'MAX_AGE')}"
+    patch_vary_headers(response, ['Accept-Encoding'])
+    return response